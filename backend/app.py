@@ -17,7 +17,8 @@ from flask_cors import CORS
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 from services.send_email import send_email
-from services.doc_processing import process_doc_processing
+from services.doc_processing import process_doc_processing, notify_documents_uploaded
+from services.profile_verification import calculate_document_hash, verification_logger, no_expire_on_commit, invalidate_verification_cache
 import uuid
 import json
 from pathlib import Path
@@ -495,6 +496,7 @@ class LiasseDocument(db.Model):
     file_name = db.Column(db.String(255))
     file_path = db.Column(db.String(500))
     file_size = db.Column(db.Integer)
+    file_hash = db.Column(db.String(64))  # Content hash used to recognize re-uploaded documents
     upload_status = db.Column(db.String(50), default='uploaded')
     ocr_status = db.Column(db.String(50), default='pending')
     extracted_data = db.Column(db.JSON)
@@ -746,7 +748,7 @@ def verify_profile():
         if not valid_files:
             return jsonify({'error': 'No valid files provided'}), 400
         
-        print(f"[VERIFICATION] Processing {len(valid_files)} files for verification", flush=True)
+        verification_logger.debug("[VERIFICATION] Processing %s files for verification", len(valid_files))
         
         # Save all files temporarily for analysis
         import tempfile
@@ -775,9 +777,9 @@ def verify_profile():
             
             # Log verification result summary
             if verification_result.get('existing_profile'):
-                print(f"[VERIFICATION] Existing profile found: {verification_result['existing_profile']['id']}", flush=True)
+                verification_logger.debug("[VERIFICATION] Existing profile found: %s", verification_result['existing_profile']['id'])
             else:
-                print(f"[VERIFICATION] No existing profile found", flush=True)
+                verification_logger.debug("[VERIFICATION] No existing profile found")
             
             return jsonify(verification_result)
             
@@ -791,7 +793,7 @@ def verify_profile():
                     pass
         
     except Exception as e:
-        print(f"[VERIFICATION] Error in verify_profile endpoint: {str(e)}", flush=True)
+        log_error(f"[VERIFICATION] Error in verify_profile endpoint: {str(e)}")
         return jsonify({'error': f'Verification failed: {str(e)}'}), 500
 
 @app.route('/api/profiles', methods=['POST'])
@@ -817,8 +819,11 @@ def create_profile():
             }
         )
         
-        db.session.add(profile)
-        db.session.commit()
+        # The profile is read right after the commit (id, background thread args)
+        with no_expire_on_commit(db.session):
+            db.session.add(profile)
+            db.session.commit()
+        invalidate_verification_cache()
         
         # If user opted for email delivery, send a confirmation email now.
         # The actual PDF report will be sent when the profile is completed.
@@ -908,14 +913,14 @@ def upload_documents(profile_id):
             # Only extract company names if we have multiple files or need verification
             # For single file uploads to existing profiles, skip the expensive extraction
             if len(temp_file_paths) > 1 or app.config.get('ENABLE_UPLOAD_VERIFICATION', False):
-                print(f"[UPLOAD] Extracting company info from {len(temp_file_paths)} documents for comparison", flush=True)
+                verification_logger.debug("[UPLOAD] Extracting company info from %s documents for comparison", len(temp_file_paths))
                 for i, file_path in enumerate(temp_file_paths):
                     company_info = extract_company_info_from_first_page(file_path, api_key)
                     if company_info and company_info.get('company_name'):
                         document_company_names.append(company_info['company_name'])
-                        print(f"[UPLOAD] Document {i+1} company: {company_info['company_name']}", flush=True)
+                        verification_logger.debug("[UPLOAD] Document %s company: %s", i+1, company_info['company_name'])
                     else:
-                        print(f"[UPLOAD] Failed to extract company name from document {i+1}", flush=True)
+                        verification_logger.debug("[UPLOAD] Failed to extract company name from document %s", i+1)
                 
                 # Compare company names
                 if document_company_names:
@@ -931,9 +936,9 @@ def upload_documents(profile_id):
                             'document_companies': document_company_names
                         }), 200
                 else:
-                    print(f"[UPLOAD] No company names extracted from documents, proceeding with upload", flush=True)
+                    verification_logger.debug("[UPLOAD] No company names extracted from documents, proceeding with upload")
             else:
-                print(f"[UPLOAD] Skipping company name extraction for single file upload to existing profile", flush=True)
+                verification_logger.debug("[UPLOAD] Skipping company name extraction for single file upload to existing profile")
             
             # If we reach here, company names match or comparison failed - proceed with upload
             uploaded_files = []
@@ -954,7 +959,8 @@ def upload_documents(profile_id):
                     profile_id=profile_id,
                     file_name=filename,
                     file_path=file_path,
-                    file_size=os.path.getsize(file_path)
+                    file_size=os.path.getsize(file_path),
+                    file_hash=calculate_document_hash(file_path)
                 )
                 
                 db.session.add(document)
@@ -965,6 +971,8 @@ def upload_documents(profile_id):
                 })
             
             db.session.commit()
+            invalidate_verification_cache()
+            notify_documents_uploaded(profile_id)
             
             return jsonify({
                 'message': 'Files uploaded successfully',
@@ -978,7 +986,7 @@ def upload_documents(profile_id):
             for temp_path in temp_file_paths:
                 try:
                     os.unlink(temp_path)
-                    print(f"[UPLOAD] Cleaned up temporary file: {temp_path}", flush=True)
+                    verification_logger.debug("[UPLOAD] Cleaned up temporary file: %s", temp_path)
                 except:
                     pass
         
@@ -1031,16 +1039,16 @@ def smart_upload_documents(profile_id):
             # Only extract company info if we have multiple files or if verification is explicitly enabled
             # For single file uploads after verification, we can skip the expensive extraction
             if len(temp_file_paths) > 1 or app.config.get('ENABLE_SMART_UPLOAD_VERIFICATION', False):
-                print(f"[SMART_UPLOAD] Extracting company info from {len(temp_file_paths)} documents for analysis", flush=True)
+                verification_logger.debug("[SMART_UPLOAD] Extracting company info from %s documents for analysis", len(temp_file_paths))
                 for i, file_path in enumerate(temp_file_paths):
                     company_info = extract_company_info_from_first_page(file_path, api_key)
                     if company_info:
                         all_company_info.append(company_info)
-                        print(f"[SMART_UPLOAD] Document {i+1} extracted: {company_info}", flush=True)
+                        verification_logger.debug("[SMART_UPLOAD] Document %s extracted: %s", i+1, company_info)
                     else:
-                        print(f"[SMART_UPLOAD] Failed to extract info from document {i+1}", flush=True)
+                        verification_logger.debug("[SMART_UPLOAD] Failed to extract info from document %s", i+1)
             else:
-                print(f"[SMART_UPLOAD] Skipping company info extraction for single file upload after verification", flush=True)
+                verification_logger.debug("[SMART_UPLOAD] Skipping company info extraction for single file upload after verification")
                 # Create minimal company info for single file uploads
                 for i, file_path in enumerate(temp_file_paths):
                     all_company_info.append({
@@ -1053,7 +1061,7 @@ def smart_upload_documents(profile_id):
                 db, CompanyProfile, temp_file_paths, profile.company_name, all_company_info
             )
             
-            print(f"[SMART_UPLOAD] Document analysis: {document_analysis['total_new']} new, {document_analysis['total_existing']} existing", flush=True)
+            verification_logger.debug("[SMART_UPLOAD] Document analysis: %s new, %s existing", document_analysis['total_new'], document_analysis['total_existing'])
             
             # Check for company name mismatches
             from services.profile_verification import compare_company_names
@@ -1074,14 +1082,14 @@ def smart_upload_documents(profile_id):
                         'document_analysis': document_analysis
                     }), 200
             else:
-                print(f"[SMART_UPLOAD] No company names extracted from documents, proceeding with upload", flush=True)
+                verification_logger.debug("[SMART_UPLOAD] No company names extracted from documents, proceeding with upload")
             
             uploaded_files = []
             processed_count = 0
             
             # Handle existing documents - reuse saved data
             for match in document_analysis['existing_matches']:
-                print(f"[SMART_UPLOAD] Reusing existing document data for: {os.path.basename(match['file_path'])}", flush=True)
+                verification_logger.debug("[SMART_UPLOAD] Reusing existing document data for: %s", os.path.basename(match['file_path']))
                 
                 # Save document record with existing data
                 filename = os.path.basename(match['file_path'])
@@ -1096,6 +1104,7 @@ def smart_upload_documents(profile_id):
                     file_name=filename,
                     file_path=file_path,
                     file_size=os.path.getsize(file_path),
+                    file_hash=calculate_document_hash(file_path),
                     extracted_data=match['existing_data'].get('extracted_data'),
                     upload_status='reused',
                     ocr_status='completed'  # Mark as completed since we're reusing data
@@ -1127,6 +1136,7 @@ def smart_upload_documents(profile_id):
                     file_name=filename,
                     file_path=file_path,
                     file_size=os.path.getsize(file_path),
+                    file_hash=calculate_document_hash(file_path),
                     upload_status='uploaded',
                     ocr_status='pending'  # Will be processed by the document processing pipeline
                 )
@@ -1145,12 +1155,14 @@ def smart_upload_documents(profile_id):
             # print(f"[SMART_UPLOAD] Setting up documents for processing pipeline", flush=True)
             for doc in uploaded_files:
                 if doc['status'] == 'new':
-                    print(f"[SMART_UPLOAD] Document {doc['filename']} marked for processing (upload_status: uploaded, ocr_status: pending)", flush=True)
+                    verification_logger.debug("[SMART_UPLOAD] Document %s marked for processing (upload_status: uploaded, ocr_status: pending)", doc['filename'])
                 elif doc['status'] == 'reused':
-                    print(f"[SMART_UPLOAD] Document {doc['filename']} marked as reused (upload_status: reused, ocr_status: completed)", flush=True)
+                    verification_logger.debug("[SMART_UPLOAD] Document %s marked as reused (upload_status: reused, ocr_status: completed)", doc['filename'])
             
             # print(f"[SMART_UPLOAD] About to commit {len(uploaded_files)} documents to database", flush=True)
             db.session.commit()
+            invalidate_verification_cache()
+            notify_documents_uploaded(profile_id)
             # print(f"[SMART_UPLOAD] Database commit completed successfully", flush=True)
             
             # Double-check that documents are actually in the database
@@ -1162,12 +1174,12 @@ def smart_upload_documents(profile_id):
                 # print(f"[SMART_UPLOAD] Final database check: {final_check} documents found for profile {profile_id}", flush=True)
                 
                 if final_check != len(uploaded_files):
-                    print(f"[SMART_UPLOAD] ⚠️ WARNING: Expected {len(uploaded_files)} documents but found {final_check} in database", flush=True)
+                    log_warning(f"[SMART_UPLOAD] Expected {len(uploaded_files)} documents but found {final_check} in database")
                 else:
-                    print(f"[SMART_UPLOAD] ✅ SUCCESS: All {final_check} documents properly saved to database", flush=True)
+                    verification_logger.debug("[SMART_UPLOAD] All %s documents properly saved to database", final_check)
                     
             except Exception as e:
-                print(f"[SMART_UPLOAD] Error in final database check: {e}", flush=True)
+                log_error(f"[SMART_UPLOAD] Error in final database check: {e}")
             
             # Add a small delay to ensure database commit is fully processed
             import time
@@ -1186,13 +1198,13 @@ def smart_upload_documents(profile_id):
             for temp_path in temp_file_paths:
                 try:
                     os.unlink(temp_path)
-                    print(f"[SMART_UPLOAD] Cleaned up temporary file: {temp_path}", flush=True)
+                    verification_logger.debug("[SMART_UPLOAD] Cleaned up temporary file: %s", temp_path)
                 except:
                     pass
         
     except Exception as e:
         db.session.rollback()
-        print(f"[SMART_UPLOAD] Error in smart upload: {str(e)}", flush=True)
+        log_error(f"[SMART_UPLOAD] Error in smart upload: {str(e)}")
         return jsonify({'error': f'Smart upload failed: {str(e)}'}), 500
 
 @app.route('/api/profiles/<profile_id>', methods=['DELETE'])
@@ -1217,6 +1229,7 @@ def delete_profile(profile_id):
         # Delete the profile (CASCADE will delete associated documents from DB)
         db.session.delete(profile)
         db.session.commit()
+        invalidate_verification_cache()
         
         return jsonify({'message': 'Profile deleted successfully'}), 200
         
@@ -2263,7 +2276,8 @@ def confirm_upload_with_mismatch(profile_id):
                 profile_id=profile_id,
                 file_name=filename,
                 file_path=file_path,
-                file_size=os.path.getsize(file_path)
+                file_size=os.path.getsize(file_path),
+                file_hash=calculate_document_hash(file_path)
             )
             
             db.session.add(document)
@@ -2274,6 +2288,8 @@ def confirm_upload_with_mismatch(profile_id):
             })
         
         db.session.commit()
+        invalidate_verification_cache()
+        notify_documents_uploaded(profile_id)
         
         return jsonify({
             'message': 'Files uploaded successfully after user confirmation',
@@ -2372,6 +2388,7 @@ def confirm_smart_upload_with_mismatch(profile_id):
                     file_name=filename,
                     file_path=file_path,
                     file_size=os.path.getsize(file_path),
+                    file_hash=calculate_document_hash(file_path),
                     extracted_data=match['existing_data'].get('extracted_data'),
                     upload_status='reused',
                     ocr_status='completed'
@@ -2401,6 +2418,7 @@ def confirm_smart_upload_with_mismatch(profile_id):
                     file_name=filename,
                     file_path=file_path,
                     file_size=os.path.getsize(file_path),
+                    file_hash=calculate_document_hash(file_path),
                     upload_status='uploaded',
                     ocr_status='pending'
                 )
@@ -2416,6 +2434,8 @@ def confirm_smart_upload_with_mismatch(profile_id):
                 processed_count += 1
             
             db.session.commit()
+            invalidate_verification_cache()
+            notify_documents_uploaded(profile_id)
             
             return jsonify({
                 'message': 'Smart upload completed successfully after user confirmation',
@@ -2717,6 +2737,9 @@ if __name__ == '__main__':
     
     with app.app_context():
         db.create_all()
+        # create_all does not add columns to existing tables
+        db.session.execute(text("ALTER TABLE liasse_documents ADD COLUMN IF NOT EXISTS file_hash VARCHAR(64)"))
+        db.session.commit()
         print("Database tables created successfully")
     
     print("Starting Flask application...")
@@ -1,10 +1,22 @@
 import os
 from datetime import timedelta, datetime, timezone
+import orjson
+
+def _orjson_dumps(value) -> str:
+    # profile_data metadata (e.g. year_mapping) uses integer keys
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
 
 class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Serialize JSON columns (profile_data, extracted_data) with orjson and let psycopg2
+    # batch executemany statements (bulk document updates) with execute_values
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'json_serializer': _orjson_dumps,
+        'json_deserializer': orjson.loads,
+        'executemany_mode': 'values_plus_batch',
+    }
     
     # JWT
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -20,7 +32,8 @@ class Config:
     # Claude AI
     ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
     MODEL = os.environ.get('MODEL', 'claude-sonnet-4-20250514')
-    PAGES_PER_CHUNK = int(os.environ.get('PAGES_PER_CHUNK', '1'))
+    # Several pages per request: Claude reads multi-page PDFs natively, so fewer, larger chunks
+    PAGES_PER_CHUNK = int(os.environ.get('PAGES_PER_CHUNK', '3'))
     
     # Wait for documents upload
     WAIT_FOR_DOCS_SECONDS = int(os.environ.get('WAIT_FOR_DOCS_SECONDS', '60'))
@@ -1,5 +1,5 @@
 import os
-import json
+import orjson
 import anthropic
 import time
 from typing import Dict, Any, Optional
@@ -31,7 +31,6 @@ def process_expert_comptable_document(company_name: str, file_path: str) -> Dict
         # Process the document directly using the existing functions
         from services.doc_processing import _chunk_pdf_files, _convert_chunk_with_claude, _extract_kpis_from_single_document
         import anthropic
-        import tempfile
         import os
         
         # Initialize Claude client
@@ -42,66 +41,64 @@ def process_expert_comptable_document(company_name: str, file_path: str) -> Dict
         client = anthropic.Anthropic(api_key=anthropic_key)
         model_name = "claude-3-5-sonnet-20241022"
         
-        # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Chunk the PDF
-            chunk_files = _chunk_pdf_files(file_path, temp_dir, pages_per_chunk=1, max_pages=25)
-            
-            if not chunk_files:
-                raise Exception("Failed to process PDF file")
-            
-            # Convert chunks to markdown
-            markdown_parts = []
-            for chunk_file in chunk_files:
-                markdown_text = _convert_chunk_with_claude(client, chunk_file, model_name)
-                if markdown_text:
-                    markdown_parts.append(markdown_text)
-            
-            if not markdown_parts:
-                raise Exception("Failed to convert PDF to markdown")
-            
-            # Combine all markdown parts
-            full_markdown = "\n\n".join(markdown_parts)
-            
-            # Extract KPIs from the markdown
-            kpis_json = _extract_kpis_from_single_document(client, full_markdown, model_name, os.path.basename(file_path))
-            
-            if not kpis_json:
-                raise Exception("Failed to extract KPIs from document")
-            
-            # Parse the JSON response
-            try:
-                extracted_data = json.loads(kpis_json)
-            except json.JSONDecodeError:
-                # Try to extract JSON from the response
-                import re
-                json_match = re.search(r'\{.*\}', kpis_json, re.DOTALL)
-                if json_match:
-                    extracted_data = json.loads(json_match.group())
-                else:
-                    raise Exception("Failed to parse KPIs JSON response")
+        # Chunk the PDF in memory
+        chunks = _chunk_pdf_files(file_path, pages_per_chunk=3, max_pages=25)
+        
+        if not chunks:
+            raise Exception("Failed to process PDF file")
+        
+        # Convert chunks to markdown
+        markdown_parts = []
+        for chunk_bytes in chunks:
+            markdown_text = _convert_chunk_with_claude(client, chunk_bytes, model_name)
+            if markdown_text:
+                markdown_parts.append(markdown_text)
+        
+        if not markdown_parts:
+            raise Exception("Failed to convert PDF to markdown")
+        
+        # Combine all markdown parts
+        full_markdown = "\n\n".join(markdown_parts)
+        
+        # Extract KPIs from the markdown
+        kpis_json = _extract_kpis_from_single_document(client, full_markdown, model_name, os.path.basename(file_path))
+        
+        if not kpis_json:
+            raise Exception("Failed to extract KPIs from document")
+        
+        # Parse the JSON response
+        try:
+            extracted_data = orjson.loads(kpis_json)
+        except orjson.JSONDecodeError:
+            # Try to extract JSON from the response
+            import re
+            json_match = re.search(r'\{.*\}', kpis_json, re.DOTALL)
+            if json_match:
+                extracted_data = orjson.loads(json_match.group())
+            else:
+                raise Exception("Failed to parse KPIs JSON response")
+        
+        # Extract TVA data from the markdown
+        print(f"[EXPERT COMPTABLE TVA DEBUG] Extracting TVA data from document", flush=True)
+        from services.doc_processing import _extract_tva_data_from_single_document, _safe_parse_json
+        
+        try:
+            tva_raw = _extract_tva_data_from_single_document(client, full_markdown, model_name, os.path.basename(file_path))
+            print(f"[EXPERT COMPTABLE TVA DEBUG] Raw TVA response: {tva_raw[:500]}...", flush=True)
             
-            # Extract TVA data from the markdown
-            print(f"[EXPERT COMPTABLE TVA DEBUG] Extracting TVA data from document", flush=True)
-            from services.doc_processing import _extract_tva_data_from_single_document, _safe_parse_json
+            tva_json = _safe_parse_json(tva_raw)
+            print(f"[EXPERT COMPTABLE TVA DEBUG] Parsed TVA JSON: {tva_json}", flush=True)
             
-            try:
-                tva_raw = _extract_tva_data_from_single_document(client, full_markdown, model_name, os.path.basename(file_path))
-                print(f"[EXPERT COMPTABLE TVA DEBUG] Raw TVA response: {tva_raw[:500]}...", flush=True)
-                
-                tva_json = _safe_parse_json(tva_raw)
-                print(f"[EXPERT COMPTABLE TVA DEBUG] Parsed TVA JSON: {tva_json}", flush=True)
+            if tva_json and 'tva_data' in tva_json:
+                # Add TVA data to extracted data
+                extracted_data['tva_data'] = tva_json['tva_data']
+                print(f"[EXPERT COMPTABLE TVA DEBUG] Added TVA data: {tva_json['tva_data']}", flush=True)
+            else:
+                print(f"[EXPERT COMPTABLE TVA DEBUG] No TVA data found in response", flush=True)
                 
-                if tva_json and 'tva_data' in tva_json:
-                    # Add TVA data to extracted data
-                    extracted_data['tva_data'] = tva_json['tva_data']
-                    print(f"[EXPERT COMPTABLE TVA DEBUG] Added TVA data: {tva_json['tva_data']}", flush=True)
-                else:
-                    print(f"[EXPERT COMPTABLE TVA DEBUG] No TVA data found in response", flush=True)
-                    
-            except Exception as tva_error:
-                print(f"[EXPERT COMPTABLE TVA DEBUG] Error extracting TVA: {tva_error}", flush=True)
-                # Continue without TVA data - don't fail the whole process
+        except Exception as tva_error:
+            print(f"[EXPERT COMPTABLE TVA DEBUG] Error extracting TVA: {tva_error}", flush=True)
+            # Continue without TVA data - don't fail the whole process
         
         if not extracted_data:
             raise Exception("Failed to extract data from document")
@@ -1,5 +1,6 @@
 -- Create database schema
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Ensure postgres user exists with correct password
 DO $$
@@ -43,6 +44,7 @@ CREATE TABLE IF NOT EXISTS liasse_documents (
     file_name VARCHAR(255),
     file_path VARCHAR(500),
     file_size INTEGER,
+    file_hash VARCHAR(64),
     upload_status VARCHAR(50) DEFAULT 'uploaded',
     ocr_status VARCHAR(50) DEFAULT 'pending',
     extracted_data JSONB,
@@ -54,6 +56,8 @@ CREATE INDEX IF NOT EXISTS idx_company_profiles_created_by ON company_profiles(c
 CREATE INDEX IF NOT EXISTS idx_company_profiles_status ON company_profiles(status);
 CREATE INDEX IF NOT EXISTS idx_company_profiles_fiscal_years ON company_profiles(fiscal_years);
 CREATE INDEX IF NOT EXISTS idx_company_profiles_name_year ON company_profiles(company_name, fiscal_years);
+-- Trigram index so ILIKE '%name%' lookups in profile verification avoid a sequential scan
+CREATE INDEX IF NOT EXISTS idx_company_profiles_name_trgm ON company_profiles USING gin (company_name gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_liasse_documents_profile_id ON liasse_documents(profile_id);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 
@@ -1,18 +1,115 @@
 import os
 import re
 import json
+import orjson
 import base64
-from tempfile import TemporaryDirectory
-import anthropic
-from typing import Any
-from datetime import datetime, timezone
-import fitz  # PyMuPDF
+import hashlib
+from typing import TYPE_CHECKING, Any, Optional
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 import time
 import sys
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from contextlib import contextmanager
+from sqlalchemy import text
+from sqlalchemy.orm.attributes import flag_modified
 
 # Import the new logging system
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.logger import log_processing, log_success, log_error, log_warning, log_cleanup, log_database, log_info
+from utils.logger import log_processing, log_success, log_error, log_warning, log_cleanup, log_info
+from services.profile_verification import invalidate_verification_cache
+
+if TYPE_CHECKING:
+    import anthropic
+
+# TVA extraction debug output, enabled with TVA_DEBUG=1
+tva_logger = logging.getLogger('tva')
+if os.environ.get('TVA_DEBUG', '').lower() in ('1', 'true', 'yes'):
+    tva_logger.setLevel(logging.DEBUG)
+    if not tva_logger.handlers:
+        tva_logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Financial ratio computation trace, enabled with RATIOS_DEBUG=1
+ratios_logger = logging.getLogger('ratios')
+if os.environ.get('RATIOS_DEBUG', '').lower() in ('1', 'true', 'yes'):
+    ratios_logger.setLevel(logging.DEBUG)
+    if not ratios_logger.handlers:
+        ratios_logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Minimum delay between progress-log commits; entries logged in between are
+# persisted with the next commit
+LOG_COMMIT_INTERVAL_SECONDS = 2.0
+
+# Writes only the processing_log key of profile_data instead of the whole document
+_UPDATE_PROCESSING_LOG_SQL = text(
+    "UPDATE company_profiles "
+    "SET profile_data = jsonb_set(COALESCE(profile_data, CAST('{}' AS jsonb)), '{processing_log}', CAST(:processing_log AS jsonb)) "
+    "WHERE id = :profile_id"
+)
+
+# Upper bound on concurrent Claude calls (chunk conversion and KPI/TVA extraction)
+CLAUDE_MAX_WORKERS = 8
+
+# Context window of the extraction model and the headroom kept for the KPI
+# instructions and the response when sending the combined markdown
+MODEL_CONTEXT_TOKENS = 200000
+PROMPT_RESERVED_TOKENS = 4096
+
+# Separator written between documents in the combined markdown
+MARKDOWN_DOCUMENT_SEPARATOR = '\n\n---\n\n'
+
+# KPIs kept in the combined multi-year structure
+_KPI_NAMES = (
+    'Chiffre d\'affaires', 'Résultat d\'exploitation', 'Résultat Net',
+    'Dotations d\'exploitation', 'Reprises d\'exploitation; transferts de charges',
+    'Redevances de crédit-bail', 'Trésorerie-Actif', 'Titres Valeurs de placement',
+    'Dettes de financement', 'Trésorerie-passif', 'Compte d\'associés (Actif)',
+    'Compte d\'associés (Passif)', 'Redevanes restant à payer (a plus d\'un an)',
+    'Redevanes restant à payer (a moins d\'un an)', 'Prix d\'achat résiduel en fin du contrat',
+    'Capitaux propres'
+)
+# KPIs requested from Claude: the combined ones plus the working-capital aggregates
+_EXTRACTED_KPI_NAMES = _KPI_NAMES[:10] + ('Trésorerie nette',) + _KPI_NAMES[10:] + (
+    'Actif circulant', 'Passif circulant', 'Actif circulant total'
+)
+_KPI_PROMPT_LIST = ''.join(f"- {kpi_name}\n" for kpi_name in _EXTRACTED_KPI_NAMES)
+
+# Per-profile events set by the upload routes so a processing thread waiting
+# for documents wakes up as soon as they are committed
+_documents_uploaded_events = {}
+_documents_uploaded_lock = threading.Lock()
+
+def _get_documents_uploaded_event(profile_id: str) -> threading.Event:
+    with _documents_uploaded_lock:
+        return _documents_uploaded_events.setdefault(profile_id, threading.Event())
+
+def notify_documents_uploaded(profile_id: str) -> None:
+    """Signal that documents for a profile have been committed to the database.
+    Only a processing thread already waiting has an event; the waiter creates and removes it,
+    and checks the database after creating it, so no upload is missed."""
+    with _documents_uploaded_lock:
+        event = _documents_uploaded_events.get(profile_id)
+    if event is not None:
+        event.set()
+
+# Claude clients shared across processing runs so their HTTP connection pool
+# (and the TLS sessions in it) is reused
+_anthropic_clients = {}
+_anthropic_clients_lock = threading.Lock()
+
+def _get_anthropic_client(api_key: str) -> 'anthropic.Anthropic':
+    import anthropic
+    with _anthropic_clients_lock:
+        client = _anthropic_clients.get(api_key)
+        if client is None:
+            # Extra retries absorb 429/529 responses when chunks are converted concurrently;
+            # the SDK backs off exponentially with jitter between attempts
+            client = anthropic.Anthropic(api_key=api_key, max_retries=5)
+            _anthropic_clients[api_key] = client
+        return client
 
 def is_document_already_processed(document, required_fields=None) -> bool:
     """Check if a document has already been processed and has valid extracted data.
@@ -50,7 +147,6 @@ def is_document_already_processed(document, required_fields=None) -> bool:
     # Check if processing timestamp exists and is recent (optional validation)
     if 'processing_timestamp' in document.extracted_data:
         try:
-            from datetime import datetime, timedelta
             timestamp_str = document.extracted_data['processing_timestamp']
             timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
             # Consider data valid if processed within last 30 days
@@ -63,14 +159,16 @@ def is_document_already_processed(document, required_fields=None) -> bool:
     
     return True
 
-def cleanup_profile_files(profile_id: str, upload_folder: str, db, LiasseDocument) -> None:
+def cleanup_profile_files(profile_id: str, upload_folder: str, db, LiasseDocument, documents=None) -> None:
     """Delete all uploaded PDF and markdown files for a profile to save server space.
     
-    The important JSON data is preserved in the database.
+    The important JSON data is preserved in the database. Pass ``documents`` to
+    reuse an already loaded document list instead of querying it again.
     """
     try:
         # Get all documents for this profile
-        documents = LiasseDocument.query.filter_by(profile_id=profile_id).all()
+        if documents is None:
+            documents = LiasseDocument.query.filter_by(profile_id=profile_id).all()
         deleted_files = []
         
         for document in documents:
@@ -82,15 +180,16 @@ def cleanup_profile_files(profile_id: str, upload_folder: str, db, LiasseDocumen
                 except Exception as e:
                     print(f"⚠️ Failed to delete PDF file {document.file_path}: {e}", flush=True)
         
-        # Delete markdown file if it exists
+        # Delete markdown file (and any partial write left by a failed run) if it exists
         markdown_path = os.path.join(upload_folder, f"{profile_id}_final.md")
-        if os.path.exists(markdown_path):
-            try:
-                os.remove(markdown_path)
-                deleted_files.append(markdown_path)
-                log_cleanup(f"Deleted markdown file: {markdown_path}")
-            except Exception as e:
-                print(f"⚠️ Failed to delete markdown file {markdown_path}: {e}", flush=True)
+        for path in (markdown_path, markdown_path + '.tmp'):
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                    deleted_files.append(path)
+                    log_cleanup(f"Deleted markdown file: {path}")
+                except Exception as e:
+                    print(f"⚠️ Failed to delete markdown file {path}: {e}", flush=True)
         
         if deleted_files:
             log_success(f"Cleaned up {len(deleted_files)} files for profile {profile_id} - JSON data preserved in database")
@@ -107,24 +206,49 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
     Markdown via Claude, extracts KPIs, and updates the profile.
     Files are automatically deleted after processing to save server space.
     """
-    
-    def log_progress(message: str, update_db: bool = True):
-        """Log progress messages with timestamp"""
-        log_processing(profile_id, message)
+    last_log_commit = 0.0
+    # Entries appended to processing_log since the last log commit
+    log_pending = False
+    
+    def flush_progress_log():
+        """Persist log entries still held back by the commit throttle, before the profile
+        is refreshed from the database (which would discard them) and at stage boundaries"""
+        if log_pending:
+            log_progress(None, force_commit=True)
+    
+    def log_progress(message: Optional[str], update_db: bool = True, force_commit: bool = False):
+        """Log progress messages with timestamp; a None message only commits pending entries"""
+        nonlocal last_log_commit, log_pending
+        if message is not None:
+            log_processing(profile_id, message)
         
         if update_db:
             try:
-                current_data = profile.profile_data or {}
+                if profile.profile_data is None:
+                    profile.profile_data = {}
+                current_data = profile.profile_data
                 if 'processing_log' not in current_data:
                     current_data['processing_log'] = []
-                current_data['processing_log'].append({
-                    'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-                    'message': message
-                })
-                # Keep only last 20 log entries
-                current_data['processing_log'] = current_data['processing_log'][-20:]
-                profile.profile_data = current_data
-                db.session.commit()
+                # The nested list is mutated in place (not flagged as a profile_data change);
+                # it is persisted below with a targeted jsonb_set
+                processing_log = current_data['processing_log']
+                if message is not None:
+                    processing_log.append({
+                        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+                        'message': message
+                    })
+                    # Keep only last 20 log entries
+                    del processing_log[:-20]
+                    log_pending = True
+                now = time.monotonic()
+                if log_pending and (force_commit or now - last_log_commit >= LOG_COMMIT_INTERVAL_SECONDS):
+                    db.session.execute(_UPDATE_PROCESSING_LOG_SQL, {
+                        'processing_log': orjson.dumps(processing_log).decode('utf-8'),
+                        'profile_id': profile_id
+                    })
+                    db.session.commit()
+                    last_log_commit = now
+                    log_pending = False
             except Exception as e:
                 log_error(f"Failed to update log in DB: {e}")
     
@@ -162,7 +286,9 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
             log_progress("ERROR: Anthropic API key not configured")
             _update_profile_failure(db, profile, 'Anthropic not configured')
             return
-        if not fitz:
+        try:
+            import fitz  # noqa: F401 -- PyMuPDF, imported lazily to keep app startup light
+        except ImportError:
             log_progress("ERROR: PyMuPDF (fitz) not installed")
             _update_profile_failure(db, profile, 'PyMuPDF (fitz) not installed')
             return
@@ -177,15 +303,26 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
             current_data['processing_stage'] = 'waiting_for_documents'
             profile.profile_data = current_data
             db.session.commit()
+            flush_progress_log()
             
             documents = []
-            start_time = datetime.utcnow()
-            while (datetime.utcnow() - start_time).total_seconds() < wait_seconds:
-                documents = LiasseDocument.query.filter_by(profile_id=profile_id).all()
-                if documents:
-                    log_progress(f"Found {len(documents)} documents to process")
-                    break
-                time.sleep(1)
+            uploaded_event = _get_documents_uploaded_event(profile_id)
+            deadline = time.monotonic() + wait_seconds
+            try:
+                while True:
+                    documents = LiasseDocument.query.filter_by(profile_id=profile_id).all()
+                    if documents:
+                        log_progress(f"Found {len(documents)} documents to process")
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # Sleep until an upload route signals new documents (or the wait expires)
+                    uploaded_event.wait(remaining)
+                    uploaded_event.clear()
+            finally:
+                with _documents_uploaded_lock:
+                    _documents_uploaded_events.pop(profile_id, None)
                 
             if not documents:
                 log_progress("ERROR: No documents found to process")
@@ -198,44 +335,73 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
             current_data['total_documents'] = len(documents)
             profile.profile_data = current_data
             db.session.commit()
+            flush_progress_log()
 
             log_progress("Initializing Claude client...")
             try:
-                client = anthropic.Anthropic(api_key=api_key)
+                client = _get_anthropic_client(api_key)
                 log_progress("✅ Claude client initialized successfully")
             except Exception as e:
                 log_progress(f"❌ Claude client failed: {str(e)}")
                 raise e
 
-            combined_markdown_parts = []
+            # Ensure upload directory exists
+            os.makedirs(upload_folder, exist_ok=True)
+
+            # Stream each document's markdown straight to disk (kept for auditing and
+            # for the combined-markdown fallback) instead of holding it all in memory
+            combined_markdown = _CombinedMarkdownWriter(
+                os.path.join(upload_folder, f"{profile_id}_final.md"), log_progress
+            )
+            write_markdown_part = combined_markdown.write_part
 
             # Process documents individually to extract KPIs per document
             document_kpis_list = []
+            # Index of document_kpis_list entries by document name
+            document_kpis_by_name = {}
+            # Markdown converted during this run, persisted with each document so a later
+            # TVA-only re-extraction does not have to convert the PDF again
+            document_markdown = {}
+            # Conversions of already submitted chunks keyed by content hash, so identical
+            # pages (cover sheets, blank forms) are only sent to Claude once per run
+            converted_chunks = {}
+            # (document, force_tva_extraction, chunk_futures, cached_markdown) awaiting assembly
+            pending_documents = []
+            pending_extractions = []
+
+            def add_document_kpis(doc_kpis: dict) -> None:
+                document_kpis_list.append(doc_kpis)
+                document_kpis_by_name[doc_kpis['document_name']] = doc_kpis
             
-            # Use a temporary directory for chunk files
-            with TemporaryDirectory() as temp_dir:
+            # Chunks are kept in memory and handed straight to the worker pool; autoflush is
+            # off so the throttled log writes don't flush each document's pending changes
+            with combined_markdown, \
+                    ThreadPoolExecutor(max_workers=CLAUDE_MAX_WORKERS) as executor, \
+                    _cancel_pending_on_error(executor), \
+                    db.session.no_autoflush:
                 for i, document in enumerate(documents):
                     log_progress(f"Processing document {i+1}/{len(documents)}: {document.file_name}")
                     
-                    # Check if document is already processed
-                    if is_document_already_processed(document):
+                    # Check if document is already processed (evaluated once per document)
+                    already_processed = is_document_already_processed(document)
+                    if already_processed:
                         log_progress(f"✅ Document {document.file_name} already processed, using existing data")
                         
                         # Use existing extracted data
                         existing_data = document.extracted_data
                         existing_data['document_name'] = document.file_name
-                        document_kpis_list.append(existing_data)
+                        add_document_kpis(existing_data)
                         
                         # Still add to combined markdown for potential fallback processing
-                        combined_markdown_parts.append(f"# Document: {document.file_name}\n\n[Already processed - using cached data]")
+                        write_markdown_part(f"# Document: {document.file_name}\n\n[Already processed - using cached data]")
                         
                         # Check if TVA data exists in cached data, if not, force re-extraction
                         if 'tva_data' not in existing_data:
-                            print(f"[TVA DEBUG] Document {document.file_name} cached but missing TVA data, forcing TVA re-extraction", flush=True)
+                            tva_logger.debug("[TVA DEBUG] Document %s cached but missing TVA data, forcing TVA re-extraction", document.file_name)
                             # We'll force TVA extraction for this document even if it's cached
                             force_tva_extraction = True
                         else:
-                            print(f"[TVA DEBUG] Document {document.file_name} has cached TVA data: {existing_data.get('tva_data')}", flush=True)
+                            tva_logger.debug("[TVA DEBUG] Document %s has cached TVA data: %s", document.file_name, existing_data.get('tva_data'))
                             force_tva_extraction = False
                         
                         # Mark as processed
@@ -243,6 +409,7 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
                         db.session.add(document)
                         
                         if not force_tva_extraction:
+                            db.session.commit()
                             continue
                     else:
                         force_tva_extraction = False
@@ -252,123 +419,133 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
                     current_data['processing_stage'] = f'processing_document_{i+1}_of_{len(documents)}'
                     current_data['current_document'] = document.file_name
                     profile.profile_data = current_data
-                    db.session.commit()
                     
-                    # Only do full document processing if not using cached data
-                    if not is_document_already_processed(document) or force_tva_extraction:
-                        if force_tva_extraction:
-                            log_progress(f"🔄 Re-extracting TVA data from cached document {document.file_name}...")
+                    # Full document processing (new documents, or cached ones missing TVA data)
+                    if force_tva_extraction:
+                        log_progress(f"🔄 Re-extracting TVA data from cached document {document.file_name}...")
+                    else:
+                        log_progress(f"🔄 Processing new/updated document {document.file_name}...")
+                    
+                    cached_md = document.extracted_data.get('markdown') if force_tva_extraction else None
+                    if cached_md:
+                        log_progress(f"Using stored markdown for {document.file_name}, skipping PDF conversion")
+                        pending_documents.append((document, force_tva_extraction, None, cached_md))
+                        continue
+                    
+                    chunks = _chunk_pdf_files(document.file_path, pages_per_chunk=pages_per_chunk)
+                    log_progress(f"Document split into {len(chunks)} chunks")
+                    
+                    # Submit all chunks without waiting, so conversions of every document are
+                    # in flight together; futures are kept in page order
+                    chunk_futures = []
+                    reused_chunks = 0
+                    for chunk_bytes in chunks:
+                        chunk_hash = _hash_bytes(chunk_bytes)
+                        future = converted_chunks.get(chunk_hash)
+                        if future is None:
+                            future = executor.submit(_convert_chunk_with_claude, client, chunk_bytes, model_name)
+                            converted_chunks[chunk_hash] = future
                         else:
-                            log_progress(f"🔄 Processing new/updated document {document.file_name}...")
-                        
-                        chunk_paths = _chunk_pdf_files(document.file_path, output_dir=temp_dir, pages_per_chunk=pages_per_chunk)
-                        log_progress(f"Document split into {len(chunk_paths)} chunks")
-                        # print(f"DEBUG: Created {len(chunk_paths)} chunks for {document.file_name}", flush=True)
-                        
-                        md_parts = []
-                        for j, chunk_path in enumerate(chunk_paths):
-                            print(f"DEBUG: Processing chunk {j+1}/{len(chunk_paths)}", flush=True)
-                            log_progress(f"Converting chunk {j+1}/{len(chunk_paths)} with Claude...")
-                            md = _convert_chunk_with_claude(client, chunk_path, model_name)
-                            md_parts.append(md)
-                            
-                        final_md = '\n\n'.join(md_parts)
-                        combined_markdown_parts.append(f"# Document: {document.file_name}\n\n{final_md}")
+                            reused_chunks += 1
+                        chunk_futures.append(future)
+                    log_progress(f"Converting {len(chunks) - reused_chunks} chunks with Claude ({reused_chunks} identical chunks reused)...")
+                    pending_documents.append((document, force_tva_extraction, chunk_futures, None))
+
+                # Assemble each document's markdown as its chunks complete and queue KPI and
+                # TVA extraction; both calls are independent and overlap with the remaining
+                # conversions
+                for document, force_tva_extraction, chunk_futures, cached_md in pending_documents:
+                    if chunk_futures is not None:
+                        final_md = '\n\n'.join(future.result() for future in chunk_futures)
+                        document_markdown[document.file_name] = final_md
                     else:
-                        # Use empty final_md for cached documents that don't need TVA extraction
-                        final_md = ""
+                        final_md = cached_md
+                    write_markdown_part(f"# Document: {document.file_name}\n\n{final_md}")
                     
-                    # Extract KPIs from this individual document (only if not cached or forcing TVA extraction)
-                    if not is_document_already_processed(document) or force_tva_extraction:
-                        if not force_tva_extraction:
-                            log_progress(f"Extracting KPIs from document {document.file_name}...")
-                            try:
-                                document_kpis_raw = _extract_kpis_from_single_document(client, final_md, model_name, document.file_name)
-                                document_kpis_json = _safe_parse_json(document_kpis_raw)
-                                
-                                if document_kpis_json:
-                                    # Add document name to the KPIs for later mapping
-                                    document_kpis_json['document_name'] = document.file_name
-                                    document_kpis_list.append(document_kpis_json)
-                                    log_progress(f"Successfully extracted KPIs from {document.file_name} (fiscal year: {document_kpis_json.get('fiscal_year', 'unknown')})")
-                                else:
-                                    log_progress(f"Failed to parse KPIs from {document.file_name}, storing raw response")
-                                    document_kpis_list.append({'document_name': document.file_name, 'raw_response': document_kpis_raw})
-                                    
-                            except Exception as kpi_error:
-                                log_progress(f"Error extracting KPIs from {document.file_name}: {str(kpi_error)}")
-                                document_kpis_list.append({'document_name': document.file_name, 'error': str(kpi_error)})
-                        
-                        # Extract TVA data from this individual document
-                        log_progress(f"Extracting TVA data from document {document.file_name}...")
-                        try:
-                            document_tva_raw = _extract_tva_data_from_single_document(client, final_md, model_name, document.file_name)
-                            print(f"[TVA DEBUG] Raw TVA response for {document.file_name}: {document_tva_raw[:500]}...", flush=True)
-                            
-                            document_tva_json = _safe_parse_json(document_tva_raw)
-                            print(f"[TVA DEBUG] Parsed TVA JSON for {document.file_name}: {document_tva_json}", flush=True)
-                            
-                            if document_tva_json and 'tva_data' in document_tva_json:
-                                # Add TVA data to the document KPIs (find existing or create new entry)
-                                doc_found = False
-                                for doc_kpis in document_kpis_list:
-                                    if doc_kpis.get('document_name') == document.file_name:
-                                        doc_kpis['tva_data'] = document_tva_json['tva_data']
-                                        print(f"[TVA DEBUG] Added TVA data to existing document KPIs: {document_tva_json['tva_data']}", flush=True)
-                                        doc_found = True
-                                        break
-                                
-                                # If document not found in document_kpis_list (cached case), create entry
-                                if not doc_found:
-                                    new_doc_entry = {
-                                        'document_name': document.file_name,
-                                        'tva_data': document_tva_json['tva_data'],
-                                        'fiscal_year': document_tva_json.get('fiscal_year', 'unknown')
-                                    }
-                                    document_kpis_list.append(new_doc_entry)
-                                    print(f"[TVA DEBUG] Created new document entry with TVA data: {new_doc_entry}", flush=True)
-                                
-                                log_progress(f"Successfully extracted TVA data from {document.file_name}")
-                            else:
-                                log_progress(f"No TVA data found in {document.file_name}")
-                                print(f"[TVA DEBUG] No TVA data structure found. Raw response: {document_tva_raw}", flush=True)
-                                
-                        except Exception as tva_error:
-                            log_progress(f"Error extracting TVA data from {document.file_name}: {str(tva_error)}")
-                            print(f"[TVA DEBUG] Exception during TVA extraction: {tva_error}", flush=True)
+                    kpi_future = None
+                    if not force_tva_extraction:
+                        log_progress(f"Extracting KPIs from document {document.file_name}...")
+                        kpi_future = executor.submit(_extract_kpis_from_single_document, client, final_md, model_name, document.file_name)
+                    
+                    log_progress(f"Extracting TVA data from document {document.file_name}...")
+                    tva_future = executor.submit(_extract_tva_data_from_single_document, client, final_md, model_name, document.file_name)
+                    pending_extractions.append((document.file_name, kpi_future, tva_future))
                     
-                    # Mark as processed
+                    # Mark as processed and persist this document's progress in one commit
                     document.ocr_status = 'done'
                     db.session.add(document)
-                    log_progress(f"Document {document.file_name} processed successfully")
+                    log_progress(f"Document {document.file_name} processed successfully", force_commit=True)
 
-            log_progress("Combining all documents into final markdown...")
-            combined_markdown = '\n\n---\n\n'.join(combined_markdown_parts)
+            output_md_path = combined_markdown.output_path if combined_markdown.saved else None
+
+            # Collect the per-document extraction results
+            for document_name, kpi_future, tva_future in pending_extractions:
+                if kpi_future is not None:
+                    try:
+                        document_kpis_raw = kpi_future.result()
+                        document_kpis_json = _safe_parse_json(document_kpis_raw)
+                        
+                        if document_kpis_json:
+                            # Add document name to the KPIs for later mapping
+                            document_kpis_json['document_name'] = document_name
+                            add_document_kpis(document_kpis_json)
+                            log_progress(f"Successfully extracted KPIs from {document_name} (fiscal year: {document_kpis_json.get('fiscal_year', 'unknown')})")
+                        else:
+                            log_progress(f"Failed to parse KPIs from {document_name}, storing raw response")
+                            add_document_kpis({'document_name': document_name, 'raw_response': document_kpis_raw})
+                            
+                    except Exception as kpi_error:
+                        log_progress(f"Error extracting KPIs from {document_name}: {str(kpi_error)}")
+                        add_document_kpis({'document_name': document_name, 'error': str(kpi_error)})
+                
+                try:
+                    document_tva_raw = tva_future.result()
+                    tva_logger.debug("[TVA DEBUG] Raw TVA response for %s: %.500s...", document_name, document_tva_raw)
+                    
+                    document_tva_json = _safe_parse_json(document_tva_raw)
+                    tva_logger.debug("[TVA DEBUG] Parsed TVA JSON for %s: %s", document_name, document_tva_json)
+                    
+                    if document_tva_json and 'tva_data' in document_tva_json:
+                        # Add TVA data to the document KPIs (find existing or create new entry)
+                        doc_kpis = document_kpis_by_name.get(document_name)
+                        if doc_kpis is not None:
+                            doc_kpis['tva_data'] = document_tva_json['tva_data']
+                            tva_logger.debug("[TVA DEBUG] Added TVA data to existing document KPIs: %s", document_tva_json['tva_data'])
+                        else:
+                            # Document not found in document_kpis_list (cached case), create entry
+                            new_doc_entry = {
+                                'document_name': document_name,
+                                'tva_data': document_tva_json['tva_data'],
+                                'fiscal_year': document_tva_json.get('fiscal_year', 'unknown')
+                            }
+                            add_document_kpis(new_doc_entry)
+                            tva_logger.debug("[TVA DEBUG] Created new document entry with TVA data: %s", new_doc_entry)
+                        
+                        log_progress(f"Successfully extracted TVA data from {document_name}")
+                    else:
+                        log_progress(f"No TVA data found in {document_name}")
+                        tva_logger.debug("[TVA DEBUG] No TVA data structure found. Raw response: %s", document_tva_raw)
+                        
+                except Exception as tva_error:
+                    log_progress(f"Error extracting TVA data from {document_name}: {str(tva_error)}")
+                    tva_logger.debug("[TVA DEBUG] Exception during TVA extraction: %s", tva_error)
 
             # Update processing stage
             current_data = profile.profile_data or {}
             current_data['processing_stage'] = 'saving_markdown'
             profile.profile_data = current_data
             db.session.commit()
+            flush_progress_log()
 
-            # Ensure upload directory exists
-            os.makedirs(upload_folder, exist_ok=True)
-
-            # Optionally save markdown to disk for auditing
-            output_md_path = os.path.join(upload_folder, f"{profile_id}_final.md")
-            try:
-                with open(output_md_path, 'w', encoding='utf-8') as f:
-                    f.write(combined_markdown)
+            if output_md_path:
                 log_progress(f"Markdown saved to {output_md_path}")
-            except Exception as e:
-                log_progress(f"Failed to save markdown: {e}")
-                output_md_path = None
 
             # Update processing stage
             current_data = profile.profile_data or {}
             current_data['processing_stage'] = 'extracting_kpis'
             profile.profile_data = current_data
             db.session.commit()
+            flush_progress_log()
 
             # Use multi-document KPI processing if we have multiple documents, otherwise fallback to combined markdown
             if len(documents) > 1 and document_kpis_list:
@@ -383,11 +560,11 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
                         log_progress("Successfully processed KPIs from primary document (fallback mode)")
                 else:
                     log_progress("Multi-document KPI processing failed, falling back to combined markdown")
-                    kpis_raw = _extract_kpis_from_markdown(client, combined_markdown, model_name)
+                    kpis_raw = _extract_kpis_from_combined_markdown(client, combined_markdown.read(), model_name)
                     kpis_json = _safe_parse_json(kpis_raw)
             else:
                 log_progress("Using single-document processing (combined markdown)...")
-                kpis_raw = _extract_kpis_from_markdown(client, combined_markdown, model_name)
+                kpis_raw = _extract_kpis_from_combined_markdown(client, combined_markdown.read(), model_name)
                 kpis_json = _safe_parse_json(kpis_raw)
                 
                 if kpis_json:
@@ -402,33 +579,31 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
             
             # Compute TVA analysis from document data
             log_progress("Computing TVA analysis from document data...")
-            print(f"[TVA DEBUG] Document KPIs list length: {len(document_kpis_list)}", flush=True)
+            tva_logger.debug("[TVA DEBUG] Document KPIs list length: %d", len(document_kpis_list))
             
             tva_analysis = {}
             if document_kpis_list:
                 for i, doc_kpis in enumerate(document_kpis_list):
-                    print(f"[TVA DEBUG] Document {i}: {doc_kpis.get('document_name', 'unknown')}", flush=True)
-                    print(f"[TVA DEBUG] Document {i} keys: {list(doc_kpis.keys())}", flush=True)
+                    tva_logger.debug("[TVA DEBUG] Document %d: %s (keys: %s)", i, doc_kpis.get('document_name', 'unknown'), doc_kpis.keys())
                     
                     if 'tva_data' in doc_kpis and doc_kpis['tva_data']:
-                        print(f"[TVA DEBUG] Found TVA data in document {i}: {doc_kpis['tva_data']}", flush=True)
+                        tva_logger.debug("[TVA DEBUG] Found TVA data in document %d: %s", i, doc_kpis['tva_data'])
                         
                         doc_tva_analysis = _compute_tva_analysis(doc_kpis['tva_data'])
-                        print(f"[TVA DEBUG] Computed TVA analysis for document {i}: {doc_tva_analysis}", flush=True)
+                        tva_logger.debug("[TVA DEBUG] Computed TVA analysis for document %d: %s", i, doc_tva_analysis)
                         
                         if doc_tva_analysis:
                             # Use the fiscal year as key or document name if multiple documents
                             fiscal_year = doc_kpis.get('fiscal_year', 'unknown')
                             tva_analysis[f"tva_analysis_{fiscal_year}"] = doc_tva_analysis
                             log_progress(f"Computed TVA analysis for fiscal year {fiscal_year}")
-                            print(f"[TVA DEBUG] Added to tva_analysis with key: tva_analysis_{fiscal_year}", flush=True)
+                            tva_logger.debug("[TVA DEBUG] Added to tva_analysis with key: tva_analysis_%s", fiscal_year)
                         else:
-                            print(f"[TVA DEBUG] TVA analysis computation returned empty result for document {i}", flush=True)
+                            tva_logger.debug("[TVA DEBUG] TVA analysis computation returned empty result for document %d", i)
                     else:
-                        print(f"[TVA DEBUG] No TVA data found in document {i}", flush=True)
+                        tva_logger.debug("[TVA DEBUG] No TVA data found in document %d", i)
             
-            print(f"[TVA DEBUG] Final TVA analysis keys: {list(tva_analysis.keys())}", flush=True)
-            print(f"[TVA DEBUG] Final TVA analysis content: {tva_analysis}", flush=True)
+            tva_logger.debug("[TVA DEBUG] Final TVA analysis content: %s", tva_analysis)
             
             if tva_analysis:
                 log_progress(f"Computed TVA analysis for {len(tva_analysis)} documents")
@@ -436,6 +611,7 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
                 log_progress("No TVA data found for analysis")
             
             # Update profile - refresh from DB to avoid stale data
+            flush_progress_log()
             db.session.refresh(profile)
             current_data = profile.profile_data or {}
             
@@ -451,42 +627,41 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
             current_data['tva_analysis'] = tva_analysis
             current_data['company_name'] = profile.company_name
             
-            print(f"[TVA DEBUG] Saving to profile_data - TVA analysis keys: {list(tva_analysis.keys()) if tva_analysis else 'None'}", flush=True)
-            print(f"[TVA DEBUG] TVA analysis being saved: {tva_analysis}", flush=True)
+            tva_logger.debug("[TVA DEBUG] TVA analysis being saved: %s", tva_analysis)
             current_data['processing_stage'] = 'completed'
             if output_md_path:
                 current_data['markdown_path'] = output_md_path
             
             # Store individual document KPIs for reference (useful for debugging and frontend display)
             if document_kpis_list:
-                current_data['individual_document_kpis'] = document_kpis_list
+                # Stored markdown stays on the liasse documents only
+                current_data['individual_document_kpis'] = [
+                    {k: v for k, v in doc_kpis.items() if k != 'markdown'} for doc_kpis in document_kpis_list
+                ]
                 log_progress(f"Stored individual KPIs from {len(document_kpis_list)} documents")
             
             # Update the profile's fiscal_years field to include all processed years
             try:
-                fiscal_years = []
+                fiscal_years = set()
                 
                 # Get fiscal years from extracted KPIs metadata
                 if kpis_json and '_metadata' in kpis_json:
-                    metadata_years = kpis_json['_metadata'].get('fiscal_years', [])
-                    fiscal_years.extend(metadata_years)
+                    fiscal_years.update(kpis_json['_metadata'].get('fiscal_years', []))
                 
                 # Also get from individual document KPIs as backup
-                if document_kpis_list:
-                    for doc_kpis in document_kpis_list:
-                        if isinstance(doc_kpis, dict) and 'fiscal_year' in doc_kpis:
-                            year = doc_kpis['fiscal_year']
-                            if year and year not in fiscal_years:
-                                fiscal_years.append(year)
+                fiscal_years.update(
+                    doc_kpis['fiscal_year'] for doc_kpis in document_kpis_list
+                    if isinstance(doc_kpis, dict) and doc_kpis.get('fiscal_year')
+                )
                 
                 if fiscal_years:
                     # Sort years and create a range string
-                    fiscal_years = sorted(list(set(fiscal_years)))  # Remove duplicates and sort
+                    fiscal_years = sorted(fiscal_years)
                     if len(fiscal_years) == 1:
                         profile.fiscal_years = str(fiscal_years[0])
                     else:
                         # Create a range like "2022-2023" for multiple years
-                        profile.fiscal_years = f"{min(fiscal_years)}-{max(fiscal_years)}"
+                        profile.fiscal_years = f"{fiscal_years[0]}-{fiscal_years[-1]}"
                     
                     log_progress(f"Updated profile fiscal_years to: {profile.fiscal_years}")
                 
@@ -543,36 +718,42 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
                 # Save individual document KPIs and metadata to each liasse document
                 log_progress("Saving individual document KPIs and metadata to liasse documents...")
                 if document_kpis_list:
-                    documents = LiasseDocument.query.filter_by(profile_id=profile_id).all()
-                    
-                    # Create a mapping of document names to their KPIs
-                    doc_name_to_kpis = {}
-                    for doc_kpis in document_kpis_list:
-                        if isinstance(doc_kpis, dict) and 'document_name' in doc_kpis:
-                            doc_name_to_kpis[doc_kpis['document_name']] = doc_kpis
-                    
-                    # Save individual metadata to each document
+                    # Reuse the documents loaded at the start of the run (same identity map)
+                    # and the name -> KPIs index built while collecting results
+                    # Save individual metadata to each document in a single bulk UPDATE
+                    document_updates = []
+                    documents_without_kpis = []
+                    # One timestamp for the whole save, shared by every document's metadata
+                    processing_timestamp = datetime.utcnow().isoformat()
                     for document in documents:
-                        if document.file_name in doc_name_to_kpis:
-                            individual_data = doc_name_to_kpis[document.file_name]
-                            
+                        individual_data = document_kpis_by_name.get(document.file_name)
+                        if individual_data is not None:
                             # Create individual document metadata
                             individual_metadata = {
                                 'fiscal_year': individual_data.get('fiscal_year'),
                                 'document_name': document.file_name,
                                 'kpis': individual_data.get('kpis', {}),
-                                'processing_timestamp': datetime.utcnow().isoformat(),
+                                'processing_timestamp': processing_timestamp,
                                 'extracted_from_multi_doc_processing': len(documents) > 1
                             }
+                            if individual_data.get('tva_data'):
+                                individual_metadata['tva_data'] = individual_data['tva_data']
+                            markdown = document_markdown.get(document.file_name) or individual_data.get('markdown')
+                            if markdown:
+                                individual_metadata['markdown'] = markdown
                             
-                            document.extracted_data = individual_metadata
-                            db.session.add(document)
-                            log_progress(f"Saved individual metadata for {document.file_name} (fiscal year: {individual_data.get('fiscal_year')})")
+                            document_updates.append({'id': document.id, 'extracted_data': individual_metadata})
                         else:
-                            log_progress(f"⚠️ No individual KPIs found for {document.file_name}")
+                            documents_without_kpis.append(document.file_name)
                     
+                    if document_updates:
+                        db.session.bulk_update_mappings(LiasseDocument, document_updates)
                     db.session.commit()
-                    log_progress(f"✅ Individual KPIs and metadata saved to {len(documents)} liasse documents")
+                    invalidate_verification_cache()
+                    # One summary line instead of a progress entry per document
+                    if documents_without_kpis:
+                        log_progress(f"⚠️ No individual KPIs found for: {', '.join(documents_without_kpis)}")
+                    log_progress(f"✅ Individual KPIs and metadata saved to {len(document_updates)} liasse documents")
                 else:
                     log_progress("⚠️ No individual document KPIs to save to liasse documents")
                     
@@ -581,17 +762,15 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
                 db.session.rollback()
                 raise save_error
             
-            # Verify the data was saved by re-querying
-            verification_profile = CompanyProfile.query.get(profile_id)
-            verification_data = verification_profile.profile_data or {}
-            if not verification_data.get('extracted_kpis') or not verification_data.get('computed_ratios'):
+            # Verify what was committed; a failed commit would already have raised above
+            if not current_data.get('extracted_kpis') or not current_data.get('computed_ratios'):
                 log_progress("⚠️ Warning: Some data may not have been saved properly")
             
             log_progress("✅ Processing completed successfully!")
             
             # Clean up uploaded files after successful processing to save server space
             log_progress("Cleaning up uploaded files (JSON data preserved in database)...")
-            cleanup_profile_files(profile_id, upload_folder, db, LiasseDocument)
+            cleanup_profile_files(profile_id, upload_folder, db, LiasseDocument, documents)
             
         except Exception as e:
             log_progress(f"❌ ERROR: {str(e)}")
@@ -599,21 +778,25 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
         finally:
             try:
                 # Mark run finish time regardless of outcome - refresh profile first to get latest data
+                flush_progress_log()
                 db.session.refresh(profile)
-                current_data = profile.profile_data or {}
+                if profile.profile_data is None:
+                    profile.profile_data = {}
+                # Update the loaded dict in place and flag it, rather than re-assigning the column
+                current_data = profile.profile_data
                 current_data['last_run_finished_at'] = datetime.utcnow().isoformat()
-                if 'processing_stage' not in current_data or current_data['processing_stage'] != 'completed':
+                if current_data.get('processing_stage') != 'completed':
                     current_data['processing_stage'] = 'failed'
-                profile.profile_data = current_data
+                flag_modified(profile, 'profile_data')
                 db.session.commit()
-                log_progress("Processing thread finished")
+                # Verification reads profiles and documents this run just rewrote
+                invalidate_verification_cache()
+                log_progress("Processing thread finished", force_commit=True)
                 
-                # Final verification - only log if there's an issue
-                final_profile = CompanyProfile.query.get(profile_id)
-                final_data = final_profile.profile_data or {}
-                if not final_data:
+                # Final verification on the data just committed - only log if there's an issue
+                if not current_data:
                     log_progress("⚠️ Final check - profile_data is empty!")
-                elif not final_data.get('extracted_kpis') or not final_data.get('computed_ratios'):
+                elif not current_data.get('extracted_kpis') or not current_data.get('computed_ratios'):
                     log_progress("⚠️ Final check - Some data missing from DB")
             except Exception as e:
                 print(f"[PROCESSING {profile_id}] Failed to update finish time: {e}", flush=True)
@@ -621,54 +804,162 @@ def process_doc_processing(flask_app, db, CompanyProfile, LiasseDocument, profil
 
 def _update_profile_failure(db, profile: Any, reason: str) -> None:
     profile.status = 'failed'
-    current_data = profile.profile_data or {}
+    if profile.profile_data is None:
+        profile.profile_data = {}
+    current_data = profile.profile_data
     current_data['error'] = reason
     current_data['last_error_at'] = datetime.utcnow().isoformat()
-    profile.profile_data = current_data
+    flag_modified(profile, 'profile_data')
     db.session.commit()
+    invalidate_verification_cache()
+
+def _hash_bytes(data: bytes) -> str:
+    """Return the SHA-256 hex digest of an in-memory buffer."""
+    return hashlib.sha256(data).hexdigest()
+
+def _read_markdown_file(markdown_path: str) -> str:
+    """Load the combined markdown written during document processing."""
+    with open(markdown_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+class _CombinedMarkdownWriter:
+    """Streams each document's markdown to <path>.tmp, renamed to <path> once the run
+    completes so readers never see a partial file. The .tmp file is removed when the
+    run fails. A write failure is logged and the remaining parts are kept in memory
+    instead, so the combined-markdown KPI fallback still works."""
+    
+    def __init__(self, output_path: str, log_progress):
+        self.output_path = output_path
+        self._tmp_path = output_path + '.tmp'
+        self._log_progress = log_progress
+        self._file = None
+        self._parts = []
+        self._parts_written = 0
+        self.saved = False
+    
+    def __enter__(self):
+        try:
+            self._file = open(self._tmp_path, 'w', encoding='utf-8', buffering=1 << 20)
+        except OSError as e:
+            self._log_progress(f"Failed to save markdown: {e}")
+        return self
+    
+    def write_part(self, part: str) -> None:
+        if self._file is not None:
+            try:
+                if self._parts_written:
+                    self._file.write(MARKDOWN_DOCUMENT_SEPARATOR)
+                self._file.write(part)
+                self._parts_written += 1
+                return
+            except OSError as e:
+                self._log_progress(f"Failed to save markdown: {e}")
+                self._discard_file()
+        self._parts.append(part)
+    
+    def _discard_file(self, keep_parts: bool = True) -> None:
+        # Parts already written to the file are read back so nothing is lost
+        try:
+            self._file.close()
+            if keep_parts and self._parts_written:
+                self._parts.insert(0, _read_markdown_file(self._tmp_path))
+        except Exception:
+            pass
+        self._file = None
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self._file is None:
+            return False
+        if exc_type is not None:
+            self._discard_file(keep_parts=False)
+            return False
+        try:
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.output_path)
+            self.saved = True
+        except OSError as e:
+            self._log_progress(f"Failed to save markdown: {e}")
+            self._discard_file()
+        return False
+    
+    def read(self) -> str:
+        """The combined markdown of every document written"""
+        if self.saved:
+            return _read_markdown_file(self.output_path)
+        return MARKDOWN_DOCUMENT_SEPARATOR.join(self._parts)
+
+@contextmanager
+def _cancel_pending_on_error(executor: ThreadPoolExecutor):
+    """On an exception, cancel the queued work instead of running it before the executor exits."""
+    try:
+        yield executor
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
 
-def _chunk_pdf_files(pdf_path: str, output_dir: str, pages_per_chunk: int = 1, max_pages: int = 25) -> list:
-    """Split a PDF into temporary chunk files stored in output_dir.
+def _chunk_pdf_files(pdf_path: str, pages_per_chunk: int = 3, max_pages: int = 25) -> list:
+    """Split a PDF into in-memory chunks and return them as a list of PDF bytes.
     Only processes the first max_pages pages of the PDF."""
+    import fitz  # PyMuPDF
     doc = fitz.open(pdf_path)
-    total_pages = len(doc)
-    pages_to_process = min(total_pages, max_pages)
-    
-    print(f"PDF has {total_pages} pages, processing first {pages_to_process} pages", flush=True)
-    
-    chunk_files = []
-    for start in range(0, pages_to_process, pages_per_chunk):
-        pdf_writer = fitz.open()
-        end = min(start + pages_per_chunk - 1, pages_to_process - 1)
-        pdf_writer.insert_pdf(doc, from_page=start, to_page=end)
-        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        chunk_path = os.path.join(output_dir, f"{base_name}_chunk_{start // pages_per_chunk + 1}.pdf")
-        pdf_writer.save(chunk_path)
-        chunk_files.append(chunk_path)
-        print(f"DEBUG: Created chunk {len(chunk_files)}: {chunk_path} (pages {start}-{end})", flush=True)
-    
-    doc.close()
-    return chunk_files
-
-def _convert_chunk_with_claude(client: 'anthropic.Anthropic', chunk_path: str, model_name: str) -> str:
-    """Send a PDF chunk to Claude and return exhaustive Markdown."""
     try:
-        with open(chunk_path, 'rb') as f:
-            pdf_base64 = base64.b64encode(f.read()).decode('utf-8')
-
-        prompt = (
-            "Tu es un analyste financier expert en liasses fiscales marocaines. "
-            "Analyse le PDF fourni et convertis 100 % du contenu en Markdown exhaustif.\n\n"
-            "Règles :\n"
-            "1. Aucun texte ou tableau ne doit être omis.\n"
-            "2. Tous les tableaux doivent être complets.\n"
-            "3. Ne pas résumer.\n"
-            "4. Conserver la structure originale.\n"
-            "5. Retourner uniquement le Markdown.\n"
-            "6. Inclure l'intégralité du contenu de ce chunk PDF."
-        )
+        total_pages = len(doc)
+        pages_to_process = min(total_pages, max_pages)
+        
+        print(f"PDF has {total_pages} pages, processing first {pages_to_process} pages", flush=True)
+        
+        chunks = []
+        for start in range(0, pages_to_process, pages_per_chunk):
+            pdf_writer = fitz.open()
+            try:
+                end = min(start + pages_per_chunk - 1, pages_to_process - 1)
+                pdf_writer.insert_pdf(doc, from_page=start, to_page=end)
+                # Copied streams are already compressed; skip mupdf's cleanup and
+                # recompression passes, which dominate the cost for small chunks
+                chunks.append(pdf_writer.tobytes(garbage=0, deflate=False, clean=False, no_new_id=True))
+            finally:
+                pdf_writer.close()
+            print(f"DEBUG: Created chunk {len(chunks)} (pages {start}-{end})", flush=True)
+    finally:
+        doc.close()
+    return chunks
+
+_CHUNK_TO_MARKDOWN_PROMPT = (
+    "Tu es un analyste financier expert en liasses fiscales marocaines. "
+    "Analyse le PDF fourni et convertis 100 % du contenu en Markdown exhaustif.\n\n"
+    "Règles :\n"
+    "1. Aucun texte ou tableau ne doit être omis.\n"
+    "2. Tous les tableaux doivent être complets.\n"
+    "3. Ne pas résumer.\n"
+    "4. Conserver la structure originale.\n"
+    "5. Retourner uniquement le Markdown.\n"
+    "6. Inclure l'intégralité du contenu de ce chunk PDF."
+)
+
+def _split_pdf_pages(chunk_bytes: bytes) -> list:
+    """Split an in-memory PDF into single-page PDFs, in page order."""
+    import fitz  # PyMuPDF
+    with fitz.open(stream=chunk_bytes, filetype='pdf') as doc:
+        pages = []
+        for page_number in range(len(doc)):
+            with fitz.open() as page_writer:
+                page_writer.insert_pdf(doc, from_page=page_number, to_page=page_number)
+                pages.append(page_writer.tobytes(garbage=0, deflate=False, clean=False, no_new_id=True))
+        return pages
+
+def _convert_chunk_with_claude(client: 'anthropic.Anthropic', chunk_bytes: bytes, model_name: str) -> str:
+    """Send a PDF chunk to Claude and return exhaustive Markdown.
+    A multi-page chunk whose output hits max_tokens is converted again one page at a time."""
+    import anthropic
+    try:
+        pdf_base64 = base64.b64encode(chunk_bytes).decode('ascii')
 
-        message = client.messages.create(
+        with client.messages.stream(
             model=model_name,
             max_tokens=8192,
             messages=[
@@ -683,12 +974,23 @@ def _convert_chunk_with_claude(client: 'anthropic.Anthropic', chunk_path: str, m
                                 'data': pdf_base64,
                             },
                         },
-                        {'type': 'text', 'text': prompt},
+                        {'type': 'text', 'text': _CHUNK_TO_MARKDOWN_PROMPT},
                     ],
                 }
             ],
-        )
-        return (message.content[0].text or '').strip()
+        ) as stream:
+            # Stream the response so long outputs don't sit on one blocking request
+            response_text = ''.join(stream.text_stream)
+            truncated = stream.get_final_message().stop_reason == 'max_tokens'
+        
+        if truncated:
+            pages = _split_pdf_pages(chunk_bytes)
+            if len(pages) > 1:
+                # The last pages of the chunk would be lost: convert each page on its own
+                log_warning(f"Markdown conversion hit max_tokens on a {len(pages)}-page chunk, converting it page by page")
+                return '\n\n'.join(_convert_chunk_with_claude(client, page_bytes, model_name) for page_bytes in pages)
+            log_warning("Markdown conversion hit max_tokens on a single page, its output is truncated")
+        return response_text.strip()
         
     except anthropic.APIError as e:
         # Handle specific Anthropic API errors
@@ -704,57 +1006,44 @@ def _convert_chunk_with_claude(client: 'anthropic.Anthropic', chunk_path: str, m
     except Exception as e:
         raise Exception(f"Error converting PDF chunk to markdown: {str(e)}")
 
+def _build_user_message(prompt: str, markdown_text: str) -> list:
+    """Build the single user turn sent with the extraction prompts."""
+    return [
+        {
+            'role': 'user',
+            'content': [
+                {'type': 'text', 'text': prompt + "\n\n" + markdown_text},
+            ],
+        }
+    ]
+
+_KPI_PROMPT = (
+    "Tu es un analyste financier expert en fiscalité marocaine. "
+    "À partir du Markdown fourni, identifie et retourne les valeurs suivantes pour l'année N et N-1 :\n\n"
+    f"{_KPI_PROMPT_LIST}\n"
+    "Retourne un JSON avec cette structure:\n"
+    "{\n"
+    "  \"Chiffre d'affaires\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
+    "  \"Résultat Net\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
+    "  \"Actif circulant\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
+    "  \"Passif circulant\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
+    "  \"Actif circulant total\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1}\n"
+    "  ...\n"
+    "}\n\n"
+    "Si une valeur n'est pas trouvée, utilise null."
+)
+
 def _extract_kpis_from_markdown(client: 'anthropic.Anthropic', markdown_text: str, model_name: str) -> str:
     """Ask Claude to extract KPIs from Markdown and return raw text (ideally JSON)."""
+    import anthropic
     try:
-        kpi_prompt = (
-            "Tu es un analyste financier expert en fiscalité marocaine. "
-            "À partir du Markdown fourni, identifie et retourne les valeurs suivantes pour l'année N et N-1 :\n\n"
-            "- Chiffre d'affaires\n"
-            "- Résultat d'exploitation\n"
-            "- Résultat Net\n"
-            "- Dotations d'exploitation\n"
-            "- Reprises d'exploitation; transferts de charges\n"
-            "- Redevances de crédit-bail\n"
-            "- Trésorerie-Actif\n"
-            "- Titres Valeurs de placement\n"
-            "- Dettes de financement\n"
-            "- Trésorerie-passif\n"
-            "- Trésorerie nette\n"
-            "- Compte d'associés (Actif)\n"
-            "- Compte d'associés (Passif)\n"
-            "- Redevanes restant à payer (a plus d'un an)\n"
-            "- Redevanes restant à payer (a moins d'un an)\n"
-            "- Prix d'achat résiduel en fin du contrat\n"
-            "- Capitaux propres\n"
-            "- Actif circulant\n"
-            "- Passif circulant\n"
-            "- Actif circulant total\n\n"
-            "Retourne un JSON avec cette structure:\n"
-            "{\n"
-            "  \"Chiffre d'affaires\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "  \"Résultat Net\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "  \"Actif circulant\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "  \"Passif circulant\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "  \"Actif circulant total\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1}\n"
-            "  ...\n"
-            "}\n\n"
-            "Si une valeur n'est pas trouvée, utilise null."
-        )
-
-        message = client.messages.create(
+        with client.messages.stream(
             model=model_name,
             max_tokens=2048,
-            messages=[
-                {
-                    'role': 'user',
-                    'content': [
-                        {'type': 'text', 'text': kpi_prompt + "\n\n" + markdown_text},
-                    ],
-                }
-            ],
-        )
-        return (message.content[0].text or '').strip()
+            messages=_build_user_message(_KPI_PROMPT, markdown_text),
+        ) as stream:
+            response_text = ''.join(stream.text_stream)
+        return response_text.strip()
         
     except anthropic.APIError as e:
         # Handle specific Anthropic API errors
@@ -770,45 +1059,103 @@ def _extract_kpis_from_markdown(client: 'anthropic.Anthropic', markdown_text: st
     except Exception as e:
         raise Exception(f"Error extracting KPIs from markdown: {str(e)}")
 
+def _count_tokens(client: 'anthropic.Anthropic', text: str, model_name: str) -> int:
+    """Count the input tokens of a text prompt, estimating when the API call fails."""
+    try:
+        result = client.messages.count_tokens(
+            model=model_name,
+            messages=[{'role': 'user', 'content': text}],
+        )
+        return result.input_tokens
+    except Exception:
+        # Conservative estimate for French financial markdown
+        return len(text) // 3
+
+def _extract_kpis_from_combined_markdown(client: 'anthropic.Anthropic', markdown_text: str, model_name: str) -> str:
+    """Extract KPIs from the combined markdown, splitting it by document when it exceeds the model context.
+
+    Each group of documents is sent separately and the resulting JSON objects are
+    merged, keeping the first non-null value found for every KPI and year.
+    """
+    token_budget = MODEL_CONTEXT_TOKENS - PROMPT_RESERVED_TOKENS
+    total_tokens = _count_tokens(client, markdown_text, model_name)
+    if total_tokens <= token_budget:
+        return _extract_kpis_from_markdown(client, markdown_text, model_name)
+
+    # Group document sections so that each request fits the budget; per-part token
+    # counts are estimated proportionally to their length
+    tokens_per_char = total_tokens / max(len(markdown_text), 1)
+    max_part_chars = int(token_budget / tokens_per_char)
+    groups = []
+    current_group = []
+    current_tokens = 0
+    for part in markdown_text.split(MARKDOWN_DOCUMENT_SEPARATOR):
+        part = part[:max_part_chars]
+        part_tokens = int(len(part) * tokens_per_char) + 1
+        if current_group and current_tokens + part_tokens > token_budget:
+            groups.append(current_group)
+            current_group = []
+            current_tokens = 0
+        current_group.append(part)
+        current_tokens += part_tokens
+    if current_group:
+        groups.append(current_group)
+
+    print(f"[KPI FALLBACK] Combined markdown is ~{total_tokens} tokens, splitting into {len(groups)} requests", flush=True)
+
+    merged_kpis = {}
+    for group in groups:
+        group_kpis = _safe_parse_json(_extract_kpis_from_markdown(client, MARKDOWN_DOCUMENT_SEPARATOR.join(group), model_name))
+        if not isinstance(group_kpis, dict):
+            continue
+        for kpi_name, kpi_values in group_kpis.items():
+            existing = merged_kpis.get(kpi_name)
+            if isinstance(kpi_values, dict) and (existing is None or isinstance(existing, dict)):
+                target = merged_kpis.setdefault(kpi_name, {})
+                for year, value in kpi_values.items():
+                    if target.get(year) is None:
+                        target[year] = value
+            elif existing is None:
+                merged_kpis[kpi_name] = kpi_values
+
+    return orjson.dumps(merged_kpis).decode('utf-8')
+
+_TVA_PROMPT_TEMPLATE = (
+    "Tu es un analyste financier expert en fiscalité marocaine. "
+    "Analyse ce document fiscal ({document_name}) et extraire spécifiquement les données suivantes du tableau B14 'Détail de La Taxe sur La Valeur Ajoutée':\n\n"
+    "1. T.V.A. Facturée (intersection ligne 'T.V.A. Facturée' avec colonne 'Opérations comptables de l'exercice')\n"
+    "2. TVA pratique: T.V.A. de l'exercice (intersection ligne 'T.V.A. Facturée' avec colonne 'Déclarations T.V.A de l'exercice')\n"
+    "3. Clients et comptes rattachés de l'exercice précédent\n" 
+    "4. Clients et comptes rattachés brute de l'exercice\n"
+    "5. Chiffre d'affaires (CA) pour le calcul de l'encaissement théorique\n\n"
+    "Retourne un JSON avec cette structure:\n"
+    "{{\n"
+    "  \"fiscal_year\": 2023,\n"
+    "  \"tva_data\": {{\n"
+    "    \"tva_facturee\": valeur_tva_facturee,\n"
+    "    \"tva_pratique\": valeur_tva_pratique,\n"
+    "    \"clients_exercice_precedent\": valeur_clients_n_moins_1,\n"
+    "    \"clients_exercice_brut\": valeur_clients_n,\n"
+    "    \"chiffre_affaires\": valeur_ca\n"
+    "  }}\n"
+    "}}\n\n"
+    "Si une valeur n'est pas trouvée, utilise null.\n"
+    "Recherche particulièrement dans le tableau B14 'Détail de La Taxe sur La Valeur Ajoutée'."
+)
+
 def _extract_tva_data_from_single_document(client: 'anthropic.Anthropic', markdown_text: str, model_name: str, document_name: str) -> str:
     """Extract TVA-specific data from a single document's markdown."""
+    import anthropic
     try:
-        tva_prompt = (
-            "Tu es un analyste financier expert en fiscalité marocaine. "
-            f"Analyse ce document fiscal ({document_name}) et extraire spécifiquement les données suivantes du tableau B14 'Détail de La Taxe sur La Valeur Ajoutée':\n\n"
-            "1. T.V.A. Facturée (intersection ligne 'T.V.A. Facturée' avec colonne 'Opérations comptables de l'exercice')\n"
-            "2. TVA pratique: T.V.A. de l'exercice (intersection ligne 'T.V.A. Facturée' avec colonne 'Déclarations T.V.A de l'exercice')\n"
-            "3. Clients et comptes rattachés de l'exercice précédent\n" 
-            "4. Clients et comptes rattachés brute de l'exercice\n"
-            "5. Chiffre d'affaires (CA) pour le calcul de l'encaissement théorique\n\n"
-            "Retourne un JSON avec cette structure:\n"
-            "{\n"
-            "  \"fiscal_year\": 2023,\n"
-            "  \"tva_data\": {\n"
-            "    \"tva_facturee\": valeur_tva_facturee,\n"
-            "    \"tva_pratique\": valeur_tva_pratique,\n"
-            "    \"clients_exercice_precedent\": valeur_clients_n_moins_1,\n"
-            "    \"clients_exercice_brut\": valeur_clients_n,\n"
-            "    \"chiffre_affaires\": valeur_ca\n"
-            "  }\n"
-            "}\n\n"
-            "Si une valeur n'est pas trouvée, utilise null.\n"
-            "Recherche particulièrement dans le tableau B14 'Détail de La Taxe sur La Valeur Ajoutée'."
-        )
+        tva_prompt = _TVA_PROMPT_TEMPLATE.format(document_name=document_name)
 
-        message = client.messages.create(
+        with client.messages.stream(
             model=model_name,
             max_tokens=2048,
-            messages=[
-                {
-                    'role': 'user',
-                    'content': [
-                        {'type': 'text', 'text': tva_prompt + "\n\n" + markdown_text},
-                    ],
-                }
-            ],
-        )
-        return (message.content[0].text or '').strip()
+            messages=_build_user_message(tva_prompt, markdown_text),
+        ) as stream:
+            response_text = ''.join(stream.text_stream)
+        return response_text.strip()
         
     except anthropic.APIError as e:
         # Handle specific Anthropic API errors
@@ -824,63 +1171,41 @@ def _extract_tva_data_from_single_document(client: 'anthropic.Anthropic', markdo
     except Exception as e:
         raise Exception(f"Error extracting TVA data from single document {document_name}: {str(e)}")
 
+_KPI_SINGLE_DOC_PROMPT_TEMPLATE = (
+    "Tu es un analyste financier expert en fiscalité marocaine. "
+    "Analyse ce document fiscal ({document_name}) et identifie:\n\n"
+    "1. L'année fiscale principale (N) de ce document\n"
+    "2. Les valeurs financières pour l'année N et N-1 si disponibles\n\n"
+    "Extraire ces KPIs:\n"
+    f"{_KPI_PROMPT_LIST}\n"
+    "Retourne un JSON avec cette structure:\n"
+    "{{\n"
+    "  \"fiscal_year\": 2023,\n"
+    "  \"kpis\": {{\n"
+    "    \"Chiffre d'affaires\": {{\"N\": valeur_n, \"N-1\": valeur_n_moins_1}},\n"
+    "    \"Résultat Net\": {{\"N\": valeur_n, \"N-1\": valeur_n_moins_1}},\n"
+    "    \"Actif circulant\": {{\"N\": valeur_n, \"N-1\": valeur_n_moins_1}},\n"
+    "    \"Passif circulant\": {{\"N\": valeur_n, \"N-1\": valeur_n_moins_1}},\n"
+    "    \"Actif circulant total\": {{\"N\": valeur_n, \"N-1\": valeur_n_moins_1}},\n"
+    "    ...\n"
+    "  }}\n"
+    "}}\n\n"
+    "Si une valeur n'est pas trouvée, utilise null."
+)
+
 def _extract_kpis_from_single_document(client: 'anthropic.Anthropic', markdown_text: str, model_name: str, document_name: str) -> str:
     """Extract KPIs from a single document's markdown with fiscal year identification."""
+    import anthropic
     try:
-        kpi_prompt = (
-            "Tu es un analyste financier expert en fiscalité marocaine. "
-            f"Analyse ce document fiscal ({document_name}) et identifie:\n\n"
-            "1. L'année fiscale principale (N) de ce document\n"
-            "2. Les valeurs financières pour l'année N et N-1 si disponibles\n\n"
-            "Extraire ces KPIs:\n"
-            "- Chiffre d'affaires\n"
-            "- Résultat d'exploitation\n"
-            "- Résultat Net\n"
-            "- Dotations d'exploitation\n"
-            "- Reprises d'exploitation; transferts de charges\n"
-            "- Redevances de crédit-bail\n"
-            "- Trésorerie-Actif\n"
-            "- Titres Valeurs de placement\n"
-            "- Dettes de financement\n"
-            "- Trésorerie-passif\n"
-            "- Trésorerie nette\n"
-            "- Compte d'associés (Actif)\n"
-            "- Compte d'associés (Passif)\n"
-            "- Redevanes restant à payer (a plus d'un an)\n"
-            "- Redevanes restant à payer (a moins d'un an)\n"
-            "- Prix d'achat résiduel en fin du contrat\n"
-            "- Capitaux propres\n"
-            "- Actif circulant\n"
-            "- Passif circulant\n"
-            "- Actif circulant total\n\n"
-            "Retourne un JSON avec cette structure:\n"
-            "{\n"
-            "  \"fiscal_year\": 2023,\n"
-            "  \"kpis\": {\n"
-            "    \"Chiffre d'affaires\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "    \"Résultat Net\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "    \"Actif circulant\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "    \"Passif circulant\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "    \"Actif circulant total\": {\"N\": valeur_n, \"N-1\": valeur_n_moins_1},\n"
-            "    ...\n"
-            "  }\n"
-            "}\n\n"
-            "Si une valeur n'est pas trouvée, utilise null."
-        )
+        kpi_prompt = _KPI_SINGLE_DOC_PROMPT_TEMPLATE.format(document_name=document_name)
 
-        message = client.messages.create(
+        with client.messages.stream(
             model=model_name,
             max_tokens=2048,
-            messages=[
-                {
-                    'role': 'user',
-                    'content': [
-                        {'type': 'text', 'text': kpi_prompt + "\n\n" + markdown_text},
-                    ],
-                }
-            ],
-        )
-        return (message.content[0].text or '').strip()
+            messages=_build_user_message(kpi_prompt, markdown_text),
+        ) as stream:
+            response_text = ''.join(stream.text_stream)
+        return response_text.strip()
         
     except anthropic.APIError as e:
         # Handle specific Anthropic API errors
@@ -942,11 +1267,51 @@ def _process_multi_document_kpis(client: 'anthropic.Anthropic', document_kpis_li
             log_progress("No valid primary document found")
             return {}
 
+def _year_label_sort_key(year_label: str) -> int:
+    """Sort key for relative year labels: 'N' first, then 'N-1', 'N-2', ..., unknown labels last."""
+    if year_label == 'N':
+        return 0
+    if year_label.startswith('N-'):
+        return int(year_label[2:])
+    return 999
+
+def _combine_single_document_kpis(doc: dict) -> dict:
+    """Single-document fast path of _combine_multi_document_kpis, producing the same structure."""
+    fiscal_year = doc.get('fiscal_year')
+    if not fiscal_year:
+        return {}
+    
+    kpis = doc.get('kpis') or {}
+    combined_kpis = {}
+    for kpi_name in _KPI_NAMES:
+        kpi_data = kpis.get(kpi_name)
+        timeline = {}
+        if isinstance(kpi_data, dict):
+            if 'N' in kpi_data:
+                timeline['N'] = kpi_data['N']
+            if 'N-1' in kpi_data:
+                timeline['N-1'] = kpi_data['N-1']
+        combined_kpis[kpi_name] = timeline
+    
+    combined_kpis['_metadata'] = {
+        'total_documents': 1,
+        'fiscal_years': [fiscal_year],
+        'year_mapping': {fiscal_year: 'N', fiscal_year - 1: 'N-1', fiscal_year - 2: 'N-2'},
+        'available_years': ['N', 'N-1']
+    }
+    
+    print(f"[MULTI-DOC] Single document (fiscal year {fiscal_year}), using its N / N-1 values directly", flush=True)
+    return combined_kpis
+
 def _combine_multi_document_kpis(document_kpis_list: list) -> dict:
     """Combine KPIs from multiple documents into a unified multi-year structure."""
     if not document_kpis_list:
         return {}
     
+    # A single document's own N / N-1 values already form the whole timeline
+    if len(document_kpis_list) == 1:
+        return _combine_single_document_kpis(document_kpis_list[0])
+    
     # Sort documents by fiscal year (newest first)
     sorted_docs = sorted(document_kpis_list, key=lambda x: x.get('fiscal_year', 0), reverse=True)
     
@@ -1008,18 +1373,7 @@ def _combine_multi_document_kpis(document_kpis_list: list) -> dict:
     print(f"[MULTI-DOC] Year mapping: {year_mapping}", flush=True)
     
     # Initialize combined structure
-    kpi_names = [
-        'Chiffre d\'affaires', 'Résultat d\'exploitation', 'Résultat Net',
-        'Dotations d\'exploitation', 'Reprises d\'exploitation; transferts de charges',
-        'Redevances de crédit-bail', 'Trésorerie-Actif', 'Titres Valeurs de placement',
-        'Dettes de financement', 'Trésorerie-passif', 'Compte d\'associés (Actif)',
-        'Compte d\'associés (Passif)', 'Redevanes restant à payer (a plus d\'un an)',
-        'Redevanes restant à payer (a moins d\'un an)', 'Prix d\'achat résiduel en fin du contrat',
-        'Capitaux propres'
-    ]
-    
-    for kpi_name in kpi_names:
-        combined_kpis[kpi_name] = {}
+    combined_kpis = {kpi_name: {} for kpi_name in _KPI_NAMES}
     
     # Combine data from all documents
     for doc in sorted_docs:
@@ -1029,7 +1383,7 @@ def _combine_multi_document_kpis(document_kpis_list: list) -> dict:
         if not fiscal_year or not kpis:
             continue
             
-        for kpi_name in kpi_names:
+        for kpi_name in _KPI_NAMES:
             if kpi_name in kpis:
                 kpi_data = kpis[kpi_name]
                 
@@ -1046,17 +1400,17 @@ def _combine_multi_document_kpis(document_kpis_list: list) -> dict:
                         combined_kpis[kpi_name][timeline_year] = kpi_data['N-1']
     
     # Create available years list based on what we actually have data for
-    available_years = []
     fiscal_years_in_docs = [doc.get('fiscal_year') for doc in sorted_docs if doc.get('fiscal_year')]
+    fiscal_years_set = set(fiscal_years_in_docs)
     
     # Only include years that correspond to actual document years or their N-1 data
-    for year_val, year_label in year_mapping.items():
-        # Include if it's a document year or if it's N-1 of a document year
-        if year_val in fiscal_years_in_docs or (year_val + 1) in fiscal_years_in_docs:
-            available_years.append(year_label)
+    available_years = [
+        year_label for year_val, year_label in year_mapping.items()
+        if year_val in fiscal_years_set or (year_val + 1) in fiscal_years_set
+    ]
     
     # Sort years logically (N, N-1, N-2, etc.)
-    available_years.sort(key=lambda x: 0 if x == 'N' else int(x.split('-')[1]) if '-' in x else 999)
+    available_years.sort(key=_year_label_sort_key)
     
     # Add metadata
     combined_kpis['_metadata'] = {
@@ -1069,36 +1423,39 @@ def _combine_multi_document_kpis(document_kpis_list: list) -> dict:
     print(f"[MULTI-DOC] Combined KPIs created with years: {combined_kpis['_metadata']['available_years']}", flush=True)
     return combined_kpis
 
+# Characters stripped from string amounts before float conversion
+_NUMERIC_CLEAN_RE = re.compile(r'[^\d.,\-]')
+
+def _get_numeric_value(value):
+    """Extract numeric value from various formats, always as a float (or None)"""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, str):
+            # Remove common formatting
+            cleaned_value = _NUMERIC_CLEAN_RE.sub('', value)
+            cleaned_value = cleaned_value.replace(',', '.')
+            if cleaned_value and cleaned_value != '.':
+                return float(cleaned_value)
+        else:
+            return float(value)
+    except (ValueError, TypeError):
+        pass
+    return None
+
 def _compute_tva_analysis(tva_data: dict) -> dict:
     """Compute TVA analysis including theoretical encaissement and TVA comparison."""
     if not tva_data or not isinstance(tva_data, dict):
         return {}
     
-    def get_numeric_value(value):
-        """Extract numeric value from various formats"""
-        if value is None:
-            return None
-        try:
-            if isinstance(value, str):
-                # Remove common formatting
-                cleaned_value = re.sub(r'[^\d.,\-]', '', str(value))
-                cleaned_value = cleaned_value.replace(',', '.')
-                if cleaned_value and cleaned_value != '.':
-                    return float(cleaned_value)
-            else:
-                return float(value)
-        except (ValueError, TypeError):
-            pass
-        return None
-    
     tva_analysis = {}
     
     # Extract values from TVA data
-    ca = get_numeric_value(tva_data.get('chiffre_affaires'))
-    tva_facturee = get_numeric_value(tva_data.get('tva_facturee'))
-    clients_precedent = get_numeric_value(tva_data.get('clients_exercice_precedent'))
-    clients_brut = get_numeric_value(tva_data.get('clients_exercice_brut'))
-    tva_pratique = get_numeric_value(tva_data.get('tva_pratique'))
+    ca = _get_numeric_value(tva_data.get('chiffre_affaires'))
+    tva_facturee = _get_numeric_value(tva_data.get('tva_facturee'))
+    clients_precedent = _get_numeric_value(tva_data.get('clients_exercice_precedent'))
+    clients_brut = _get_numeric_value(tva_data.get('clients_exercice_brut'))
+    tva_pratique = _get_numeric_value(tva_data.get('tva_pratique'))
     
     # Store extracted values
     tva_analysis['tva_facturee'] = tva_facturee
@@ -1109,7 +1466,7 @@ def _compute_tva_analysis(tva_data: dict) -> dict:
     
     # Calculate encaissement théorique
     # Formule: CA + TVA Facturée + Clients exercice précédent - Clients exercice brut
-    if all(v is not None for v in [ca, tva_facturee, clients_precedent, clients_brut]):
+    if ca is not None and tva_facturee is not None and clients_precedent is not None and clients_brut is not None:
         encaissement_theorique = ca + tva_facturee + clients_precedent - clients_brut
         tva_analysis['encaissement_theorique'] = encaissement_theorique
         
@@ -1119,230 +1476,256 @@ def _compute_tva_analysis(tva_data: dict) -> dict:
         
         # Compare TVA théorique vs TVA pratique
         if tva_pratique is not None:
-            tva_analysis['ecart_tva'] = tva_theorique - tva_pratique
-            tva_analysis['ecart_tva_pourcentage'] = ((tva_theorique - tva_pratique) / tva_theorique * 100) if tva_theorique != 0 else 0
+            ecart_tva = tva_theorique - tva_pratique
+            tva_analysis['ecart_tva'] = ecart_tva
+            tva_analysis['ecart_tva_pourcentage'] = (ecart_tva / tva_theorique * 100) if tva_theorique != 0 else 0
     
     return tva_analysis
 
+# Ratio inputs mapped to the extracted KPI key they are read from
+_RATIO_KPI_KEYS = {
+    'chiffre_d_affaires': 'Chiffre d\'affaires',
+    'resultat_d_exploitation': 'Résultat d\'exploitation',
+    'resultat_net': 'Résultat Net',
+    'dotations_d_exploitation': 'Dotations d\'exploitation',
+    'reprises_d_exploitation': 'Reprises d\'exploitation; transferts de charges',
+    'redevances_credit_bail': 'Redevances de crédit-bail',
+    'tresorerie_actif': 'Trésorerie-Actif',
+    'titres_valeurs_placement': 'Titres Valeurs de placement',
+    'dettes_financement': 'Dettes de financement',
+    'tresorerie_passif': 'Trésorerie-passif',
+    'tresorerie_nette': 'Trésorerie nette',
+    'comptes_associes_actif': 'Compte d\'associés (Actif)',
+    'comptes_associes_passif': 'Compte d\'associés (Passif)',
+    'redevances_moins_un_an': 'Redevanes restant à payer (a moins d\'un an)',
+    'redevances_plus_un_an': 'Redevanes restant à payer (a plus d\'un an)',
+    'prix_achat_residuel': 'Prix d\'achat résiduel en fin du contrat',
+    'capitaux_propres': 'Capitaux propres',
+    'actif_circulant': 'Actif circulant',
+    'passif_circulant': 'Passif circulant',
+    'actif_circulant_total': 'Actif circulant total'
+}
+
+# Ratio inputs only ever used as addends: a missing value counts as 0.0, so they are
+# sanitized once when the year is built instead of guarded with `or 0` at each use
+_ZERO_DEFAULT_RATIO_KPIS = frozenset({
+    'dotations_d_exploitation',
+    'reprises_d_exploitation',
+    'redevances_credit_bail',
+    'tresorerie_actif',
+    'titres_valeurs_placement',
+    'dettes_financement',
+    'tresorerie_passif',
+    'comptes_associes_actif',
+    'comptes_associes_passif',
+    'redevances_moins_un_an',
+    'redevances_plus_un_an',
+    'prix_achat_residuel'
+})
+
+@dataclass(slots=True)
+class _YearKPIs:
+    """Base KPI values of one fiscal year, one field per _RATIO_KPI_KEYS entry."""
+    chiffre_d_affaires: Optional[float] = None
+    resultat_d_exploitation: Optional[float] = None
+    resultat_net: Optional[float] = None
+    dotations_d_exploitation: float = 0.0
+    reprises_d_exploitation: float = 0.0
+    redevances_credit_bail: float = 0.0
+    tresorerie_actif: float = 0.0
+    titres_valeurs_placement: float = 0.0
+    dettes_financement: float = 0.0
+    tresorerie_passif: float = 0.0
+    tresorerie_nette: Optional[float] = None
+    comptes_associes_actif: float = 0.0
+    comptes_associes_passif: float = 0.0
+    redevances_moins_un_an: float = 0.0
+    redevances_plus_un_an: float = 0.0
+    prix_achat_residuel: float = 0.0
+    capitaux_propres: Optional[float] = None
+    actif_circulant: Optional[float] = None
+    passif_circulant: Optional[float] = None
+    actif_circulant_total: Optional[float] = None
+
+# Ratios computed for every year, stored under '<name>_<year suffix>' keys
+_PER_YEAR_RATIO_NAMES = (
+    'ebitda',
+    'encours_credit_bail',
+    'dette_nette',
+    'marge_ebitda',
+    'marge_exploitation',
+    'marge_nette',
+    'roe',
+    'roce',
+    'gearing',
+    'capacite_remboursements',
+    'tresorerie_nette'
+)
+
+@lru_cache(maxsize=32)
+def _ratio_keys(year_suffix: str) -> dict:
+    """Output keys of the per-year ratios for a year suffix (e.g. 'n1' -> 'ebitda_n1'), built once per suffix."""
+    return {name: sys.intern(f'{name}_{year_suffix}') for name in _PER_YEAR_RATIO_NAMES}
+
+def _compute_year_ratios(kpis: _YearKPIs) -> dict:
+    """Compute the per-year ratios of one fiscal year, keyed by ratio name.
+
+    Pure arithmetic on a single year's base KPIs; intermediate results (EBITDA,
+    encours, dette nette) are reused from locals by the ratios that depend on them.
+    Inputs are floats (see _get_numeric_value) and so are the literals, so no step
+    mixes int and float operands.
+    """
+    ratios = {}
+    ca = kpis.chiffre_d_affaires
+    resultat_exploit = kpis.resultat_d_exploitation
+    resultat_net = kpis.resultat_net
+    capitaux_propres = kpis.capitaux_propres
+    
+    # EBITDA = RESULTAT D'EXPLOITATION + Dotations d'exploitation - Reprises d'exploitation + Redevances de crédit-bail
+    resultat_exploit_value = resultat_exploit or 0.0
+    dotations = kpis.dotations_d_exploitation
+    reprises = kpis.reprises_d_exploitation
+    redevances = kpis.redevances_credit_bail
+    
+    ebitda = None
+    if any([resultat_exploit_value, dotations, reprises, redevances]):
+        ebitda = resultat_exploit_value + dotations - reprises + redevances
+        ratios['ebitda'] = ebitda
+    
+    # Encours de crédit-bail = Redevances restant à payer (moins + plus d'un an) + Prix d'achat résiduel
+    red_moins = kpis.redevances_moins_un_an
+    red_plus = kpis.redevances_plus_un_an
+    prix_residuel = kpis.prix_achat_residuel
+    
+    # Always calculate and save encours_credit_bail, even if the result is 0
+    encours_credit_bail = red_moins + red_plus + prix_residuel
+    ratios['encours_credit_bail'] = encours_credit_bail
+    
+    # Dette nette = DETTES DE FINANCEMENT + TRESORERIE-PASSIF + Comptes d'associés (passif) + encours crédit bail - TRESORERIE-ACTIF - TITRES - Comptes d'associés (actif)
+    dettes_fin = kpis.dettes_financement
+    tres_passif = kpis.tresorerie_passif
+    comptes_ass_passif = kpis.comptes_associes_passif
+    tres_actif = kpis.tresorerie_actif
+    titres = kpis.titres_valeurs_placement
+    comptes_ass_actif = kpis.comptes_associes_actif
+    
+    dette_nette = (dettes_fin + tres_passif + comptes_ass_passif + encours_credit_bail -
+                   tres_actif - titres - comptes_ass_actif)
+    ratios['dette_nette'] = dette_nette
+    
+    # Percentage ratios sharing the numerator / denominator * 100 shape:
+    # Marge d'EBITDA = EBITDA / Chiffre d'affaires
+    # Marge d'exploitation = Résultat d'exploitation / Chiffre d'affaires
+    # Marge nette = Résultat net / Chiffre d'affaires
+    # ROE = Résultat net / Capitaux Propres
+    for name, numerator, denominator in (
+        ('marge_ebitda', ebitda, ca),
+        ('marge_exploitation', resultat_exploit, ca),
+        ('marge_nette', resultat_net, ca),
+        ('roe', resultat_net, capitaux_propres),
+    ):
+        if numerator and denominator:
+            ratios[name] = (numerator / denominator) * 100.0
+    
+    # ROCE = Résultat d'exploitation / (Capitaux Propres + Dette nette)
+    if resultat_exploit and capitaux_propres:
+        denominateur = capitaux_propres + dette_nette
+        if denominateur != 0:
+            ratios['roce'] = (resultat_exploit / denominateur) * 100.0
+    
+    # Gearing = Dette nette / Capitaux propres
+    if capitaux_propres and capitaux_propres != 0:
+        ratios['gearing'] = (dette_nette / capitaux_propres) * 100.0
+    
+    # Capacité de remboursements = Dette nette / EBITDA
+    if ebitda and ebitda != 0:
+        ratios['capacite_remboursements'] = dette_nette / ebitda
+    
+    # Trésorerie nette = Trésorerie (Actif) - Trésorerie (Passif)
+    # First try to use the extracted value if available, otherwise compute it
+    extracted_tresorerie_nette = kpis.tresorerie_nette
+    if extracted_tresorerie_nette is not None:
+        ratios['tresorerie_nette'] = extracted_tresorerie_nette
+    else:
+        ratios['tresorerie_nette'] = tres_actif - tres_passif
+    
+    return ratios
+
+# Year labels and their key suffixes (N -> n, N-1 -> n1, etc.)
+_YEAR_SUFFIXES = {'N': 'n', 'N-1': 'n1', 'N-2': 'n2', 'N-3': 'n3', 'N-4': 'n4', 'N-5': 'n5'}
+_DEFAULT_RATIO_YEARS = ('N', 'N-1')
+_DEFAULT_RATIO_YEAR_SUFFIXES = ('n', 'n1')
+
 def _compute_financial_ratios(kpis_data: dict) -> dict:
     """Compute financial ratios from extracted KPIs using French names and multi-year structure"""
     
     if not kpis_data or not isinstance(kpis_data, dict):
         return {}
     
-    def get_numeric_value(value):
-        """Extract numeric value from various formats"""
-        if value is None:
-            return None
-        try:
-            if isinstance(value, str):
-                # Remove common formatting
-                cleaned_value = re.sub(r'[^\d.,\-]', '', str(value))
-                cleaned_value = cleaned_value.replace(',', '.')
-                if cleaned_value and cleaned_value != '.':
-                    return float(cleaned_value)
-            else:
-                return float(value)
-        except (ValueError, TypeError):
-            pass
-        return None
-    
-    def find_kpi_value(kpi_name_patterns, year="N"):
-        """Find KPI value by trying different name patterns"""
-        for pattern in kpi_name_patterns:
-            # First try direct match with the pattern as key
-            if pattern in kpis_data:
-                if isinstance(kpis_data[pattern], dict) and year in kpis_data[pattern]:
-                    value = get_numeric_value(kpis_data[pattern][year])
-                    # print(f"[DEBUG] Found {pattern}[{year}] = {value}", flush=True)
-                    return value
-                elif not isinstance(kpis_data[pattern], dict):
-                    value = get_numeric_value(kpis_data[pattern])
-                    # print(f"[DEBUG] Found {pattern} = {value}", flush=True)
-                    return value
-            else:
-                print(f"[DEBUG] Pattern '{pattern}' not found in KPIs data", flush=True)
-        return None
-    
     # Get available years from metadata or default to N, N-1
-    available_years = ['N', 'N-1']
     if '_metadata' in kpis_data and 'available_years' in kpis_data['_metadata']:
         available_years = kpis_data['_metadata']['available_years']
         # Sort years in logical order (N, N-1, N-2, etc.)
-        available_years = sorted(available_years, key=lambda x: 0 if x == 'N' else int(x.split('-')[1]) if '-' in x else 999)
+        available_years = sorted(available_years, key=_year_label_sort_key)
+        # Convert year format for processing (N -> n, N-1 -> n1, etc.)
+        processed_years = [_YEAR_SUFFIXES.get(year) or year.lower().replace('-', '') for year in available_years]
+    else:
+        # Common single-document shape: suffixes are known up front
+        available_years = list(_DEFAULT_RATIO_YEARS)
+        processed_years = list(_DEFAULT_RATIO_YEAR_SUFFIXES)
     
-    print(f"[RATIOS] Computing ratios for years: {available_years}", flush=True)
+    ratios_logger.debug("[RATIOS] Computing ratios for years: %s", available_years)
     
     # Log the multi-document structure if available
     if '_metadata' in kpis_data:
         metadata = kpis_data['_metadata']
-        total_docs = metadata.get('total_documents', 1)
-        fiscal_years = metadata.get('fiscal_years', [])
-        print(f"[RATIOS] Multi-document processing: {total_docs} documents, fiscal years: {fiscal_years}", flush=True)
-    
-    # Extract base KPIs for all available years
-    base_kpis = {}
-
-    
-    # KPI patterns to search for - using actual database keys
-    kpi_patterns = {
-        'chiffre_d_affaires': ['Chiffre d\'affaires'],
-        'resultat_d_exploitation': ['Résultat d\'exploitation'],
-        'resultat_net': ['Résultat Net'],
-        'dotations_d_exploitation': ['Dotations d\'exploitation'],
-        'reprises_d_exploitation': ['Reprises d\'exploitation; transferts de charges'],
-        'redevances_credit_bail': ['Redevances de crédit-bail'],
-        'tresorerie_actif': ['Trésorerie-Actif'],
-        'titres_valeurs_placement': ['Titres Valeurs de placement'],
-        'dettes_financement': ['Dettes de financement'],
-        'tresorerie_passif': ['Trésorerie-passif'],
-        'tresorerie_nette': ['Trésorerie nette'],
-        'comptes_associes_actif': ['Compte d\'associés (Actif)'],
-        'comptes_associes_passif': ['Compte d\'associés (Passif)'],
-        'redevances_moins_un_an': ['Redevanes restant à payer (a moins d\'un an)'],
-        'redevances_plus_un_an': ['Redevanes restant à payer (a plus d\'un an)'],
-        'prix_achat_residuel': ['Prix d\'achat résiduel en fin du contrat'],
-        'capitaux_propres': ['Capitaux propres'],
-        'actif_circulant': ['Actif circulant'],
-        'passif_circulant': ['Passif circulant'],
-        'actif_circulant_total': ['Actif circulant total']
-    }
+        ratios_logger.debug("[RATIOS] Multi-document processing: %s documents, fiscal years: %s",
+                            metadata.get('total_documents', 1), metadata.get('fiscal_years', []))
+    
+    # Extract base KPIs for all available years, one KPI at a time; a year-less (scalar)
+    # value applies to every year and is converted only once
+    kpi_columns = {}
+    for kpi_name, kpi_key in _RATIO_KPI_KEYS.items():
+        kpi_value = kpis_data.get(kpi_key)
+        if isinstance(kpi_value, dict):
+            kpi_columns[kpi_name] = [
+                _get_numeric_value(kpi_value[year]) if year in kpi_value else None
+                for year in available_years
+            ]
+        else:
+            kpi_columns[kpi_name] = [_get_numeric_value(kpi_value)] * len(available_years)
     
-    # Extract values for all available years
-    for kpi_name, patterns in kpi_patterns.items():
-        for year in available_years:
-            year_suffix = year.lower().replace('-', '')
-            base_kpis[f"{kpi_name}_{year_suffix}"] = find_kpi_value(patterns, year)
+    if ratios_logger.isEnabledFor(logging.DEBUG):
+        non_null_values = sum(value is not None for column in kpi_columns.values() for value in column)
+        ratios_logger.debug("[PROCESSING] Extracted base KPIs: %d non-null values", non_null_values)
     
-    print(f"[PROCESSING] Extracted base KPIs: {len([k for k, v in base_kpis.items() if v is not None])} non-null values", flush=True)
-    # print(f"[PROCESSING] Sample base KPIs: {dict(list(base_kpis.items())[:5])}", flush=True)
+    # Missing addend-only inputs become 0.0; the others keep None for "was it extracted?" checks
+    for kpi_name in _ZERO_DEFAULT_RATIO_KPIS:
+        kpi_columns[kpi_name] = [0.0 if value is None else value for value in kpi_columns[kpi_name]]
+    
+    # Regroup the columns per year for the ratio pass
+    year_kpis = {}
+    for i, year_suffix in enumerate(processed_years):
+        year_kpis[year_suffix] = _YearKPIs(**{kpi_name: column[i] for kpi_name, column in kpi_columns.items()})
     
     # Calculate computed ratios using the formulas for all available years
     computed_ratios = {}
     
-    # Convert year format for processing (N -> n, N-1 -> n1, etc.)
-    year_conversion = {'N': 'n', 'N-1': 'n1', 'N-2': 'n2', 'N-3': 'n3', 'N-4': 'n4', 'N-5': 'n5'}
-    processed_years = [year_conversion.get(year, year.lower().replace('-', '')) for year in available_years]
-    
-    # EBITDA = RESULTAT D'EXPLOITATION + Dotations d'exploitation - Reprises d'exploitation + Redevances de crédit-bail
-    for year in processed_years:
-        resultat_exploit = base_kpis.get(f'resultat_d_exploitation_{year}', 0) or 0
-        dotations = base_kpis.get(f'dotations_d_exploitation_{year}', 0) or 0
-        reprises = base_kpis.get(f'reprises_d_exploitation_{year}', 0) or 0
-        redevances = base_kpis.get(f'redevances_credit_bail_{year}', 0) or 0
-        
-        # print(f"[PROCESSING] EBITDA {year}: resultat_exploit={resultat_exploit}, dotations={dotations}, reprises={reprises}, redevances={redevances}", flush=True)
-        
-        if any([resultat_exploit, dotations, reprises, redevances]):
-            ebitda_value = resultat_exploit + dotations - reprises + redevances
-            computed_ratios[f'ebitda_{year}'] = ebitda_value
-            # print(f"[PROCESSING] Computed EBITDA {year}: {ebitda_value}", flush=True)
-    
-    # Encours de crédit-bail = Redevances restant à payer (moins + plus d'un an) + Prix d'achat résiduel
-    for year in processed_years:
-        red_moins = base_kpis.get(f'redevances_moins_un_an_{year}', 0) or 0
-        red_plus = base_kpis.get(f'redevances_plus_un_an_{year}', 0) or 0
-        prix_residuel = base_kpis.get(f'prix_achat_residuel_{year}', 0) or 0
-        
-        # Always calculate and save encours_credit_bail, even if the result is 0
-        encours_credit_bail = red_moins + red_plus + prix_residuel
-        computed_ratios[f'encours_credit_bail_{year}'] = encours_credit_bail
-        # print(f"[PROCESSING] Computed Encours crédit-bail {year}: {encours_credit_bail} (red_moins={red_moins}, red_plus={red_plus}, prix_residuel={prix_residuel})", flush=True)
-    
-    # Dette nette = DETTES DE FINANCEMENT + TRESORERIE-PASSIF + Comptes d'associés (passif) + encours crédit bail - TRESORERIE-ACTIF - TITRES - Comptes d'associés (actif)
-    for year in processed_years:
-        dettes_fin = base_kpis.get(f'dettes_financement_{year}', 0) or 0
-        tres_passif = base_kpis.get(f'tresorerie_passif_{year}', 0) or 0
-        comptes_ass_passif = base_kpis.get(f'comptes_associes_passif_{year}', 0) or 0
-        encours_cb = computed_ratios.get(f'encours_credit_bail_{year}', 0) or 0
-        tres_actif = base_kpis.get(f'tresorerie_actif_{year}', 0) or 0
-        titres = base_kpis.get(f'titres_valeurs_placement_{year}', 0) or 0
-        comptes_ass_actif = base_kpis.get(f'comptes_associes_actif_{year}', 0) or 0
-        
-        computed_ratios[f'dette_nette_{year}'] = (dettes_fin + tres_passif + comptes_ass_passif + encours_cb - 
-                                                  tres_actif - titres - comptes_ass_actif)
-    
-    # Variations between consecutive years (N vs N-1, N-1 vs N-2, etc.)
-    for i in range(len(processed_years) - 1):
-        current_year = processed_years[i]
-        previous_year = processed_years[i + 1]
-        
-        ca_current = base_kpis.get(f'chiffre_d_affaires_{current_year}')
-        ca_previous = base_kpis.get(f'chiffre_d_affaires_{previous_year}')
-        
-        if ca_current and ca_previous and ca_previous != 0:
-            computed_ratios[f'variation_chiffre_affaires_{current_year}_vs_{previous_year}'] = ((ca_current / ca_previous) - 1) * 100
-    
-    # Marge d'EBITDA = EBITDA / Chiffre d'affaires
-    for year in processed_years:
-        ebitda = computed_ratios.get(f'ebitda_{year}')
-        ca = base_kpis.get(f'chiffre_d_affaires_{year}')
-        if ebitda and ca and ca != 0:
-            computed_ratios[f'marge_ebitda_{year}'] = (ebitda / ca) * 100
-    
-    # Marge d'exploitation = Résultat d'exploitation / Chiffre d'affaires
-    for year in processed_years:
-        resultat_exploit = base_kpis.get(f'resultat_d_exploitation_{year}')
-        ca = base_kpis.get(f'chiffre_d_affaires_{year}')
-        if resultat_exploit and ca and ca != 0:
-            computed_ratios[f'marge_exploitation_{year}'] = (resultat_exploit / ca) * 100
-    
-    # Marge nette = Résultat net / Chiffre d'affaires
-    for year in processed_years:
-        resultat_net = base_kpis.get(f'resultat_net_{year}')
-        ca = base_kpis.get(f'chiffre_d_affaires_{year}')
-        if resultat_net and ca and ca != 0:
-            computed_ratios[f'marge_nette_{year}'] = (resultat_net / ca) * 100
-    
-    # ROE = Résultat net / Capitaux Propres
-    for year in processed_years:
-        resultat_net = base_kpis.get(f'resultat_net_{year}')
-        capitaux_propres = base_kpis.get(f'capitaux_propres_{year}')
-        if resultat_net and capitaux_propres and capitaux_propres != 0:
-            computed_ratios[f'roe_{year}'] = (resultat_net / capitaux_propres) * 100
-    
-    # ROCE = Résultat d'exploitation / (Capitaux Propres + Dette nette)
-    for year in processed_years:
-        resultat_exploit = base_kpis.get(f'resultat_d_exploitation_{year}')
-        capitaux_propres = base_kpis.get(f'capitaux_propres_{year}')
-        dette_nette = computed_ratios.get(f'dette_nette_{year}')
-        if resultat_exploit and capitaux_propres and dette_nette is not None:
-            denominateur = capitaux_propres + dette_nette
-            if denominateur != 0:
-                computed_ratios[f'roce_{year}'] = (resultat_exploit / denominateur) * 100
-    
-    # Gearing = Dette nette / Capitaux propres
-    for year in processed_years:
-        dette_nette = computed_ratios.get(f'dette_nette_{year}')
-        capitaux_propres = base_kpis.get(f'capitaux_propres_{year}')
-        if dette_nette is not None and capitaux_propres and capitaux_propres != 0:
-            computed_ratios[f'gearing_{year}'] = (dette_nette / capitaux_propres) * 100
-    
-    # Capacité de remboursements = Dette nette / EBITDA
-    for year in processed_years:
-        dette_nette = computed_ratios.get(f'dette_nette_{year}')
-        ebitda = computed_ratios.get(f'ebitda_{year}')
-        if dette_nette is not None and ebitda and ebitda != 0:
-            computed_ratios[f'capacite_remboursements_{year}'] = dette_nette / ebitda
-    
-    # Trésorerie nette = Trésorerie (Actif) - Trésorerie (Passif)
-    for year in processed_years:
-        # First try to use the extracted value if available
-        extracted_tresorerie_nette = base_kpis.get(f'tresorerie_nette_{year}')
+    # Compute every per-year ratio and the variation against the following (older)
+    # year in the same pass over the years
+    for i, year in enumerate(processed_years):
+        kpis = year_kpis[year]
+        keys = _ratio_keys(year)
+        # dict.update sizes the table once for the whole year instead of per insert
+        computed_ratios.update({keys[name]: value for name, value in _compute_year_ratios(kpis).items()})
         
-        if extracted_tresorerie_nette is not None:
-            # Use the extracted value directly
-            computed_ratios[f'tresorerie_nette_{year}'] = extracted_tresorerie_nette
-            # print(f"[PROCESSING] Using extracted Trésorerie nette {year}: {extracted_tresorerie_nette}", flush=True)
-        else:
-            # Fallback to computation if extracted value not available
-            tres_actif = base_kpis.get(f'tresorerie_actif_{year}', 0) or 0
-            tres_passif = base_kpis.get(f'tresorerie_passif_{year}', 0) or 0
-            
-            if tres_actif is not None or tres_passif is not None:
-                tresorerie_nette = tres_actif - tres_passif
-                computed_ratios[f'tresorerie_nette_{year}'] = tresorerie_nette
-                # print(f"[PROCESSING] Computed Trésorerie nette {year}: {tresorerie_nette} (Actif: {tres_actif}, Passif: {tres_passif})", flush=True)
+        # Variations between consecutive years (N vs N-1, N-1 vs N-2, etc.)
+        if i + 1 < len(processed_years):
+            previous_year = processed_years[i + 1]
+            ca_current = kpis.chiffre_d_affaires
+            ca_previous = year_kpis[previous_year].chiffre_d_affaires
+            if ca_current and ca_previous and ca_previous != 0:
+                computed_ratios[f'variation_chiffre_affaires_{year}_vs_{previous_year}'] = ((ca_current / ca_previous) - 1.0) * 100.0
     
     # Add metadata to computed ratios
     computed_ratios['_metadata'] = {
@@ -1360,29 +1743,86 @@ def _compute_financial_ratios(kpis_data: dict) -> dict:
             'year_mapping': source_metadata.get('year_mapping', {}),
             'is_multi_document': source_metadata.get('total_documents', 1) > 1
         }
-        print(f"[RATIOS] Added multi-document metadata: {computed_ratios['_metadata']['multi_document']['total_documents']} documents", flush=True)
+        ratios_logger.debug("[RATIOS] Added multi-document metadata: %s documents",
+                            computed_ratios['_metadata']['multi_document']['total_documents'])
     
     return computed_ratios
 
+# Fenced code blocks of an LLM response
+_FENCED_JSON_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)```", re.IGNORECASE)
+
 def _safe_parse_json(text: str):
     """Try to robustly parse JSON from a possibly noisy LLM response."""
     if not text:
         return None
     # Try direct parse
     try:
-        return json.loads(text)
+        return orjson.loads(text)
     except Exception:
         pass
+    # Locate the JSON embedded in the response; the search is memoized, the parse is
+    # not, so callers always get a fresh object they are free to mutate
+    json_span = _find_embedded_json(text)
+    return _loads_lenient(json_span) if json_span is not None else None
+
+def _loads_lenient(json_text: str):
+    """Parse with orjson, falling back to the stdlib parser for the non-standard JSON
+    LLMs sometimes emit (NaN/Infinity, integers wider than 64 bits) that orjson rejects."""
+    try:
+        return orjson.loads(json_text)
+    except orjson.JSONDecodeError:
+        return json.loads(json_text)
+
+@lru_cache(maxsize=256)
+def _find_embedded_json(text: str):
+    """Return the first fenced or bare {...}/[...] block of text that parses as JSON, or None."""
     # Extract fenced or first JSON object/array
-    fenced = re.findall(r"```(?:json)?\s*([\s\S]*?)```", text, re.IGNORECASE)
+    fenced = _FENCED_JSON_RE.findall(text)
     candidates = fenced + [text]
     for cand in candidates:
         cand = cand.strip()
         # Find first {...} or [...] block
-        m = re.search(r"(\{[\s\S]*\}|\[[\s\S]*\])", cand)
-        if m:
+        json_span = _find_json_span(cand)
+        if json_span:
             try:
-                return json.loads(m.group(1))
+                _loads_lenient(json_span)
+                return json_span
             except Exception:
                 continue
     return None
+
+def _find_json_span(text: str):
+    """Return the first balanced {...} or [...] block of text, or None.
+
+    Single linear scan tracking nesting depth and string literals, so braces inside
+    strings are ignored and trailing prose after the JSON is not swallowed.
+    """
+    start = -1
+    for i, char in enumerate(text):
+        if char == '{' or char == '[':
+            start = i
+            break
+    if start < 0:
+        return None
+    
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{' or char == '[':
+            depth += 1
+        elif char == '}' or char == ']':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
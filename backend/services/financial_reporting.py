@@ -1,43 +1,300 @@
 import os
+import sys
 import json
+import orjson
+import copy
+import time
+import hashlib
+import logging
+import threading
 import anthropic
+import httpx
 import openai
+from collections import OrderedDict
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 load_dotenv()
 
-def extract_json_from_response(response_text: str) -> str:
-    """
-    Extract JSON content from a response that may be wrapped in markdown code blocks.
-    
-    Args:
-        response_text (str): The raw response text from the LLM
-        
-    Returns:
-        str: Clean JSON text ready for parsing
-    """
-    if not response_text:
-        return ""
-    
-    # Remove markdown code block formatting if present
-    json_text = response_text.strip()
-    
-    # Handle ```json ... ``` blocks
-    if json_text.startswith('```json') and json_text.endswith('```'):
-        json_text = json_text[7:-3].strip()
-    # Handle generic ``` ... ``` blocks
-    elif json_text.startswith('```') and json_text.endswith('```'):
-        json_text = json_text[3:-3].strip()
-    
-    return json_text
+# Financial analysis request/response trace, enabled with ANALYSIS_DEBUG=1
+analysis_logger = logging.getLogger('financial_analysis')
+if os.environ.get('ANALYSIS_DEBUG', '').lower() in ('1', 'true', 'yes'):
+    analysis_logger.setLevel(logging.DEBUG)
+    if not analysis_logger.handlers:
+        analysis_logger.addHandler(logging.StreamHandler(sys.stdout))
+
+def _loads_lenient(json_text: str):
+    """Parse with orjson, falling back to the stdlib parser for the non-standard JSON
+    (NaN/Infinity, integers wider than 64 bits) that orjson rejects."""
+    try:
+        return orjson.loads(json_text)
+    except orjson.JSONDecodeError:
+        return json.loads(json_text)
 
 # Initialize OpenAI client
 # Initialize Anthropic client
 # anthropic_key = os.getenv("ANTHROPIC_API_KEY")
 # client = anthropic.Anthropic(api_key=anthropic_key) if anthropic_key else None
 openai_key = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=openai_key) if openai_key else None
+# The SDK retries rate-limited (429) and transient errors itself, with exponential backoff and jitter;
+# the timeout bounds each attempt so a stalled connection is retried instead of hanging
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "300"))
+
+# Process-wide cap on in-flight chat completions, shared by every thread calling
+# generate_financial_analysis, to stay under the OpenAI rate limits
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+_llm_semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# One pooled HTTP/2 connection set for all threads: concurrent analyses are multiplexed
+# over kept-alive connections instead of each paying its own TCP + TLS handshake
+_openai_http_client = openai.DefaultHttpxClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY)
+)
+client = openai.OpenAI(
+    api_key=openai_key, max_retries=OPENAI_MAX_RETRIES, timeout=OPENAI_TIMEOUT_SECONDS, http_client=_openai_http_client
+) if openai_key else None
+
+# Model policy: every analysis uses ANALYSIS_MODEL. With ANALYSIS_SMALL_MODEL_ENABLED=1, prompts
+# under ANALYSIS_SMALL_MODEL_MAX_TOKENS (estimated at ~4 chars per token) go to the cheaper,
+# faster ANALYSIS_SMALL_MODEL instead
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gpt-5")
+ANALYSIS_SMALL_MODEL_ENABLED = os.getenv("ANALYSIS_SMALL_MODEL_ENABLED", "").lower() in ('1', 'true', 'yes')
+ANALYSIS_SMALL_MODEL = os.getenv("ANALYSIS_SMALL_MODEL", "gpt-5-mini")
+ANALYSIS_SMALL_MODEL_MAX_TOKENS = int(os.getenv("ANALYSIS_SMALL_MODEL_MAX_TOKENS", "8000"))
+
+def _select_analysis_model(system_prompt: str, user_message: str) -> str:
+    if not (ANALYSIS_SMALL_MODEL_ENABLED and ANALYSIS_SMALL_MODEL):
+        return ANALYSIS_MODEL
+    approx_tokens = (len(system_prompt) + len(user_message)) // 4
+    if approx_tokens < ANALYSIS_SMALL_MODEL_MAX_TOKENS:
+        return ANALYSIS_SMALL_MODEL
+    return ANALYSIS_MODEL
+
+# In-process cache of successful analyses: the analysis only depends on its inputs, so
+# re-running it for unchanged data returns the stored result instead of calling the LLM
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+ANALYSIS_CACHE_MAXSIZE = 256
+_analysis_cache = OrderedDict()  # key -> (stored_at, analysis), least recently used first
+_analysis_cache_lock = threading.Lock()
+
+def _analysis_cache_key(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year) -> Optional[str]:
+    """SHA-256 of the normalized analysis inputs, or None if they cannot be serialized."""
+    try:
+        payload = orjson.dumps(
+            [company_name, extracted_kpis, computed_ratios, str(news_data or ''), web_data, fiscal_year],
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str
+        )
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(payload).hexdigest()
+
+def _get_cached_analysis(cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+    if cache_key is None:
+        return None
+    with _analysis_cache_lock:
+        entry = _analysis_cache.get(cache_key)
+        if entry is None:
+            return None
+        stored_at, analysis = entry
+        if time.monotonic() - stored_at > ANALYSIS_CACHE_TTL_SECONDS:
+            del _analysis_cache[cache_key]
+            return None
+        _analysis_cache.move_to_end(cache_key)
+    # Callers merge the result into profile_data; never hand out the cached object itself
+    return copy.deepcopy(analysis)
+
+def _store_cached_analysis(cache_key: Optional[str], analysis: Dict[str, Any]) -> None:
+    if cache_key is None:
+        return
+    with _analysis_cache_lock:
+        _analysis_cache[cache_key] = (time.monotonic(), copy.deepcopy(analysis))
+        _analysis_cache.move_to_end(cache_key)
+        while len(_analysis_cache) > ANALYSIS_CACHE_MAXSIZE:
+            _analysis_cache.popitem(last=False)
+
+# System prompt of the financial analysis request
+_ANALYSIS_SYSTEM_PROMPT = """Tu es un analyste financier expert spécialisé dans l'analyse d'entreprises marocaines.
+
+        Ta mission est de générer une analyse financière complète et professionnelle basée sur toutes les données disponibles :
+        - KPIs financiers extraits des documents
+        - Ratios financiers calculés
+        - Actualités et veille sectorielle
+        - Informations de base de l'entreprise (secteur, marchés, expertise)
+
+        Tu dois générer 3 sections distinctes en français :
+
+        1. ANALYSE SWOT : Forces, faiblesses, opportunités, menaces
+        2. RECOMMANDATION STRATÉGIQUE : Générer une recommandation détaillée et complète qui intègre synthèse, évaluation globale et conseils stratégiques
+        3. ANALYSE DÉTAILLÉE : Analyse approfondie de la structure financière, incluant l'équilibre dette/capitaux propres, la santé financière, et la capacité de couverture du coût du capital
+
+        Utilise TOUTES les données disponibles pour une analyse cohérente et factuelle.
+
+        Pour la RECOMMANDATION, génère un paragraphe détaillé de 8-10 lignes qui intègre :
+        - Une synthèse de la situation financière
+        - L'évaluation globale de la performance
+        - Des conseils stratégiques concrets et actionables
+        - La justification basée sur les données financières réelles
+
+        IMPORTANT : Retourne UNIQUEMENT un objet JSON valide, sans texte avant ou après."""
+
+# Fixed head of the user message: expected JSON layout and answering rules
+_ANALYSIS_JSON_INSTRUCTIONS = """GÉNÈRE UNE RÉPONSE JSON AVEC CETTE STRUCTURE EXACTE :
+        {
+        "swot_analysis": {
+            "strengths": ["Force 1", "Force 2", "Force 3"],
+            "weaknesses": ["Faiblesse 1", "Faiblesse 2", "Faiblesse 3"],
+            "opportunities": ["Opportunité 1", "Opportunité 2", "Opportunité 3"],
+            "threats": ["Menace 1", "Menace 2", "Menace 3"]
+        },
+        "recommendation": "Recommandation stratégique détaillée et complète (8-10 lignes) intégrant synthèse, évaluation globale et conseils stratégiques",
+        "detailed_analysis": "Analyse détaillée de la structure financière"
+        }
+
+        Base ton analyse sur les données financières réelles et les indicateurs calculés qui sont toujours en MAD. Sois précis et factuel.
+        IMPORTANT : Retourne UNIQUEMENT le JSON, sans texte avant ou après."""
+
+# Structured output: the model has to answer with exactly this JSON object
+_ANALYSIS_REQUIRED_KEYS = ('swot_analysis', 'recommendation', 'detailed_analysis')
+_SWOT_ITEMS_SCHEMA = {"type": "array", "items": {"type": "string"}}
+_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "swot_analysis": {
+            "type": "object",
+            "properties": {
+                "strengths": _SWOT_ITEMS_SCHEMA,
+                "weaknesses": _SWOT_ITEMS_SCHEMA,
+                "opportunities": _SWOT_ITEMS_SCHEMA,
+                "threats": _SWOT_ITEMS_SCHEMA
+            },
+            "required": ["strengths", "weaknesses", "opportunities", "threats"],
+            "additionalProperties": False
+        },
+        "recommendation": {"type": "string"},
+        "detailed_analysis": {"type": "string"}
+    },
+    "required": list(_ANALYSIS_REQUIRED_KEYS),
+    "additionalProperties": False
+}
+_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "financial_analysis", "strict": True, "schema": _ANALYSIS_SCHEMA}
+}
+
+def _missing_analysis_keys(analysis_data) -> List[str]:
+    """Top-level keys of the expected analysis that a parsed response lacks."""
+    if not isinstance(analysis_data, dict):
+        return list(_ANALYSIS_REQUIRED_KEYS)
+    return [key for key in _ANALYSIS_REQUIRED_KEYS if key not in analysis_data]
+
+def _parse_analysis(response_text: str) -> Optional[Dict[str, Any]]:
+    """Parse a single-company analysis response; None if it is not valid JSON or lacks a section."""
+    try:
+        analysis_data = _loads_lenient(response_text)
+    except json.JSONDecodeError:
+        print("⚠️ Could not parse the LLM response as JSON")
+        return None
+    
+    # Validate the structure
+    missing_keys = _missing_analysis_keys(analysis_data)
+    if missing_keys:
+        print(f"⚠️ Missing keys in LLM response: {missing_keys}")
+        return None
+    return analysis_data
+
+# Company data is rendered as indented JSON in the prompt; year_mapping metadata has integer keys
+_PROMPT_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# Character budget of the user message (the model has a large context window, but let's be safe)
+MAX_CONTEXT_LENGTH = 100000
+
+def _news_text(news_data) -> str:
+    """News section of the prompt, cut to the message budget before it is embedded."""
+    if not news_data:
+        return 'Aucune actualité disponible'
+    news_text = news_data if isinstance(news_data, str) else str(news_data)
+    if len(news_text) > MAX_CONTEXT_LENGTH:
+        # News is the only unbounded input; the final message cap still applies on top
+        print(f"⚠️ News data too long ({len(news_text)} chars), truncating to {MAX_CONTEXT_LENGTH} chars")
+        news_text = news_text[:MAX_CONTEXT_LENGTH]
+    return news_text
+
+def _extract_web_meta(web_data: Optional[Dict[str, Any]], default_sector: str, default_expertise: str) -> tuple:
+    """(primary_sector, company_expertise, markets, sectors) from web_exploring data, tolerating missing levels."""
+    basic_info = (web_data or {}).get('basic_info') or {}
+    company_overview = basic_info.get('companyOverview') or {}
+    return (
+        company_overview.get('primary_sector', default_sector),
+        company_overview.get('companyExpertise', default_expertise),
+        basic_info.get('markets') or [],
+        basic_info.get('sectors') or []
+    )
+
+def _format_company_data(
+    company_name: str,
+    extracted_kpis: Dict[str, Any],
+    computed_ratios: Dict[str, Any],
+    news_data: str,
+    web_data: Dict[str, Any],
+    fiscal_year: Optional[str] = None) -> str:
+    """Render the collected data of one company as the data block of the prompt."""
+    primary_sector, company_expertise, markets, sectors = _extract_web_meta(web_data, 'Non spécifié', 'Non spécifié')
+    
+    markets_text = ', '.join(str(m.get('title', '')) for m in markets if m and isinstance(m, dict))
+    sectors_text = ', '.join(str(s.get('title', '')) for s in sectors if s and isinstance(s, dict))
+    
+    # One serialization pass for the whole block: KPIs and ratios are embedded as
+    # sub-objects instead of being dumped separately and pasted into a template
+    company_data = orjson.dumps({
+        "compagnie": company_name,
+        "informations_de_base": {
+            "secteur_principal": primary_sector,
+            "expertise": company_expertise,
+            "marches": markets_text,
+            "secteurs_d_activite": sectors_text
+        },
+        "annee_fiscale": fiscal_year,
+        "kpis_financiers_extraits": extracted_kpis if extracted_kpis and isinstance(extracted_kpis, dict) else 'Aucun KPI disponible',
+        "ratios_financiers_calcules": computed_ratios if computed_ratios and isinstance(computed_ratios, dict) else 'Aucun ratio calculé',
+        "actualites_et_veille_sectorielle": _news_text(news_data)
+    }, option=_PROMPT_JSON_OPTIONS).decode('utf-8')
+    
+    # Add fiscal year information to guide the LLM
+    fiscal_year_info = ""
+    if fiscal_year:
+        # Add guidance about using actual years instead of N/N-1
+        fiscal_year_info = f"\n        IMPORTANT : Utilise l'année {fiscal_year} dans tes recommandations et analyses, pas 'N' ou 'N-1'."
+    
+    # Guidance ahead of the JSON so that truncating an oversized block never drops it
+    return f"DONNÉES DE L'ENTREPRISE (JSON) :{fiscal_year_info}\n{company_data}"
+
+def _finalize_user_message(data_context: str) -> str:
+    """Cap the user message length and strip characters the API chokes on."""
+    # Check if data is too long and truncate if necessary
+    if len(data_context) > MAX_CONTEXT_LENGTH:
+        print(f"⚠️ Data context too long ({len(data_context)} chars), truncating to {MAX_CONTEXT_LENGTH} chars")
+        data_context = data_context[:MAX_CONTEXT_LENGTH] + "\n\n[DATA TRONQUÉ POUR RESPECTER LES LIMITES]"
+    
+    # Sanitize the data context to avoid potential issues
+    data_context = data_context.replace('\x00', '')  # Remove null bytes
+    data_context = data_context.replace('\r', '\n')  # Normalize line endings
+    
+    return data_context
+
+def _build_analysis_data_context(
+    company_name: str,
+    extracted_kpis: Dict[str, Any],
+    computed_ratios: Dict[str, Any],
+    news_data: str,
+    web_data: Dict[str, Any],
+    fiscal_year: Optional[str] = None) -> str:
+    """Build the user message of the analysis request from the collected company data."""
+    company_data = _format_company_data(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
+    # Invariant instructions first: together with the system prompt they form a prefix
+    # shared by every request, which OpenAI serves from its prompt cache
+    return _finalize_user_message(_ANALYSIS_JSON_INSTRUCTIONS + "\n\n        " + company_data)
 
 def generate_financial_analysis(
     company_name: str,
@@ -63,8 +320,10 @@ def generate_financial_analysis(
     """
     
     # Validate input data
-    print(f"🔍 Validating input data for {company_name}")
-    print(f"🔍 News data type: {type(news_data)}, length: {len(str(news_data))}")
+    if analysis_logger.isEnabledFor(logging.DEBUG):
+        news_length = len(news_data) if isinstance(news_data, (str, bytes, list, dict)) else -1
+        analysis_logger.debug("🔍 Validating input data for %s", company_name)
+        analysis_logger.debug("🔍 News data type: %s, length: %d", type(news_data).__name__, news_length)
     
     if not client:
         print("❌ OpenAI API key not available, cannot generate financial analysis")
@@ -79,110 +338,26 @@ def generate_financial_analysis(
             "detailed_analysis": "Impossible de générer l'analyse financière sans clé API OpenAI"
         }
     
+    cache_key = _analysis_cache_key(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
+    cached_analysis = _get_cached_analysis(cache_key)
+    if cached_analysis is not None:
+        print(f"✅ Reusing cached financial analysis for {company_name}")
+        return cached_analysis
+    
     try:
         # Prepare the comprehensive prompt for all analysis sections
-        system_prompt = """Tu es un analyste financier expert spécialisé dans l'analyse d'entreprises marocaines.
-
-        Ta mission est de générer une analyse financière complète et professionnelle basée sur toutes les données disponibles :
-        - KPIs financiers extraits des documents
-        - Ratios financiers calculés
-        - Actualités et veille sectorielle
-        - Informations de base de l'entreprise (secteur, marchés, expertise)
-
-        Tu dois générer 3 sections distinctes en français :
-
-        1. ANALYSE SWOT : Forces, faiblesses, opportunités, menaces
-        2. RECOMMANDATION STRATÉGIQUE : Générer une recommandation détaillée et complète qui intègre synthèse, évaluation globale et conseils stratégiques
-        3. ANALYSE DÉTAILLÉE : Analyse approfondie de la structure financière, incluant l'équilibre dette/capitaux propres, la santé financière, et la capacité de couverture du coût du capital
-
-        Utilise TOUTES les données disponibles pour une analyse cohérente et factuelle.
-
-        Pour la RECOMMANDATION, génère un paragraphe détaillé de 8-10 lignes qui intègre :
-        - Une synthèse de la situation financière
-        - L'évaluation globale de la performance
-        - Des conseils stratégiques concrets et actionables
-        - La justification basée sur les données financières réelles
-
-        IMPORTANT : Retourne UNIQUEMENT un objet JSON valide, sans texte avant ou après."""
+        system_prompt = _ANALYSIS_SYSTEM_PROMPT
 
         # Prepare the data context for the LLM
-        # Safely extract and format data
         try:
-            # Ensure web_data is not None and has basic_info
-            web_data = web_data or {}
-            basic_info = web_data.get('basic_info') or {}
-            company_overview = basic_info.get('companyOverview') or {}
-            
-            primary_sector = company_overview.get('primary_sector', 'Non spécifié')
-            company_expertise = company_overview.get('companyExpertise', 'Non spécifié')
-            markets = basic_info.get('markets', [])
-            sectors = basic_info.get('sectors', [])
-            
-            markets_text = ', '.join([str(m.get('title', '')) for m in (markets or []) if m and isinstance(m, dict)])
-            sectors_text = ', '.join([str(s.get('title', '')) for s in (sectors or []) if s and isinstance(s, dict)])
-            
-            kpis_text = json.dumps(extracted_kpis, indent=2, ensure_ascii=False) if extracted_kpis and isinstance(extracted_kpis, dict) else 'Aucun KPI disponible'
-            ratios_text = json.dumps(computed_ratios, indent=2, ensure_ascii=False) if computed_ratios and isinstance(computed_ratios, dict) else 'Aucun ratio calculé'
-            news_text = str(news_data) if news_data else 'Aucune actualité disponible'
-            
+            data_context = _build_analysis_data_context(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
         except Exception as data_error:
             print(f"⚠️ Error formatting data: {str(data_error)}, using fallback")
             return generate_fallback_analysis(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
         
-        # Add fiscal year information to guide the LLM
-        fiscal_year_info = ""
-        if fiscal_year:
-            fiscal_year_info = f"\n        ANNÉE FISCALE : {fiscal_year}\n"
-            # Add guidance about using actual years instead of N/N-1
-            fiscal_year_info += f"        IMPORTANT : Utilise l'année {fiscal_year} dans tes recommandations et analyses, pas 'N' ou 'N-1'.\n"
-
-        data_context = f"""COMPAGNIE : {company_name}
-
-        INFORMATIONS DE BASE :
-        - Secteur principal : {primary_sector}
-        - Expertise : {company_expertise}
-        - Marchés : {markets_text}
-        - Secteurs d'activité : {sectors_text}
-        
-        ANNÉE FISCALE : {fiscal_year_info}
-        KPIs FINANCIERS EXTRACTES :
-        {kpis_text}
-
-        RATIOS FINANCIERS CALCULES :
-        {ratios_text}
-
-        ACTUALITÉS ET VEILLE SECTORIELLE :
-        {news_text}
-
-        GÉNÈRE UNE RÉPONSE JSON AVEC CETTE STRUCTURE EXACTE :
-        {{
-        "swot_analysis": {{
-            "strengths": ["Force 1", "Force 2", "Force 3"],
-            "weaknesses": ["Faiblesse 1", "Faiblesse 2", "Faiblesse 3"],
-            "opportunities": ["Opportunité 1", "Opportunité 2", "Opportunité 3"],
-            "threats": ["Menace 1", "Menace 2", "Menace 3"]
-        }},
-        "recommendation": "Recommandation stratégique détaillée et complète (8-10 lignes) intégrant synthèse, évaluation globale et conseils stratégiques",
-        "detailed_analysis": "Analyse détaillée de la structure financière"
-        }}
-
-        Base ton analyse sur les données financières réelles et les indicateurs calculés qui sont toujours en MAD. Sois précis et factuel.
-        IMPORTANT : Retourne UNIQUEMENT le JSON, sans texte avant ou après."""
-
         # Debug: Log what we're sending to the LLM
-        print(f"🔍 Sending prompt to LLM - System prompt length: {len(system_prompt)} chars")
-        print(f"🔍 Data context length: {len(data_context)} chars")
-        print(f"🔍 Total prompt length: {len(system_prompt) + len(data_context)} chars")
-        
-        # Check if data is too long and truncate if necessary
-        max_context_length = 100000  # Claude has a large context window, but let's be safe
-        if len(data_context) > max_context_length:
-            print(f"⚠️ Data context too long ({len(data_context)} chars), truncating to {max_context_length} chars")
-            data_context = data_context[:max_context_length] + "\n\n[DATA TRONQUÉ POUR RESPECTER LES LIMITES]"
-        
-        # Sanitize the data context to avoid potential issues
-        data_context = data_context.replace('\x00', '')  # Remove null bytes
-        data_context = data_context.replace('\r', '\n')  # Normalize line endings
+        analysis_logger.debug("🔍 Sending prompt to LLM - System prompt length: %d chars, data context length: %d chars, total: %d chars",
+                              len(system_prompt), len(data_context), len(system_prompt) + len(data_context))
         
         # Call the LLM
         # response = client.messages.create(
@@ -191,163 +366,86 @@ def generate_financial_analysis(
         #     temperature=0.1,
         #     system=system_prompt,
         #     messages=[{"role": "user", "content": data_context}]
-        response = client.chat.completions.create(
-            model="gpt-5",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": data_context}
-            ]
-        )
+        with _llm_semaphore:
+            response = client.chat.completions.create(
+                model=_select_analysis_model(system_prompt, data_context),
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": data_context}
+                ],
+                response_format=_ANALYSIS_RESPONSE_FORMAT
+            )
         
-        # Parse the response
-        response_text = response.choices[0].message.content.strip()
+        # The response_format schema guarantees a JSON body; content is only missing
+        # (or cut short) when the model refuses or runs out of tokens
+        response_text = response.choices[0].message.content or ''
         
         # Debug: Log the raw response
-        print(f"🔍 Raw LLM response length: {len(response_text)} characters")
-        print(f"🔍 Raw LLM response preview: {response_text[:200]}...")
+        analysis_logger.debug("🔍 Raw LLM response length: %d characters", len(response_text))
+        analysis_logger.debug("🔍 Raw LLM response preview: %.200s...", response_text)
         
-        try:
-            # Try to extract JSON from the response - be more robust
-            analysis_data = None
-            
-            # First try direct parse
-            try:
-                analysis_data = json.loads(response_text)
-                print("✅ Direct JSON parse successful")
-            except json.JSONDecodeError:
-                print("⚠️ Direct JSON parse failed, trying to extract JSON from markdown...")
-                
-                # Extract JSON from markdown code blocks if present
-                json_text = extract_json_from_response(response_text)
-                if json_text != response_text:
-                    try:
-                        analysis_data = json.loads(json_text)
-                        print("✅ JSON extraction from markdown successful")
-                    except json.JSONDecodeError:
-                        print("⚠️ JSON extraction from markdown failed, trying regex...")
-                        
-                        # Try to find JSON in the response using regex as fallback
-                        import re
-                        json_pattern = r'\{[\s\S]*\}'
-                        json_matches = re.findall(json_pattern, response_text)
-                        
-                        if json_matches:
-                            print(f"🔍 Found {len(json_matches)} potential JSON blocks")
-                            for i, match in enumerate(json_matches):
-                                try:
-                                    analysis_data = json.loads(match)
-                                    print(f"✅ JSON extraction successful from block {i+1}")
-                                    break
-                                except json.JSONDecodeError:
-                                    print(f"⚠️ JSON block {i+1} failed to parse")
-                                    continue
-                        else:
-                            print("⚠️ No JSON pattern found in response")
-                else:
-                    print("⚠️ No markdown code blocks found, trying regex...")
-                    
-                    # Try to find JSON in the response using regex as fallback
-                    import re
-                    json_pattern = r'\{[\s\S]*\}'
-                    json_matches = re.findall(json_pattern, response_text)
-                    
-                    if json_matches:
-                        print(f"🔍 Found {len(json_matches)} potential JSON blocks")
-                        for i, match in enumerate(json_matches):
-                            try:
-                                analysis_data = json.loads(match)
-                                print(f"✅ JSON extraction successful from block {i+1}")
-                                break
-                            except json.JSONDecodeError:
-                                print(f"⚠️ JSON block {i+1} failed to parse")
-                                continue
-                    else:
-                        print("⚠️ No JSON pattern found in response")
-            
-            if analysis_data:
-                # Validate the structure
-                required_keys = ['swot_analysis', 'recommendation', 'detailed_analysis']
-                missing_keys = [key for key in required_keys if key not in analysis_data]
-                
-                if missing_keys:
-                    print(f"⚠️ Missing keys in LLM response: {missing_keys}, using fallback")
-                    return generate_fallback_analysis(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
-                
-                print(f"✅ Financial analysis generated successfully for {company_name}")
-                return analysis_data
-            else:
-                print("⚠️ Could not extract valid JSON from LLM response, trying simpler prompt...")
-                
-                # Try with a simpler prompt
-                try:
-                    simple_prompt = f"""Analyse la situation financière de {company_name} et génère un JSON avec cette structure exacte:
-
-                    {{
-                    "swot_analysis": {{
-                        "strengths": ["Force 1", "Force 2", "Force 3"],
-                        "weaknesses": ["Faiblesse 1", "Faiblesse 2", "Faiblesse 3"],
-                        "opportunities": ["Opportunité 1", "Opportunité 2", "Opportunité 3"],
-                        "threats": ["Menace 1", "Menace 2", "Menace 3"]
-                    }},
-                    "recommendation": "Recommandation stratégique simple et détaillée",
-                    "detailed_analysis": "Analyse détaillée de la structure financière simple"
-                    }}
-
-                    Retourne uniquement le JSON."""
-                    
-                    print("🔄 Trying simpler prompt...")
-                    simple_response = client.chat.completions.create(
-                        model="gpt-5",
-                        messages=[{"role": "user", "content": simple_prompt}]
-                    )
-                    
-                    simple_text = simple_response.choices[0].message.content.strip()
-                    print(f"🔍 Simple prompt response: {simple_text[:200]}...")
-                    
-                    # Try to parse the simple response
-                    try:
-                        # Extract JSON from markdown code blocks if present
-                        json_text = extract_json_from_response(simple_text)
-                        simple_analysis = json.loads(json_text)
-                        required_keys = ['swot_analysis', 'recommendation', 'detailed_analysis']
-                        missing_keys = [key for key in required_keys if key not in simple_analysis]
-                        
-                        if not missing_keys:
-                            print("✅ Simple prompt successful!")
-                            return simple_analysis
-                        else:
-                            print(f"⚠️ Simple prompt missing keys: {missing_keys}")
-                    except json.JSONDecodeError:
-                        print("⚠️ Simple prompt also failed to parse")
-                        
-                except Exception as simple_error:
-                    print(f"❌ Simple prompt also failed: {str(simple_error)}")
-                
-                print("⚠️ All LLM attempts failed, using fallback analysis")
-                return generate_fallback_analysis(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
-            
-        except Exception as parse_error:
-            print(f"❌ Error parsing LLM response: {str(parse_error)}, using fallback")
+        analysis_data = _parse_analysis(response_text)
+        if analysis_data is None:
+            print("⚠️ Unusable LLM response, using fallback")
             return generate_fallback_analysis(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
-            
+        
+        print(f"✅ Financial analysis generated successfully for {company_name}")
+        _store_cached_analysis(cache_key, analysis_data)
+        return analysis_data
+        
+    except (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError) as e:
+        # Transient (network, timeout, 429, 5xx): the SDK already retried with backoff
+        print(f"❌ OpenAI still unavailable after {OPENAI_MAX_RETRIES} retries: {str(e)}")
+        print("⚠️ Transient API error, using fallback analysis")
+        return generate_fallback_analysis(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
+    except openai.APIError as e:
+        # Authentication, permission, invalid request: retrying or falling back would hide it
+        print(f"❌ Error generating financial analysis: {str(e)}")
+        print("❌ API-related error, returning error response instead of fallback")
+        return {
+            "swot_analysis": {
+                "strengths": [],
+                "weaknesses": [],
+                "opportunities": [],
+                "threats": []
+            },
+            "recommendation": f"Erreur API: {str(e)}",
+            "detailed_analysis": f"Impossible de générer l'analyse financière: {str(e)}"
+        }
     except Exception as e:
         print(f"❌ Error generating financial analysis: {str(e)}")
-        # Only use fallback for specific errors, not all errors
-        if "API" in str(e) or "key" in str(e).lower() or "unauthorized" in str(e).lower():
-            print("❌ API-related error, returning error response instead of fallback")
-            return {
-                "swot_analysis": {
-                    "strengths": [],
-                    "weaknesses": [],
-                    "opportunities": [],
-                    "threats": []
-                },
-                "recommendation": f"Erreur API: {str(e)}",
-                "detailed_analysis": f"Impossible de générer l'analyse financière: {str(e)}"
-            }
-        else:
-            print("⚠️ Non-API error, using fallback analysis")
-            return generate_fallback_analysis(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
+        print("⚠️ Non-API error, using fallback analysis")
+        return generate_fallback_analysis(company_name, extracted_kpis, computed_ratios, news_data, web_data, fiscal_year)
+
+# Company-independent parts of the fallback analysis, built once at import
+_FALLBACK_SWOT_WEAKNESSES = (
+    'Données financières limitées',
+    'Analyse approfondie nécessaire',
+    'Contexte concurrentiel à évaluer'
+)
+_FALLBACK_SWOT_OPPORTUNITIES = (
+    'Potentiel de croissance identifié',
+    'Marchés en développement',
+    'Partenariats stratégiques possibles'
+)
+_FALLBACK_SWOT_THREATS = (
+    'Concurrence sectorielle',
+    'Évolution réglementaire',
+    'Risques économiques'
+)
+
+# Fallback texts; .format(company_name=..., primary_sector=..., company_expertise=...)
+_FALLBACK_RECOMMENDATION_TEMPLATE = """Basé sur l'analyse des données disponibles pour {company_name}, nous recommandons une approche prudente et structurée qui intègre une évaluation globale de la performance financière. La société présente des indicateurs financiers dans le secteur {primary_sector} qui nécessitent une analyse plus approfondie pour identifier précisément les leviers de croissance et les axes d'amélioration prioritaires. 
+
+    L'évaluation globale révèle un potentiel de développement qui mérite une attention particulière, notamment en termes d'optimisation de la structure financière et d'exploitation des opportunités sectorielles. Il est recommandé de compléter cette analyse par une étude de marché détaillée, une évaluation des opportunités de développement, et la mise en place d'un plan d'action stratégique adapté aux spécificités du secteur {primary_sector}. 
+
+    Cette approche permettra de maximiser le potentiel de croissance tout en maintenant une gestion financière rigoureuse et adaptée aux enjeux du marché."""
+
+_FALLBACK_DETAILED_ANALYSIS_TEMPLATE = """L'analyse détaillée de la structure financière de {company_name} révèle une entreprise positionnée dans le secteur {primary_sector} avec une expertise en {company_expertise}.
+
+    Les données financières disponibles permettent d'identifier les indicateurs clés de performance, mais une analyse plus approfondie est nécessaire pour évaluer l'équilibre dette/capitaux propres, la santé financière, et la capacité de couverture du coût du capital.
+
+    Cette analyse préliminaire constitue une base solide pour des investigations plus approfondies et des recommandations stratégiques ciblées."""
 
 def generate_fallback_analysis(
     company_name: str,
@@ -364,11 +462,7 @@ def generate_fallback_analysis(
     print(f"🔄 Using fallback analysis for {company_name}")
     
     # Extract basic company info with proper None checks
-    web_data = web_data or {}
-    basic_info = web_data.get('basic_info') or {}
-    company_overview = basic_info.get('companyOverview') or {}
-    primary_sector = company_overview.get('primary_sector', 'Secteur général')
-    company_expertise = company_overview.get('companyExpertise', 'Expertise à déterminer')
+    primary_sector, company_expertise, _, _ = _extract_web_meta(web_data, 'Secteur général', 'Expertise à déterminer')
     
     # Basic SWOT analysis based on available data
     swot_analysis = {
@@ -377,36 +471,18 @@ def generate_fallback_analysis(
             f'Expertise reconnue en {company_expertise}',
             'Structure financière documentée'
         ],
-        'weaknesses': [
-            'Données financières limitées',
-            'Analyse approfondie nécessaire',
-            'Contexte concurrentiel à évaluer'
-        ],
-        'opportunities': [
-            'Potentiel de croissance identifié',
-            'Marchés en développement',
-            'Partenariats stratégiques possibles'
-        ],
-        'threats': [
-            'Concurrence sectorielle',
-            'Évolution réglementaire',
-            'Risques économiques'
-        ]
+        'weaknesses': list(_FALLBACK_SWOT_WEAKNESSES),
+        'opportunities': list(_FALLBACK_SWOT_OPPORTUNITIES),
+        'threats': list(_FALLBACK_SWOT_THREATS)
     }
     
     # Enhanced recommendation that includes synthesis and strategic advice
-    recommendation = f"""Basé sur l'analyse des données disponibles pour {company_name}, nous recommandons une approche prudente et structurée qui intègre une évaluation globale de la performance financière. La société présente des indicateurs financiers dans le secteur {primary_sector} qui nécessitent une analyse plus approfondie pour identifier précisément les leviers de croissance et les axes d'amélioration prioritaires. 
-
-    L'évaluation globale révèle un potentiel de développement qui mérite une attention particulière, notamment en termes d'optimisation de la structure financière et d'exploitation des opportunités sectorielles. Il est recommandé de compléter cette analyse par une étude de marché détaillée, une évaluation des opportunités de développement, et la mise en place d'un plan d'action stratégique adapté aux spécificités du secteur {primary_sector}. 
-
-    Cette approche permettra de maximiser le potentiel de croissance tout en maintenant une gestion financière rigoureuse et adaptée aux enjeux du marché."""
+    recommendation = _FALLBACK_RECOMMENDATION_TEMPLATE.format(company_name=company_name, primary_sector=primary_sector)
     
     # Basic detailed analysis
-    detailed_analysis = f"""L'analyse détaillée de la structure financière de {company_name} révèle une entreprise positionnée dans le secteur {primary_sector} avec une expertise en {company_expertise}.
-
-    Les données financières disponibles permettent d'identifier les indicateurs clés de performance, mais une analyse plus approfondie est nécessaire pour évaluer l'équilibre dette/capitaux propres, la santé financière, et la capacité de couverture du coût du capital.
-
-    Cette analyse préliminaire constitue une base solide pour des investigations plus approfondies et des recommandations stratégiques ciblées."""
+    detailed_analysis = _FALLBACK_DETAILED_ANALYSIS_TEMPLATE.format(
+        company_name=company_name, primary_sector=primary_sector, company_expertise=company_expertise
+    )
     
     return {
         'swot_analysis': swot_analysis,
@@ -1,21 +1,73 @@
 import os
 import json
+import orjson
 import base64
 import fitz  # PyMuPDF
 import anthropic
+import httpx
 from typing import Optional, Dict, Any
-import hashlib
-from sqlalchemy import text
+from blake3 import blake3
+from sqlalchemy import text, bindparam, or_, case, func
+from sqlalchemy.orm import scoped_session
 import re
 import sys
+import logging
+import threading
+import time
+import copy
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from rapidfuzz import fuzz, process
 
 # Import the new logging system
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.logger import log_debug, log_info, log_success, log_warning, log_error
+from utils.logger import logger, Logger, log_debug, log_debug_lazy, log_success, log_warning, log_error
+
+# Verification trace (extraction responses, matching decisions), enabled with VERIFICATION_DEBUG=1
+# or a LOG_LEVEL of DEBUG and above (see set_log_level.py)
+verification_logger = logging.getLogger('profile_verification')
+if (os.environ.get('VERIFICATION_DEBUG', '').lower() in ('1', 'true', 'yes')
+        or logger.log_level >= Logger.DEBUG):
+    verification_logger.setLevel(logging.DEBUG)
+    if not verification_logger.handlers:
+        verification_logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Upper bound on concurrent first-page extractions (one Claude call per document)
+EXTRACT_MAX_WORKERS = int(os.getenv("PROFILIA_EXTRACT_WORKERS", "8"))
+
+# Bounds each extraction attempt so a stalled connection is retried instead of hanging the upload
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv("PROFILIA_EXTRACT_TIMEOUT", "120"))
+
+# Claude clients shared across verifications so their HTTP connection pool
+# (and the TLS sessions in it) is reused; sized for EXTRACT_MAX_WORKERS concurrent extractions
+_anthropic_clients = {}
+_anthropic_clients_lock = threading.Lock()
+
+def _get_anthropic_client(api_key: str) -> anthropic.Anthropic:
+    with _anthropic_clients_lock:
+        client = _anthropic_clients.get(api_key)
+        if client is None:
+            client = anthropic.Anthropic(
+                api_key=api_key,
+                timeout=EXTRACT_TIMEOUT_SECONDS,
+                http_client=anthropic.DefaultHttpxClient(
+                    limits=httpx.Limits(max_connections=EXTRACT_MAX_WORKERS, max_keepalive_connections=EXTRACT_MAX_WORKERS)
+                )
+            )
+            _anthropic_clients[api_key] = client
+        return client
+
+# A whole response wrapped in a markdown code block (```json, ```JSON or bare ```)
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL | re.IGNORECASE)
+# Outermost JSON object or array inside surrounding prose
+_JSON_SPAN_RE = re.compile(r'[{\[].*[}\]]', re.DOTALL)
 
 def extract_json_from_response(response_text: str) -> str:
     """
-    Extract JSON content from a response that may be wrapped in markdown code blocks.
+    Extract JSON content from a response that may be wrapped in markdown code blocks
+    or surrounded by prose.
     
     Args:
         response_text (str): The raw response text from Claude
@@ -27,56 +79,204 @@ def extract_json_from_response(response_text: str) -> str:
         return ""
     
     # Remove markdown code block formatting if present
-    json_text = response_text.strip()
+    fence_match = _FENCE_RE.match(response_text)
+    json_text = fence_match.group(1) if fence_match else response_text.strip()
     
-    # Handle ```json ... ``` blocks
-    if json_text.startswith('```json') and json_text.endswith('```'):
-        json_text = json_text[7:-3].strip()
-    # Handle generic ``` ... ``` blocks
-    elif json_text.startswith('```') and json_text.endswith('```'):
-        json_text = json_text[3:-3].strip()
+    # Text around the JSON (e.g. "Voici le résultat : {...}"): keep the JSON span only
+    if json_text[:1] not in ('{', '['):
+        span_match = _JSON_SPAN_RE.search(json_text)
+        if span_match:
+            json_text = span_match.group(0)
     
     return json_text
 
-def _extract_first_page_as_pdf(file_path: str) -> Optional[str]:
+def _extract_first_page_as_pdf(file_path: str) -> Optional[bytes]:
     """
-    Extract the first page of a PDF as a separate PDF file.
+    Extract the first page of a PDF as a separate, in-memory PDF document.
     
     Args:
         file_path (str): Path to the original PDF file
         
     Returns:
-        str: Path to the temporary first page PDF file, or None if extraction fails
+        bytes: The single-page PDF, or None if extraction fails
     """
     try:
-        # Open the original PDF
-        doc = fitz.open(file_path)
-        if len(doc) == 0:
-            log_error(f"PDF has no pages: {file_path}")
-            doc.close()
-            return None
-        
-        # Create a new PDF with only the first page
-        first_page_pdf = fitz.open()
-        first_page_pdf.insert_pdf(doc, from_page=0, to_page=0)
-        
-        # Create temporary file for the first page
-        import tempfile
-        temp_fd, temp_path = tempfile.mkstemp(suffix='_first_page.pdf')
-        os.close(temp_fd)  # Close the file descriptor
+        # Open the original PDF; both documents are closed even if the copy fails
+        with fitz.open(file_path) as doc:
+            if len(doc) == 0:
+                log_error(f"PDF has no pages: {file_path}")
+                return None
+            
+            # Create a new PDF with only the first page
+            with fitz.open() as first_page_pdf:
+                first_page_pdf.insert_pdf(doc, from_page=0, to_page=0)
+                
+                # Serialize it straight to memory, no temporary file
+                return first_page_pdf.tobytes()
         
-        # Save the first page PDF
-        first_page_pdf.save(temp_path)
-        first_page_pdf.close()
-        doc.close()
+    except Exception as e:
+        log_error(f"Error extracting first page: {str(e)}")
+        return None
+
+# Send first pages to Claude as JPEG renders instead of PDF pages (smaller payload),
+# enabled with PROFILIA_EXTRACT_AS_IMAGE=1 so accuracy can be compared against the PDF path
+EXTRACT_AS_IMAGE = os.environ.get('PROFILIA_EXTRACT_AS_IMAGE', '').lower() in ('1', 'true', 'yes')
+EXTRACT_IMAGE_DPI = 150
+EXTRACT_IMAGE_JPEG_QUALITY = 75
+
+def _extract_first_page_as_jpeg(file_path: str) -> Optional[bytes]:
+    """
+    Render the first page of a PDF as a JPEG image.
+    
+    Args:
+        file_path (str): Path to the original PDF file
         
-        # print(f"[VERIFICATION] Extracted first page to: {temp_path}", flush=True)
-        return temp_path
+    Returns:
+        bytes: The JPEG image, or None if rendering fails
+    """
+    try:
+        with fitz.open(file_path) as doc:
+            if len(doc) == 0:
+                log_error(f"PDF has no pages: {file_path}")
+                return None
+            pixmap = doc.load_page(0).get_pixmap(dpi=EXTRACT_IMAGE_DPI)
+            return pixmap.tobytes("jpeg", jpg_quality=EXTRACT_IMAGE_JPEG_QUALITY)
         
     except Exception as e:
-        log_error(f"Error extracting first page: {str(e)}")
+        log_error(f"Error rendering first page: {str(e)}")
         return None
 
+def _first_page_content_block(file_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Build the Claude message content block carrying the first page of a PDF:
+    a JPEG image with EXTRACT_AS_IMAGE, otherwise a single-page PDF document.
+    
+    Returns:
+        Dict content block, or None if the first page could not be extracted
+    """
+    if EXTRACT_AS_IMAGE:
+        page_bytes = _extract_first_page_as_jpeg(file_path)
+        block_type, media_type = 'image', 'image/jpeg'
+    else:
+        page_bytes = _extract_first_page_as_pdf(file_path)
+        block_type, media_type = 'document', 'application/pdf'
+    if not page_bytes:
+        return None
+    
+    page_base64 = base64.b64encode(page_bytes).decode('ascii')
+    log_debug(f"First page {block_type} size: {len(page_base64)} chars")
+    
+    return {
+        'type': block_type,
+        'source': {
+            'type': 'base64',
+            'media_type': media_type,
+            'data': page_base64,
+        },
+    }
+
+# Instructions sent with the first page of every document (identical for all calls)
+_COMPANY_INFO_PROMPT = (
+    "Tu es un expert en analyse de documents fiscaux marocains. "
+    "À partir de cette première page de document fiscal, identifie et retourne UNIQUEMENT :\n\n"
+    "1. Le nom exact de l'entreprise/société\n"
+    "2. L'année fiscale ou exercice (par exemple: 2023, 2022, etc.)\n\n"
+    "IMPORTANT:\n"
+    "- Retourne un JSON strict avec les clés 'company_name' et 'fiscal_year'\n"
+    "- Si tu ne trouves pas l'information, mets null pour cette clé\n"
+    "- Pour fiscal_year, retourne uniquement l'année en nombre (ex: 2023)\n"
+    "- Pour company_name, retourne le nom complet et exact de l'entreprise\n\n"
+    "Exemple de format de réponse:\n"
+    "{\n"
+    "  \"company_name\": \"SOCIÉTÉ EXEMPLE SARL\",\n"
+    "  \"fiscal_year\": 2023\n"
+    "}"
+)
+
+# Company info already extracted, keyed by document hash; only successful
+# extractions are stored, never API error results
+COMPANY_INFO_CACHE_MAXSIZE = 1024
+_company_info_cache = OrderedDict()
+_company_info_cache_lock = threading.Lock()
+
+def _get_cached_company_info(document_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not document_hash:
+        return None
+    with _company_info_cache_lock:
+        company_info = _company_info_cache.get(document_hash)
+        if company_info is None:
+            return None
+        _company_info_cache.move_to_end(document_hash)
+        return dict(company_info)
+
+def _store_cached_company_info(document_hash: Optional[str], company_info: Dict[str, Any]) -> None:
+    if not document_hash:
+        return
+    with _company_info_cache_lock:
+        _company_info_cache[document_hash] = dict(company_info)
+        _company_info_cache.move_to_end(document_hash)
+        while len(_company_info_cache) > COMPANY_INFO_CACHE_MAXSIZE:
+            _company_info_cache.popitem(last=False)
+
+def _validate_company_info(company_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalize the company name and range-check the fiscal year Claude returned for one document.
+    
+    Args:
+        company_info (dict): Parsed JSON object with 'company_name' and 'fiscal_year'
+        
+    Returns:
+        Dict containing company_name and fiscal_year (None when missing or invalid)
+    """
+    # Extract and validate company name
+    company_name = company_info.get('company_name')
+    if company_name and isinstance(company_name, str):
+        company_name = company_name.strip()
+        # Normalize company name to remove legal suffixes
+        company_name = _normalize_company_name(company_name)
+    else:
+        company_name = None
+        
+    # Extract and validate fiscal year: Claude returns an int, a numeric string or null
+    fiscal_year = company_info.get('fiscal_year')
+    if isinstance(fiscal_year, str) and fiscal_year.strip().isdigit():
+        fiscal_year = int(fiscal_year)
+    elif isinstance(fiscal_year, float) and fiscal_year.is_integer():
+        fiscal_year = int(fiscal_year)
+    elif fiscal_year is not None and (not isinstance(fiscal_year, int) or isinstance(fiscal_year, bool)):
+        log_warning(f"Invalid fiscal year format: {fiscal_year}")
+        fiscal_year = None
+    
+    # Validate year range (should be reasonable)
+    if fiscal_year is not None and not 2000 <= fiscal_year <= 2030:
+        log_warning(f"Fiscal year out of range: {fiscal_year}")
+        fiscal_year = None
+    
+    return {
+        'company_name': company_name,
+        'fiscal_year': fiscal_year
+    }
+
+def _anthropic_error_result(e: Exception) -> Dict[str, Any]:
+    """
+    Map an Anthropic API error to the error indicator returned by the extraction functions.
+    """
+    # Handle specific Anthropic API errors
+    error_message = str(e)
+    if "529" in error_message and "overloaded" in error_message.lower():
+        log_error(f"Anthropic API overloaded (Error 529): {error_message}")
+        # Return a special error indicator for overloaded API
+        return {"error": "anthropic_overloaded", "message": "Anthropic API is currently overloaded. Please try again later."}
+    elif "rate_limit" in error_message.lower() or "429" in error_message:
+        log_error(f"Anthropic API rate limited: {error_message}")
+        return {"error": "anthropic_rate_limited", "message": "Anthropic API rate limit exceeded. Please try again later."}
+    elif "invalid_api_key" in error_message.lower() or "401" in error_message:
+        log_error(f"Anthropic API key error: {error_message}")
+        return {"error": "anthropic_auth_error", "message": "Anthropic API key is invalid or expired."}
+    else:
+        log_error(f"Anthropic API error: {error_message}")
+        return {"error": "anthropic_api_error", "message": f"Anthropic API error: {error_message}"}
+
 def extract_company_info_from_first_page(file_path: str, api_key: str) -> Optional[Dict[str, Any]]:
     """
     Extract company name and fiscal year from the first page of a PDF document using Claude.
@@ -88,44 +288,27 @@ def extract_company_info_from_first_page(file_path: str, api_key: str) -> Option
     Returns:
         Dict containing company_name and fiscal_year, or None if extraction fails
     """
-    temp_first_page_path = None
+    # Identical bytes (re-uploads, retries) were already read by Claude: reuse that answer
+    document_hash = calculate_document_hash(file_path)
+    cached_info = _get_cached_company_info(document_hash)
+    if cached_info is not None:
+        verification_logger.debug("[VERIFICATION] Reusing cached company info for %s", file_path)
+        return cached_info
+    
     try:
         # print(f"[VERIFICATION] Starting extraction from first page: {file_path}", flush=True)
         
-        # Initialize Anthropic client
-        client = anthropic.Anthropic(api_key=api_key)
+        # Shared Anthropic client (kept-alive connections)
+        client = _get_anthropic_client(api_key)
         
-        # Extract first page as separate PDF
-        temp_first_page_path = _extract_first_page_as_pdf(file_path)
-        if not temp_first_page_path:
+        # Extract first page as a content block (single-page PDF or JPEG render)
+        first_page_block = _first_page_content_block(file_path)
+        if not first_page_block:
             log_error(f"Failed to extract first page from: {file_path}")
             return None
         
-        # Read the first page PDF as base64
-        with open(temp_first_page_path, 'rb') as f:
-            pdf_base64 = base64.b64encode(f.read()).decode('utf-8')
-        
-        log_debug(f"First page PDF size: {len(pdf_base64)} chars")
-        
-        # Create prompt for company info extraction
-        extraction_prompt = (
-            "Tu es un expert en analyse de documents fiscaux marocains. "
-            "À partir de cette première page de document fiscal, identifie et retourne UNIQUEMENT :\n\n"
-            "1. Le nom exact de l'entreprise/société\n"
-            "2. L'année fiscale ou exercice (par exemple: 2023, 2022, etc.)\n\n"
-            "IMPORTANT:\n"
-            "- Retourne un JSON strict avec les clés 'company_name' et 'fiscal_year'\n"
-            "- Si tu ne trouves pas l'information, mets null pour cette clé\n"
-            "- Pour fiscal_year, retourne uniquement l'année en nombre (ex: 2023)\n"
-            "- Pour company_name, retourne le nom complet et exact de l'entreprise\n\n"
-            "Exemple de format de réponse:\n"
-            "{\n"
-            "  \"company_name\": \"SOCIÉTÉ EXEMPLE SARL\",\n"
-            "  \"fiscal_year\": 2023\n"
-            "}"
-        )
         
-        # Send request to Claude with PDF document format
+        # Send request to Claude with the first page
         message = client.messages.create(
             model="claude-sonnet-4-20250514",
             max_tokens=1024,
@@ -133,97 +316,303 @@ def extract_company_info_from_first_page(file_path: str, api_key: str) -> Option
                 {
                     'role': 'user',
                     'content': [
-                        {
-                            'type': 'document',
-                            'source': {
-                                'type': 'base64',
-                                'media_type': 'application/pdf',
-                                'data': pdf_base64,
-                            },
-                        },
-                        {'type': 'text', 'text': extraction_prompt},
+                        first_page_block,
+                        {'type': 'text', 'text': _COMPANY_INFO_PROMPT},
                     ],
                 }
             ],
         )
         
         response_text = (message.content[0].text or '').strip()
-        print(f"[VERIFICATION] Claude response: {response_text}", flush=True)
+        verification_logger.debug("[VERIFICATION] Claude response: %s", response_text)
         
         # Extract JSON from markdown code blocks if present
         json_text = extract_json_from_response(response_text)
         
         # Parse JSON response
         try:
-            company_info = json.loads(json_text)
+            company_info = orjson.loads(json_text)
             
             # Validate required fields
             if not isinstance(company_info, dict):
-                print(f"[VERIFICATION] Response is not a dictionary", flush=True)
+                log_warning("Response is not a dictionary")
                 return None
-                
-            # Extract and validate company name
-            company_name = company_info.get('company_name')
-            if company_name and isinstance(company_name, str):
-                company_name = company_name.strip()
-                # Normalize company name to remove legal suffixes
-                company_name = _normalize_company_name(company_name)
-            else:
-                company_name = None
-                
-            # Extract and validate fiscal year
-            fiscal_year = company_info.get('fiscal_year')
-            if fiscal_year is not None:
-                try:
-                    fiscal_year = int(fiscal_year)
-                    # Validate year range (should be reasonable)
-                    if fiscal_year < 2000 or fiscal_year > 2030:
-                        print(f"[VERIFICATION] Fiscal year out of range: {fiscal_year}", flush=True)
-                        fiscal_year = None
-                except (ValueError, TypeError):
-                    print(f"[VERIFICATION] Invalid fiscal year format: {fiscal_year}", flush=True)
-                    fiscal_year = None
             
-            result = {
-                'company_name': company_name,
-                'fiscal_year': fiscal_year
-            }
+            result = _validate_company_info(company_info)
             
             # print(f"[VERIFICATION] Extracted info: {result}", flush=True)
+            _store_cached_company_info(document_hash, result)
             return result
             
-        except json.JSONDecodeError as e:
-            print(f"[VERIFICATION] Failed to parse JSON response: {e}", flush=True)
-            print(f"[VERIFICATION] Raw response: {response_text}", flush=True)
+        except orjson.JSONDecodeError as e:
+            log_error(f"Failed to parse JSON response: {e}")
+            verification_logger.debug("[VERIFICATION] Raw response: %s", response_text)
             return None
             
     except anthropic.APIError as e:
-        # Handle specific Anthropic API errors
-        error_message = str(e)
-        if "529" in error_message and "overloaded" in error_message.lower():
-            print(f"[VERIFICATION] Anthropic API overloaded (Error 529): {error_message}", flush=True)
-            # Return a special error indicator for overloaded API
-            return {"error": "anthropic_overloaded", "message": "Anthropic API is currently overloaded. Please try again later."}
-        elif "rate_limit" in error_message.lower() or "429" in error_message:
-            print(f"[VERIFICATION] Anthropic API rate limited: {error_message}", flush=True)
-            return {"error": "anthropic_rate_limited", "message": "Anthropic API rate limit exceeded. Please try again later."}
-        elif "invalid_api_key" in error_message.lower() or "401" in error_message:
-            print(f"[VERIFICATION] Anthropic API key error: {error_message}", flush=True)
-            return {"error": "anthropic_auth_error", "message": "Anthropic API key is invalid or expired."}
+        return _anthropic_error_result(e)
+    except Exception as e:
+        log_error(f"Error extracting company info: {str(e)}")
+        return None
+
+# Instructions sent with the first pages of several documents (one page per document, merged PDF or JPEGs)
+_COMPANY_INFO_BATCH_PROMPT = (
+    "Tu es un expert en analyse de documents fiscaux marocains. "
+    "Tu reçois la première page de plusieurs documents fiscaux, une page par document, dans l'ordre. "
+    "Pour chaque page, identifie et retourne UNIQUEMENT :\n\n"
+    "1. Le nom exact de l'entreprise/société\n"
+    "2. L'année fiscale ou exercice (par exemple: 2023, 2022, etc.)\n\n"
+    "IMPORTANT:\n"
+    "- Retourne un tableau JSON strict avec un objet par page, dans l'ordre des pages, "
+    "avec les clés 'page' (numéro de page à partir de 1), 'company_name' et 'fiscal_year'\n"
+    "- Si tu ne trouves pas l'information, mets null pour cette clé\n"
+    "- Pour fiscal_year, retourne uniquement l'année en nombre (ex: 2023)\n"
+    "- Pour company_name, retourne le nom complet et exact de l'entreprise\n\n"
+    "Exemple de format de réponse:\n"
+    "[\n"
+    "  {\"page\": 1, \"company_name\": \"SOCIÉTÉ EXEMPLE SARL\", \"fiscal_year\": 2023},\n"
+    "  {\"page\": 2, \"company_name\": \"SOCIÉTÉ EXEMPLE SARL\", \"fiscal_year\": 2022}\n"
+    "]"
+)
+
+# Most first pages merged into one batched extraction request
+EXTRACT_BATCH_MAX_PAGES = int(os.getenv("PROFILIA_EXTRACT_BATCH_PAGES", "20"))
+
+def _extract_first_pages_as_pdf(file_paths: list) -> Optional[bytes]:
+    """
+    Merge the first page of each PDF into one in-memory PDF, in file_paths order.
+    
+    Args:
+        file_paths (list): Paths to the original PDF files
+        
+    Returns:
+        bytes: The merged PDF with one page per file, or None if any file has no readable page
+    """
+    try:
+        with fitz.open() as merged_pdf:
+            for file_path in file_paths:
+                with fitz.open(file_path) as doc:
+                    if len(doc) == 0:
+                        log_error(f"PDF has no pages: {file_path}")
+                        return None
+                    merged_pdf.insert_pdf(doc, from_page=0, to_page=0)
+            
+            return merged_pdf.tobytes()
+        
+    except Exception as e:
+        log_error(f"Error merging first pages: {str(e)}")
+        return None
+
+def extract_company_info_from_first_pages(file_paths: list, api_key: str) -> Optional[list]:
+    """
+    Extract company name and fiscal year from the first page of several PDF documents
+    with a single Claude call on their merged first pages.
+    
+    Args:
+        file_paths (list): Paths to the PDF files
+        api_key (str): Anthropic API key
+        
+    Returns:
+        list of per-document results in file_paths order (each shaped like the result of
+        extract_company_info_from_first_page), or None if the batched answer could not be
+        used and the caller should extract each document on its own
+    """
+    # Documents already read by Claude are served from the cache and left out of the batch
+    document_hashes = [calculate_document_hash(file_path) for file_path in file_paths]
+    results = [_get_cached_company_info(document_hash) for document_hash in document_hashes]
+    pending = [i for i, company_info in enumerate(results) if company_info is None]
+    if len(pending) < 2:
+        for i in pending:
+            results[i] = extract_company_info_from_first_page(file_paths[i], api_key)
+        return results
+    if len(pending) > EXTRACT_BATCH_MAX_PAGES:
+        return None
+    
+    try:
+        client = _get_anthropic_client(api_key)
+        
+        if EXTRACT_AS_IMAGE:
+            # One JPEG per document, in document order
+            page_blocks = [_first_page_content_block(file_paths[i]) for i in pending]
+            if not all(page_blocks):
+                return None
         else:
-            print(f"[VERIFICATION] Anthropic API error: {error_message}", flush=True)
-            return {"error": "anthropic_api_error", "message": f"Anthropic API error: {error_message}"}
+            merged_bytes = _extract_first_pages_as_pdf([file_paths[i] for i in pending])
+            if not merged_bytes:
+                return None
+            
+            pdf_base64 = base64.b64encode(merged_bytes).decode('ascii')
+            
+            log_debug(f"Merged first pages PDF size: {len(pdf_base64)} chars for {len(pending)} documents")
+            
+            page_blocks = [
+                {
+                    'type': 'document',
+                    'source': {
+                        'type': 'base64',
+                        'media_type': 'application/pdf',
+                        'data': pdf_base64,
+                    },
+                }
+            ]
+        
+        message = client.messages.create(
+            model="claude-sonnet-4-20250514",
+            max_tokens=max(1024, 128 * len(pending)),
+            messages=[
+                {
+                    'role': 'user',
+                    'content': [
+                        *page_blocks,
+                        {'type': 'text', 'text': _COMPANY_INFO_BATCH_PROMPT},
+                    ],
+                }
+            ],
+        )
+        
+        response_text = (message.content[0].text or '').strip()
+        verification_logger.debug("[VERIFICATION] Claude batch response: %s", response_text)
+        
+        page_infos = orjson.loads(extract_json_from_response(response_text))
+        
+        # Anything but exactly one object per page cannot be mapped back to the documents
+        if not isinstance(page_infos, list) or len(page_infos) != len(pending):
+            log_warning(f"Batch response does not match {len(pending)} pages, extracting per document")
+            return None
+        if not all(isinstance(page_info, dict) for page_info in page_infos):
+            log_warning("Batch response contains non-object entries, extracting per document")
+            return None
+        
+        pages = [page_info.get('page') for page_info in page_infos]
+        if all(page is not None for page in pages):
+            try:
+                pages = [int(page) for page in pages]
+            except (ValueError, TypeError):
+                pages = None
+            if pages is None or sorted(pages) != list(range(1, len(pending) + 1)):
+                log_warning("Batch response page numbers do not match, extracting per document")
+                return None
+            page_infos = [page_info for _, page_info in sorted(zip(pages, page_infos), key=lambda item: item[0])]
+        
+        for i, page_info in zip(pending, page_infos):
+            company_info = _validate_company_info(page_info)
+            _store_cached_company_info(document_hashes[i], company_info)
+            results[i] = company_info
+        
+        return results
+        
+    except orjson.JSONDecodeError as e:
+        log_error(f"Failed to parse batch JSON response: {e}")
+        return None
+    except anthropic.APIError as e:
+        # Same error for every document: the caller stops at the first one anyway
+        error_result = _anthropic_error_result(e)
+        return [error_result] * len(file_paths)
     except Exception as e:
-        print(f"[VERIFICATION] Error extracting company info: {str(e)}", flush=True)
+        log_error(f"Error extracting company info in batch: {str(e)}")
         return None
+
+@contextmanager
+def no_expire_on_commit(session):
+    """
+    Keep ORM objects loaded across commits inside the block, so reading an attribute
+    after db.session.commit() does not issue a SELECT to refresh the whole row.
+    
+    Args:
+        session: Session, or the scoped db.session proxy
+    """
+    if isinstance(session, scoped_session):
+        session = session()
+    previous = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        yield session
     finally:
-        # Clean up temporary first page PDF file
-        if temp_first_page_path and os.path.exists(temp_first_page_path):
-            try:
-                os.unlink(temp_first_page_path)
-                print(f"[VERIFICATION] Cleaned up temporary file: {temp_first_page_path}", flush=True)
-            except Exception as e:
-                print(f"[VERIFICATION] Warning: Failed to clean up temporary file {temp_first_page_path}: {e}", flush=True)
+        session.expire_on_commit = previous
+
+# Legal form tokens dropped from a company name before the looser name searches.
+# Lookarounds rather than \b so dotted forms like "S.A." still match at the end of the name.
+_LEGAL_SUFFIX_RE = re.compile(
+    r'(?<!\w)(?:S\.A\.R\.L\.?|S\.A\.S\.?|S\.A\.?|SARLAU|SARL|SASU|SAS|SNC|SA)(?!\w)',
+    re.IGNORECASE
+)
+_WS_RE = re.compile(r'\s+')
+
+def _company_name_variations(company_name: str) -> list:
+    """
+    Company name variations to search for, most specific first.
+    This handles cases like "G4S MAROC S.A." vs "G4S MAROC".
+    """
+    name = company_name.strip()
+    words = name.split()
+    variations = [
+        name,
+        _WS_RE.sub(' ', _LEGAL_SUFFIX_RE.sub('', name)).strip(),
+        words[0] if words else name
+    ]
+    # Deduplicate while keeping priority order; empty variations would match everything
+    return list(dict.fromkeys(v for v in variations if v))
+
+def _company_match_clauses(CompanyProfile, company_name: str):
+    """
+    Build the filter matching any name variation and the ordering that keeps the
+    variation priority in one query: the index of the first variation that hits, then
+    exact (case-insensitive) name matches ahead of names that merely contain it.
+    The ILIKE '%...%' filters are served by the pg_trgm GIN index on company_name.
+    
+    Returns:
+        tuple: (match_filter, variation_rank, match_order) where match_order is the
+        list of ORDER BY expressions, most recent profile last
+    """
+    company_variations = _company_name_variations(company_name)
+    log_debug_lazy(lambda: f"Company name variations: {company_variations}")
+    
+    variation_filters = [CompanyProfile.company_name.ilike(f'%{variation}%') for variation in company_variations]
+    variation_rank = case(
+        *[(condition, rank) for rank, condition in enumerate(variation_filters)],
+        else_=len(variation_filters)
+    )
+    # "G4S MAROC" should win over an older "G4S MAROC SECURITE" when both contain the name
+    exact_match = case(
+        (func.lower(CompanyProfile.company_name) == company_name.strip().lower(), 0),
+        else_=1
+    )
+    match_order = [variation_rank, exact_match, CompanyProfile.created_at.desc()]
+    return or_(*variation_filters), variation_rank, match_order
+
+def _find_profiles_by_company(db, CompanyProfile, company_name: str) -> list:
+    """
+    Look up the profiles matching a variation of the company name in a single query.
+    Only the rows callers use are returned: every profile matching the full company name,
+    plus the best match overall. Loose variations such as the first word alone can match
+    many unrelated profiles, which are ranked in the database and never loaded.
+    
+    Returns:
+        list of (profile, variation_rank) tuples, best match first; rank 0 means the
+        full company name matched. Each profile is a plain row with the metadata columns
+        callers read (id, company_name, fiscal_years, status, created_at), not an ORM object.
+    """
+    match_filter, variation_rank, match_order = _company_match_clauses(CompanyProfile, company_name)
+    ranked = db.session.query(
+        CompanyProfile.id,
+        CompanyProfile.company_name,
+        CompanyProfile.fiscal_years,
+        CompanyProfile.status,
+        CompanyProfile.created_at,
+        variation_rank.label('variation_rank'),
+        func.row_number().over(order_by=match_order).label('position')
+    ).filter(match_filter).subquery()
+    profile_rows = db.session.query(
+        ranked.c.id,
+        ranked.c.company_name,
+        ranked.c.fiscal_years,
+        ranked.c.status,
+        ranked.c.created_at,
+        ranked.c.variation_rank
+    ).filter(
+        or_(ranked.c.variation_rank == 0, ranked.c.position == 1)
+    ).order_by(ranked.c.position).all()
+    return [(profile, profile.variation_rank) for profile in profile_rows]
 
 def check_existing_profile(db, CompanyProfile, company_name: str, fiscal_year_range: Optional[str]) -> Optional[Dict[str, Any]]:
     """
@@ -241,67 +630,33 @@ def check_existing_profile(db, CompanyProfile, company_name: str, fiscal_year_ra
         Dict with existing profile data if found, None otherwise
     """
     try:
-        print(f"[VERIFICATION] Checking for existing profile: {company_name}, {fiscal_year_range}", flush=True)
+        verification_logger.debug("[VERIFICATION] Checking for existing profile: %s, %s", company_name, fiscal_year_range)
         
         if not company_name or not company_name.strip():
-            print(f"[VERIFICATION] Invalid company name provided", flush=True)
+            log_warning("Invalid company name provided")
             return None
             
-        # Try multiple company name variations to catch similar names
-        # This handles cases like "G4S MAROC S.A." vs "G4S MAROC"
-        company_variations = [
-            company_name.strip(),
-            company_name.strip().replace('S.A.', '').replace('SA', '').strip(),
-            company_name.strip().replace('SARL', '').strip(),
-            company_name.strip().split()[0] if company_name.strip().split() else company_name.strip()
-        ]
-        
-        existing_profile = None
-        for variation in company_variations:
-            if not variation:
-                continue
-                
-            print(f"[VERIFICATION] Trying company name variation: '{variation}'", flush=True)
-            
-            profiles = CompanyProfile.query.filter(
-                CompanyProfile.company_name.ilike(f'%{variation}%')
-            ).order_by(CompanyProfile.created_at.desc()).all()
-            
-            if profiles:
-                print(f"[VERIFICATION] Found {len(profiles)} potential matches for '{variation}'", flush=True)
-                # Use the most recent profile
-                existing_profile = profiles[0]
-                break
-                
-        if not existing_profile:
-            # Try a more flexible search with just the first word
-            first_word = company_name.strip().split()[0] if company_name.strip().split() else ""
-            if len(first_word) > 2:  # Only if first word is meaningful
-                print(f"[VERIFICATION] Trying flexible search with first word: '{first_word}'", flush=True)
-                profiles = CompanyProfile.query.filter(
-                    CompanyProfile.company_name.ilike(f'{first_word}%')
-                ).order_by(CompanyProfile.created_at.desc()).all()
-                
-                if profiles:
-                    print(f"[VERIFICATION] Found {len(profiles)} flexible matches for '{first_word}'", flush=True)
-                    existing_profile = profiles[0]
+        match_filter, _, match_order = _company_match_clauses(CompanyProfile, company_name)
+        existing_profile = CompanyProfile.query.filter(
+            match_filter
+        ).order_by(*match_order).first()
         
         if existing_profile:
-            print(f"[VERIFICATION] Found existing profile: {existing_profile.id} (fiscal_years: {existing_profile.fiscal_years})", flush=True)
+            verification_logger.debug("[VERIFICATION] Found existing profile: %s (fiscal_years: %s)", existing_profile.id, existing_profile.fiscal_years)
             
             # Check if this profile covers the requested fiscal year range
             if fiscal_year_range and existing_profile.fiscal_years:
                 covers_years = _profile_covers_fiscal_year(existing_profile.fiscal_years, fiscal_year_range)
                 if covers_years:
-                    print(f"[VERIFICATION] Profile already covers fiscal year range {fiscal_year_range}", flush=True)
+                    verification_logger.debug("[VERIFICATION] Profile already covers fiscal year range %s", fiscal_year_range)
                 else:
-                    print(f"[VERIFICATION] Profile found but does not cover fiscal year range {fiscal_year_range} - can be extended", flush=True)
+                    verification_logger.debug("[VERIFICATION] Profile found but does not cover fiscal year range %s - can be extended", fiscal_year_range)
             
             # Safely handle profile_data serialization
             try:
                 profile_data = existing_profile.profile_data or {}
             except Exception as e:
-                print(f"[VERIFICATION] Error accessing profile_data: {e}", flush=True)
+                log_error(f"Error accessing profile_data: {e}")
                 profile_data = {}
             
             result = {
@@ -319,10 +674,31 @@ def check_existing_profile(db, CompanyProfile, company_name: str, fiscal_year_ra
             return None
             
     except Exception as e:
-        print(f"[VERIFICATION] Error checking existing profile: {str(e)}", flush=True)
+        log_error(f"Error checking existing profile: {str(e)}")
         # Re-raise the exception so it can be handled by the calling function
         raise e
 
+def _parse_fiscal_year_range(fiscal_years: str) -> Optional[tuple]:
+    """
+    Parse a fiscal year ("2023") or year range ("2022-2023") into inclusive (start, end) years.
+    
+    Returns:
+        tuple: (start_year, end_year), or None if the value is not a valid year or range
+    """
+    fiscal_years = fiscal_years.strip()
+    if fiscal_years.isdigit():
+        # Single year (e.g., "2023")
+        year = int(fiscal_years)
+        return (year, year)
+    
+    # Year range (e.g., "2022-2023"); a reversed range covers no year
+    parts = fiscal_years.split('-')
+    if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+        start_year, end_year = int(parts[0]), int(parts[1])
+        if start_year <= end_year:
+            return (start_year, end_year)
+    return None
+
 def _profile_covers_fiscal_year(profile_fiscal_years: str, target_fiscal_years: str) -> bool:
     """
     Check if a profile's fiscal_years field covers a specific target fiscal year or range.
@@ -338,50 +714,30 @@ def _profile_covers_fiscal_year(profile_fiscal_years: str, target_fiscal_years:
         if not profile_fiscal_years or not target_fiscal_years:
             return False
         
-        profile_fiscal_years = profile_fiscal_years.strip()
-        target_fiscal_years = target_fiscal_years.strip()
-        
-        # Parse target fiscal years
-        target_years = set()
-        if target_fiscal_years.isdigit():
-            # Single year (e.g., "2023")
-            target_years.add(int(target_fiscal_years))
-        elif '-' in target_fiscal_years:
-            # Year range (e.g., "2022-2023")
-            parts = target_fiscal_years.split('-')
-            if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
-                start_year = int(parts[0])
-                end_year = int(parts[1])
-                for year in range(start_year, end_year + 1):
-                    target_years.add(year)
-        
-        if not target_years:
+        target_range = _parse_fiscal_year_range(target_fiscal_years)
+        if not target_range:
             return False
         
-        # Parse profile fiscal years
-        profile_years = set()
-        if profile_fiscal_years.isdigit():
-            # Single year (e.g., "2023")
-            profile_years.add(int(profile_fiscal_years))
-        elif '-' in profile_fiscal_years:
-            # Year range (e.g., "2022-2023")
-            parts = profile_fiscal_years.split('-')
-            if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
-                start_year = int(parts[0])
-                end_year = int(parts[1])
-                for year in range(start_year, end_year + 1):
-                    profile_years.add(year)
-        
-        if not profile_years:
+        profile_range = _parse_fiscal_year_range(profile_fiscal_years)
+        if not profile_range:
             return False
         
-        # Check if profile covers all target years
-        return target_years.issubset(profile_years)
+        # Both ranges are contiguous: the profile covers all target years iff it encloses the target range
+        return profile_range[0] <= target_range[0] and target_range[1] <= profile_range[1]
         
     except Exception as e:
-        print(f"[VERIFICATION] Error checking fiscal year coverage: {e}", flush=True)
+        log_error(f"Error checking fiscal year coverage: {e}")
         return False
 
+# Upper bound on uploaded files hashed concurrently by identify_new_vs_existing_documents
+HASH_MAX_WORKERS = 8
+
+# Document hashes keyed by (device, inode, size, mtime): the same file is hashed again by
+# the extraction cache, the batched extraction and the dedup loop of one verification
+DOCUMENT_HASH_CACHE_MAXSIZE = 1024
+_document_hash_cache = OrderedDict()
+_document_hash_cache_lock = threading.Lock()
+
 def calculate_document_hash(file_path: str) -> str:
     """
     Calculate a hash of the document content to identify duplicate documents.
@@ -390,17 +746,34 @@ def calculate_document_hash(file_path: str) -> str:
         file_path (str): Path to the document file
         
     Returns:
-        str: SHA-256 hash of the document content
+        str: BLAKE3 hash of the document content
     """
     try:
-        with open(file_path, 'rb') as f:
-            content = f.read()
-            return hashlib.sha256(content).hexdigest()
+        file_stat = os.stat(file_path)
+        stat_key = (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+        with _document_hash_cache_lock:
+            document_hash = _document_hash_cache.get(stat_key)
+            if document_hash is not None:
+                _document_hash_cache.move_to_end(stat_key)
+                return document_hash
+        
+        # The file is memory-mapped and hashed in native code (SIMD, several threads for
+        # large files) with the GIL released
+        digest = blake3(max_threads=blake3.AUTO)
+        digest.update_mmap(file_path)
+        document_hash = digest.hexdigest()
+        
+        with _document_hash_cache_lock:
+            _document_hash_cache[stat_key] = document_hash
+            _document_hash_cache.move_to_end(stat_key)
+            while len(_document_hash_cache) > DOCUMENT_HASH_CACHE_MAXSIZE:
+                _document_hash_cache.popitem(last=False)
+        return document_hash
     except Exception as e:
-        print(f"[VERIFICATION] Error calculating document hash: {e}", flush=True)
+        log_error(f"Error calculating document hash: {e}")
         return None
 
-def check_existing_documents(db, CompanyProfile, company_name: str) -> Dict[str, Any]:
+def check_existing_documents(db, CompanyProfile, company_name: str, profile_matches: Optional[list] = None) -> Dict[str, Any]:
     """
     Check if documents for this company already exist in the database.
     
@@ -408,45 +781,21 @@ def check_existing_documents(db, CompanyProfile, company_name: str) -> Dict[str,
         db: Database session
         CompanyProfile: CompanyProfile model class
         company_name (str): Company name to search for
+        profile_matches (list, optional): Result of _find_profiles_by_company when the caller
+            already ran the lookup
         
     Returns:
         Dict with existing document information if found
     """
-    try:        
-        # Try multiple company name variations to catch similar names
-        variations = [
-            company_name.strip(),
-            company_name.strip().replace('S.A.', '').replace('SA', '').strip(),
-            company_name.strip().replace('SARL', '').strip(),
-            company_name.strip().split()[0] if company_name.strip().split() else company_name.strip()
-        ]
-        
-        # Remove duplicates while preserving order
-        company_variations = []
-        seen = set()
-        for variation in variations:
-            if variation and variation not in seen:
-                company_variations.append(variation)
-                seen.add(variation)
-        
-        log_debug(f"Generated {len(company_variations)} unique company name variations: {company_variations}")
+    try:
+        if profile_matches is None:
+            profile_matches = _find_profiles_by_company(db, CompanyProfile, company_name)
         
         existing_profile = None
-        for variation in company_variations:
-            if not variation:
-                continue
-                
-            log_debug(f"Trying company name variation: '{variation}'")
-            
-            profiles = CompanyProfile.query.filter(
-                CompanyProfile.company_name.ilike(f'%{variation}%')
-            ).order_by(CompanyProfile.created_at.desc()).all()
-            
-            if profiles:
-                log_info(f"Found {len(profiles)} potential matches for '{variation}'")
-                # Use the most recent profile
-                existing_profile = profiles[0]
-                break
+        if profile_matches:
+            verification_logger.debug("[VERIFICATION] Found %s profiles matching the full name or best variation of '%s'", len(profile_matches), company_name)
+            # Use the most recent profile of the best-ranked variation
+            existing_profile = profile_matches[0][0]
         
         if existing_profile:
             log_success(f"Found existing profile: {existing_profile.id} (fiscal_years: {existing_profile.fiscal_years})")
@@ -463,7 +812,7 @@ def check_existing_documents(db, CompanyProfile, company_name: str) -> Dict[str,
         return None
         
     except Exception as e:
-        print(f"[VERIFICATION] Error checking existing documents: {str(e)}", flush=True)
+        log_error(f"Error checking existing documents: {str(e)}")
         return None
 
 def should_create_new_profile(existing_profile: Dict[str, Any], target_fiscal_years: str) -> bool:
@@ -482,22 +831,44 @@ def should_create_new_profile(existing_profile: Dict[str, Any], target_fiscal_ye
             return True
         
         existing_fiscal_years = existing_profile['fiscal_years']
-        print(f"[VERIFICATION] Comparing existing fiscal years '{existing_fiscal_years}' with target '{target_fiscal_years}'", flush=True)
+        verification_logger.debug("[VERIFICATION] Comparing existing fiscal years '%s' with target '%s'", existing_fiscal_years, target_fiscal_years)
         
         # Check if existing profile covers the target fiscal years
         covers_target = _profile_covers_fiscal_year(existing_fiscal_years, target_fiscal_years)
         
         if covers_target:
-            print(f"[VERIFICATION] Existing profile already covers target fiscal years - no new profile needed", flush=True)
+            verification_logger.debug("[VERIFICATION] Existing profile already covers target fiscal years - no new profile needed")
             return False
         else:
-            print(f"[VERIFICATION] Existing profile does not cover target fiscal years - new profile needed", flush=True)
+            verification_logger.debug("[VERIFICATION] Existing profile does not cover target fiscal years - new profile needed")
             return True
             
     except Exception as e:
-        print(f"[VERIFICATION] Error determining if new profile needed: {e}", flush=True)
+        log_error(f"Error determining if new profile needed: {e}")
         return True
 
+# Successful verification results keyed by (fallback company name, requested fiscal years,
+# document hashes in upload order), so a retried verification of the same documents skips the
+# extraction and the lookups. Kept briefly and cleared whenever profiles or documents are written
+VERIFICATION_CACHE_TTL_SECONDS = float(os.getenv("PROFILIA_VERIFY_CACHE_TTL", "60"))
+VERIFICATION_CACHE_MAXSIZE = 128
+_verification_cache = OrderedDict()
+_verification_cache_lock = threading.Lock()
+
+def invalidate_verification_cache() -> None:
+    """Drop all cached verification results; call after writing profiles or documents."""
+    with _verification_cache_lock:
+        _verification_cache.clear()
+
+def _with_file_paths(result: Dict[str, Any], file_paths: list) -> Dict[str, Any]:
+    """Copy of a cached result whose document entries point at this call's file paths."""
+    result = copy.deepcopy(result)
+    document_analysis = result.get('document_analysis') or {}
+    for entry in document_analysis.get('new_documents', []) + document_analysis.get('existing_matches', []):
+        if entry.get('index') is not None and entry['index'] < len(file_paths):
+            entry['file_path'] = file_paths[entry['index']]
+    return result
+
 def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyProfile, fallback_company_name: str = None) -> Dict[str, Any]:
     """
     Main verification function that combines extraction and existence check.
@@ -513,6 +884,33 @@ def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyPr
     Returns:
         Dict with verification results
     """
+    cache_key = None
+    if VERIFICATION_CACHE_TTL_SECONDS > 0 and file_paths:
+        file_hashes = tuple(calculate_document_hash(file_path) for file_path in file_paths)
+        if all(file_hashes):
+            cache_key = (fallback_company_name, file_hashes)
+    
+    if cache_key is not None:
+        with _verification_cache_lock:
+            cached = _verification_cache.get(cache_key)
+            if cached is not None and cached[0] > time.monotonic():
+                _verification_cache.move_to_end(cache_key)
+                verification_logger.debug("[VERIFICATION] Reusing verification result cached for %s documents", len(file_paths))
+                return _with_file_paths(cached[1], file_paths)
+            _verification_cache.pop(cache_key, None)
+    
+    result = _verify_profile_uncached(file_paths, api_key, db, CompanyProfile, fallback_company_name)
+    
+    if cache_key is not None and result.get('success'):
+        with _verification_cache_lock:
+            _verification_cache[cache_key] = (time.monotonic() + VERIFICATION_CACHE_TTL_SECONDS, copy.deepcopy(result))
+            _verification_cache.move_to_end(cache_key)
+            while len(_verification_cache) > VERIFICATION_CACHE_MAXSIZE:
+                _verification_cache.popitem(last=False)
+    return result
+
+def _verify_profile_uncached(file_paths: list, api_key: str, db, CompanyProfile, fallback_company_name: str = None) -> Dict[str, Any]:
+    """Body of verify_profile_before_creation, without the result cache."""
     try:
         # print(f"[VERIFICATION] Starting profile verification for {len(file_paths)} documents", flush=True)
         
@@ -521,18 +919,32 @@ def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyPr
         company_names = set()
         fiscal_years = set()
         
+        # Several documents: read all their first pages in a single Claude call
+        extraction_results = None
+        if len(file_paths) > 1:
+            extraction_results = extract_company_info_from_first_pages(file_paths, api_key)
+        
+        if extraction_results is None:
+            # Each extraction is an independent Claude round trip: run them all at once and
+            # consume the results in document order
+            with ThreadPoolExecutor(max_workers=max(1, min(EXTRACT_MAX_WORKERS, len(file_paths)))) as executor:
+                extraction_results = list(executor.map(
+                    lambda file_path: extract_company_info_from_first_page(file_path, api_key),
+                    file_paths
+                ))
+        
         for i, file_path in enumerate(file_paths):
-            print(f"[VERIFICATION] Processing document {i+1}/{len(file_paths)}: {file_path}", flush=True)
+            verification_logger.debug("[VERIFICATION] Processing document %s/%s: %s", i+1, len(file_paths), file_path)
             
-            company_info = extract_company_info_from_first_page(file_path, api_key)
+            company_info = extraction_results[i]
             if company_info and not isinstance(company_info, dict):
                 # Handle case where extract_company_info_from_first_page returns None
-                print(f"[VERIFICATION] Failed to extract info from document {i+1}", flush=True)
+                log_warning(f"Failed to extract info from document {i+1}")
             elif company_info and company_info.get('error'):
                 # Handle API errors from Anthropic
                 error_type = company_info.get('error')
                 error_message = company_info.get('message', 'Unknown API error')
-                print(f"[VERIFICATION] API error for document {i+1}: {error_type} - {error_message}", flush=True)
+                log_warning(f"API error for document {i+1}: {error_type} - {error_message}")
                 
                 # If it's an overloaded error, return it immediately
                 if error_type == 'anthropic_overloaded':
@@ -579,12 +991,12 @@ def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyPr
                 
                 
             else:
-                print(f"[VERIFICATION] Failed to extract info from document {i+1}", flush=True)
+                log_warning(f"Failed to extract info from document {i+1}")
         
         if not all_company_info:
             # If no company info extracted but we have a fallback, use it
             if fallback_company_name:
-                print(f"[VERIFICATION] No company info extracted, using fallback: {fallback_company_name}", flush=True)
+                verification_logger.debug("[VERIFICATION] No company info extracted, using fallback: %s", fallback_company_name)
                 # Create a minimal company info with fallback name
                 all_company_info = [{'company_name': fallback_company_name, 'fiscal_year': None}]
                 company_names.add(fallback_company_name)
@@ -605,21 +1017,21 @@ def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyPr
             # Different company names detected - use the most common or first one
             # For now, use the first one and log a warning
             primary_company_name = list(company_names)[0]
-            print(f"[VERIFICATION] Warning: Different company names detected: {company_names}. Using: {primary_company_name}", flush=True)
+            log_warning(f"Different company names detected: {company_names}. Using: {primary_company_name}")
         elif len(company_names) == 0 and fallback_company_name:
             # No company names extracted but we have a fallback
             primary_company_name = fallback_company_name
-            print(f"[VERIFICATION] No company names extracted, using fallback: {primary_company_name}", flush=True)
+            verification_logger.debug("[VERIFICATION] No company names extracted, using fallback: %s", primary_company_name)
         
         # Create fiscal year range
         fiscal_year_range = None
         if fiscal_years:
-            sorted_years = sorted(list(fiscal_years))
-            if len(sorted_years) == 1:
-                fiscal_year_range = str(sorted_years[0])
+            first_year, last_year = min(fiscal_years), max(fiscal_years)
+            if first_year == last_year:
+                fiscal_year_range = str(first_year)
             else:
                 # Create range like "2022-2023"
-                fiscal_year_range = f"{sorted_years[0]}-{sorted_years[-1]}"
+                fiscal_year_range = f"{first_year}-{last_year}"
         
         
         
@@ -631,27 +1043,41 @@ def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyPr
                 'existing_profile': None
             }
         
+        # Look the company up once and share the matches between steps 3 and 4
+        try:
+            profile_matches = _find_profiles_by_company(db, CompanyProfile, primary_company_name)
+        except Exception as e:
+            log_warning(f"Company profile lookup failed: {e}")
+            profile_matches = None
+        
         # Step 3: Check if documents for this company already exist
-        existing_profile = check_existing_documents(db, CompanyProfile, primary_company_name)
+        existing_profile = check_existing_documents(db, CompanyProfile, primary_company_name, profile_matches)
         
         # Step 4: Identify which documents are new vs existing
+        # Profiles matching the full company name (rank 0) are the ones its own query would find
+        full_name_profiles = None
+        if profile_matches is not None:
+            full_name_profiles = [profile for profile, rank in profile_matches if rank == 0]
         # print(f"[VERIFICATION] Starting document analysis for {len(file_paths)} files", flush=True)
-        document_analysis = identify_new_vs_existing_documents(db, CompanyProfile, file_paths, primary_company_name, all_company_info)
+        document_analysis = identify_new_vs_existing_documents(
+            db, CompanyProfile, file_paths, primary_company_name, all_company_info,
+            existing_profiles=full_name_profiles
+        )
         
-        print(f"[VERIFICATION] Document analysis result: {document_analysis['total_new']} new, {document_analysis['total_existing']} existing", flush=True)
+        verification_logger.debug("[VERIFICATION] Document analysis result: %s new, %s existing", document_analysis['total_new'], document_analysis['total_existing'])
         
         # Step 5: Determine if we should create a new profile or show existing one
         should_create_new = True
         if existing_profile:
-            print(f"[VERIFICATION] Found existing profile with fiscal years: {existing_profile.get('fiscal_years')}", flush=True)
+            verification_logger.debug("[VERIFICATION] Found existing profile with fiscal years: %s", existing_profile.get('fiscal_years'))
             should_create_new = should_create_new_profile(existing_profile, fiscal_year_range)
             
             if should_create_new:
-                print(f"[VERIFICATION] Existing profile found but does not cover target fiscal years '{fiscal_year_range}' - will create new profile", flush=True)
+                verification_logger.debug("[VERIFICATION] Existing profile found but does not cover target fiscal years '%s' - will create new profile", fiscal_year_range)
                 # Don't show existing profile since user wants a more comprehensive one
                 existing_profile = None
             else:
-                print(f"[VERIFICATION] Existing profile already covers target fiscal years '{fiscal_year_range}' - no new profile needed", flush=True)
+                verification_logger.debug("[VERIFICATION] Existing profile already covers target fiscal years '%s' - no new profile needed", fiscal_year_range)
         
         # Create combined extracted info
         combined_extracted_info = {
@@ -672,7 +1098,7 @@ def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyPr
         }
         
     except Exception as e:
-        print(f"[VERIFICATION] Error in profile verification: {str(e)}", flush=True)
+        log_error(f"Error in profile verification: {str(e)}")
         return {
             'success': False,
             'error': f'Verification failed: {str(e)}',
@@ -680,7 +1106,18 @@ def verify_profile_before_creation(file_paths: list, api_key: str, db, CompanyPr
             'existing_profile': None
         }
 
-def identify_new_vs_existing_documents(db, CompanyProfile, file_paths: list, company_name: str, all_company_info: list) -> Dict[str, Any]:
+# Existing documents joined to their profile; callers append the WHERE clause selecting the profiles.
+# The stored markdown is left out of extracted_data: these rows are returned in the verification
+# responses and copied into reused documents, which only need the extracted figures
+_EXISTING_DOCUMENTS_SQL = (
+    "SELECT p.id AS profile_id, p.fiscal_years, d.file_name, d.file_path, d.file_hash, "
+    "CASE WHEN jsonb_typeof(d.extracted_data) = 'object' THEN d.extracted_data - 'markdown' "
+    "ELSE d.extracted_data END AS extracted_data "
+    "FROM company_profiles p JOIN liasse_documents d ON d.profile_id = p.id "
+)
+
+def identify_new_vs_existing_documents(db, CompanyProfile, file_paths: list, company_name: str, all_company_info: list,
+                                       existing_profiles: Optional[list] = None) -> Dict[str, Any]:
     """
     Identify which documents are new vs existing to avoid reprocessing.
     
@@ -689,105 +1126,87 @@ def identify_new_vs_existing_documents(db, CompanyProfile, file_paths: list, com
         CompanyProfile: CompanyProfile model class
         file_paths: List of file paths to check
         company_name: Company name to search for
+        existing_profiles: Profiles already matched on company_name by the caller, if any
         
     Returns:
         Dict with new and existing document information
     """
     try:
         
-        # Find existing profiles for this company
-        existing_profiles = CompanyProfile.query.filter(
-            CompanyProfile.company_name.ilike(f'%{company_name}%')
-        ).all()
-        
-        existing_documents = []
-        for profile in existing_profiles:
-            # Get documents associated with this profile
-            # Note: LiasseDocument model will be passed from the calling function
-            # For now, we'll use a simple approach to avoid import issues
+        # Documents of the existing profiles for this company, with each profile's fiscal years,
+        # fetched in one round trip instead of one query per profile
+        document_rows = []
+        try:
+            if existing_profiles is None:
+                document_rows = db.session.execute(
+                    text(_EXISTING_DOCUMENTS_SQL + "WHERE p.company_name ILIKE :company_name"),
+                    {"company_name": f'%{company_name}%'}
+                ).mappings().all()
+            elif existing_profiles:
+                document_rows = db.session.execute(
+                    text(_EXISTING_DOCUMENTS_SQL + "WHERE p.id IN :profile_ids").bindparams(
+                        bindparam('profile_ids', expanding=True)
+                    ),
+                    {"profile_ids": [str(profile.id) for profile in existing_profiles]}
+                ).mappings().all()
+        except Exception as e:
+            log_warning(f"Could not fetch existing documents for '{company_name}': {e}")
+        
+        # Plain dicts (the rows end up in the JSON response), columns as named in the query
+        existing_documents = [dict(row, profile_id=str(row['profile_id'])) for row in document_rows]
+        
+        verification_logger.debug("[VERIFICATION] Found %s existing documents across %s profiles", len(existing_documents), len({doc['profile_id'] for doc in existing_documents}))
+        
+        current_company = company_name.strip().lower()
+        current_company_compact = current_company.replace(' ', '')
+        
+        # Parse each existing document's extracted_data once, not once per uploaded file. The
+        # company check does not depend on the uploaded file, so documents of a matching company
+        # are indexed by fiscal year (first one wins) for constant-time content matching
+        existing_by_fiscal_year = {}
+        for i, doc in enumerate(existing_documents):
+            verification_logger.debug("[VERIFICATION] Existing doc %s: profile_id=%s, filename=%s, fiscal_years=%s", i+1, doc.get('profile_id'), doc.get('file_name'), doc.get('fiscal_years'))
+            if not doc.get('extracted_data'):
+                continue
             try:
-                # Try to get documents using the profile ID
-                profile_docs = db.session.execute(
-                    text("SELECT * FROM liasse_documents WHERE profile_id = :profile_id"),
-                    {"profile_id": str(profile.id)}
-                ).fetchall()
-                
-                print(f"[VERIFICATION] Found {len(profile_docs)} documents for profile {profile.id}", flush=True)
-                
-                for doc in profile_docs:
-                    # Handle both SQLAlchemy Row objects and dict-like objects
-                    if hasattr(doc, '_mapping'):
-                        # SQLAlchemy 2.0 Row object
-                        doc_dict = dict(doc._mapping)
-                    elif hasattr(doc, '__dict__'):
-                        # Regular object
-                        doc_dict = doc.__dict__
-                    else:
-                        # Assume it's already a dict
-                        doc_dict = doc
-                    
-                    existing_documents.append({
-                        'profile_id': str(profile.id),
-                        'fiscal_years': profile.fiscal_years,
-                        'file_name': doc_dict.get('file_name'),
-                        'file_path': doc_dict.get('file_path'),
-                        'extracted_data': doc_dict.get('extracted_data')
-                    })
-                    
-                    print(f"[VERIFICATION] Added document: {doc_dict.get('file_name')} with extracted_data: {doc_dict.get('extracted_data') is not None}", flush=True)
-                    
+                extracted = doc['extracted_data']
+                if isinstance(extracted, str):
+                    extracted = json.loads(extract_json_from_response(extracted))
+                verification_logger.debug("[VERIFICATION]   Extracted data: company=%s, fiscal_year=%s", extracted.get('company_name'), extracted.get('fiscal_year'))
+                existing_company = extracted.get('company_name', '').strip().lower()
+                existing_fiscal = extracted.get('fiscal_year')
             except Exception as e:
-                print(f"[VERIFICATION] Warning: Could not fetch documents for profile {profile.id}: {e}", flush=True)
-                # Try alternative approach - direct table access
-                try:
-                    from sqlalchemy import inspect
-                    inspector = inspect(db.engine)
-                    if 'liasse_documents' in inspector.get_table_names():
-                        print(f"[VERIFICATION] Table 'liasse_documents' exists, trying direct query", flush=True)
-                        # Fallback to a simpler query
-                        result = db.session.execute(
-                            text("SELECT file_name, file_path, extracted_data FROM liasse_documents WHERE profile_id = :profile_id"),
-                            {"profile_id": str(profile.id)}
-                        )
-                        fallback_docs = result.fetchall()
-                        print(f"[VERIFICATION] Fallback query found {len(fallback_docs)} documents", flush=True)
-                        
-                        for doc in fallback_docs:
-                            existing_documents.append({
-                                'profile_id': str(profile.id),
-                                'fiscal_years': profile.fiscal_years,
-                                'file_name': doc[0] if len(doc) > 0 else None,
-                                'file_path': doc[1] if len(doc) > 1 else None,
-                                'extracted_data': doc[2] if len(doc) > 2 else None
-                            })
-                    else:
-                        print(f"[VERIFICATION] Table 'liasse_documents' does not exist", flush=True)
-                except Exception as fallback_error:
-                    print(f"[VERIFICATION] Fallback approach also failed: {fallback_error}", flush=True)
+                log_warning(f"Could not parse extracted data of {doc.get('file_name')}: {e}")
                 continue
+            
+            if not existing_fiscal or isinstance(existing_fiscal, (list, dict)):
+                continue
+            # Simple similarity check (you could make this more sophisticated)
+            if (existing_company in current_company or
+                current_company in existing_company or
+                existing_company.replace(' ', '') == current_company_compact):
+                existing_by_fiscal_year.setdefault(existing_fiscal, doc)
+        
+        # Existing documents by content hash and by file name (first one wins) for constant-time matching
+        existing_by_hash = {}
+        existing_by_file_name = {}
+        for doc in existing_documents:
+            if doc.get('file_hash'):
+                existing_by_hash.setdefault(doc['file_hash'], doc)
+            if doc.get('file_name'):
+                existing_by_file_name.setdefault(doc['file_name'], doc)
+        
+        # Calculate hashes for uploaded files to compare with existing ones; BLAKE3 releases
+        # the GIL, so the files are read and hashed in parallel
+        with ThreadPoolExecutor(max_workers=max(1, min(HASH_MAX_WORKERS, len(file_paths)))) as executor:
+            file_hashes = list(executor.map(calculate_document_hash, file_paths))
         
-        print(f"[VERIFICATION] Found {len(existing_documents)} existing documents across {len(existing_profiles)} profiles", flush=True)
-        
-        # Debug: Log existing documents for troubleshooting
-        for i, doc in enumerate(existing_documents):
-            print(f"[VERIFICATION] Existing doc {i+1}: profile_id={doc.get('profile_id')}, filename={doc.get('file_name')}, fiscal_years={doc.get('fiscal_years')}", flush=True)
-            if doc.get('extracted_data'):
-                try:
-                    extracted = doc['extracted_data']
-                    if isinstance(extracted, str):
-                        extracted = json.loads(extract_json_from_response(extracted))
-                    print(f"[VERIFICATION]   Extracted data: company={extracted.get('company_name')}, fiscal_year={extracted.get('fiscal_year')}", flush=True)
-                except Exception as e:
-                    print(f"[VERIFICATION]   Could not parse extracted data: {e}", flush=True)
-        
-        # Calculate hashes for uploaded files to compare with existing ones
         new_documents = []
         existing_matches = []
         
-        for i, file_path in enumerate(file_paths):
-            file_hash = calculate_document_hash(file_path)
+        for i, (file_path, file_hash) in enumerate(zip(file_paths, file_hashes)):
             if not file_hash:
-                print(f"[VERIFICATION] Could not calculate hash for file {i+1}, treating as new", flush=True)
+                log_warning(f"Could not calculate hash for file {i+1}, treating as new")
                 new_documents.append({
                     'index': i,
                     'file_path': file_path,
@@ -795,64 +1214,53 @@ def identify_new_vs_existing_documents(db, CompanyProfile, file_paths: list, com
                 })
                 continue
             
-            # Check if this document already exists
-            is_existing = False
-            for existing_doc in existing_documents:
-                # Check multiple criteria for matching:
-                # 1. File name match (exact)
-                # 2. Company name and fiscal year match (content-based)
-                # 3. File hash match (if available)
-                
-                # File name matching
-                if existing_doc.get('file_name') and os.path.basename(file_path) == existing_doc['file_name']:
-                    print(f"[VERIFICATION] Document {i+1} matches existing document by filename: {existing_doc['file_name']}", flush=True)
-                    existing_matches.append({
-                        'index': i,
-                        'file_path': file_path,
-                        'existing_data': existing_doc,
-                        'reason': 'file_name_match'
-                    })
-                    is_existing = True
-                    break
-                
-                # Content-based matching (company name + fiscal year)
-                # This helps catch cases where the same document might have different filenames
-                if existing_doc.get('extracted_data'):
-                    try:
-                        existing_extracted = existing_doc['extracted_data']
-                        if isinstance(existing_extracted, str):
-                            existing_extracted = json.loads(extract_json_from_response(existing_extracted))
-                        
-                        # Check if company names are similar
-                        existing_company = existing_extracted.get('company_name', '').strip().lower()
-                        current_company = company_name.strip().lower()
-                        
-                        # Simple similarity check (you could make this more sophisticated)
-                        if (existing_company in current_company or 
-                            current_company in existing_company or
-                            existing_company.replace(' ', '') == current_company.replace(' ', '')):
-                            
-                            # Check if fiscal years match
-                            existing_fiscal = existing_extracted.get('fiscal_year')
-                            if existing_fiscal:
-                                # Get the current document's fiscal year from the already extracted info
-                                current_doc_info = all_company_info[i] if i < len(all_company_info) else None
-                                if current_doc_info and current_doc_info.get('fiscal_year') == existing_fiscal:
-                                    print(f"[VERIFICATION] Document {i+1} matches existing document by content: company={existing_company}, fiscal_year={existing_fiscal}", flush=True)
-                                    existing_matches.append({
-                                        'index': i,
-                                        'file_path': file_path,
-                                        'existing_data': existing_doc,
-                                        'reason': 'content_match'
-                                    })
-                                    is_existing = True
-                                    break
-                    except Exception as e:
-                        print(f"[VERIFICATION] Warning: Error checking content match: {e}", flush=True)
-                        continue
+            file_name = os.path.basename(file_path)
+            # Get the current document's fiscal year from the already extracted info
+            current_doc_info = all_company_info[i] if i < len(all_company_info) else None
+            current_fiscal = current_doc_info.get('fiscal_year') if current_doc_info else None
+            
+            # Check multiple criteria for matching:
+            # 1. File hash match (identical bytes, documents stored with a hash)
+            # 2. File name match (exact)
+            # 3. Company name and fiscal year match (content-based)
+            
+            # File hash matching
+            existing_doc = existing_by_hash.get(file_hash)
+            if existing_doc:
+                verification_logger.debug("[VERIFICATION] Document %s matches existing document by hash: %s", i+1, existing_doc['file_name'])
+                existing_matches.append({
+                    'index': i,
+                    'file_path': file_path,
+                    'existing_data': existing_doc,
+                    'reason': 'file_hash_match'
+                })
+                continue
             
-            if not is_existing:
-                print(f"[VERIFICATION] Document {i+1} is new: {os.path.basename(file_path)}", flush=True)
+            # File name matching
+            existing_doc = existing_by_file_name.get(file_name)
+            if existing_doc:
+                verification_logger.debug("[VERIFICATION] Document %s matches existing document by filename: %s", i+1, existing_doc['file_name'])
+                existing_matches.append({
+                    'index': i,
+                    'file_path': file_path,
+                    'existing_data': existing_doc,
+                    'reason': 'file_name_match'
+                })
+                continue
+            
+            # Content-based matching (company name + fiscal year)
+            # This helps catch cases where the same document might have different filenames
+            existing_doc = existing_by_fiscal_year.get(current_fiscal) if current_fiscal else None
+            if existing_doc:
+                verification_logger.debug("[VERIFICATION] Document %s matches existing document by content: company=%s, fiscal_year=%s", i+1, current_company, current_fiscal)
+                existing_matches.append({
+                    'index': i,
+                    'file_path': file_path,
+                    'existing_data': existing_doc,
+                    'reason': 'content_match'
+                })
+            else:
+                verification_logger.debug("[VERIFICATION] Document %s is new: %s", i+1, file_name)
                 new_documents.append({
                     'index': i,
                     'file_path': file_path,
@@ -870,7 +1278,7 @@ def identify_new_vs_existing_documents(db, CompanyProfile, file_paths: list, com
         return result
         
     except Exception as e:
-        print(f"[VERIFICATION] Error identifying new vs existing documents: {str(e)}", flush=True)
+        log_error(f"Error identifying new vs existing documents: {str(e)}")
         # Fallback: treat all documents as new
         return {
             'new_documents': [{'index': i, 'file_path': path, 'reason': 'error_fallback'} for i, path in enumerate(file_paths)],
@@ -906,12 +1314,14 @@ def compare_company_names(profile_company_name: str, document_company_names: lis
         profile_clean = _normalize_company_name(profile_company_name)
         document_clean_list = [_normalize_company_name(name) for name in document_company_names if name]
         
-        print(f"[VERIFICATION] Normalized names - Profile: '{profile_clean}', Documents: {document_clean_list}", flush=True)
+        verification_logger.debug("[VERIFICATION] Normalized names - Profile: '%s', Documents: %s", profile_clean, document_clean_list)
         
-        # Check for exact matches
-        exact_matches = [name for name in document_clean_list if name == profile_clean]
+        # Distinct document names keyed in upload order: a single hash lookup for the exact
+        # match, and each name is compared only once below
+        document_clean_names = dict.fromkeys(document_clean_list)
         
-        if exact_matches:
+        # Check for exact matches
+        if profile_clean in document_clean_names:
             return {
                 'match': True,
                 'reason': 'Exact company name match found',
@@ -922,10 +1332,10 @@ def compare_company_names(profile_company_name: str, document_company_names: lis
             }
         
         # Check for partial matches (one company name contains the other)
-        partial_matches = []
-        for doc_name in document_clean_list:
-            if (doc_name in profile_clean or profile_clean in doc_name) and len(doc_name) > 3 and len(profile_clean) > 3:
-                partial_matches.append(doc_name)
+        partial_matches = [
+            doc_name for doc_name in document_clean_names
+            if len(doc_name) > 3 and (doc_name in profile_clean or profile_clean in doc_name)
+        ] if len(profile_clean) > 3 else []
         
         if partial_matches:
             return {
@@ -938,16 +1348,18 @@ def compare_company_names(profile_company_name: str, document_company_names: lis
                 'recommendation': 'Partial company name match - recommend user confirmation'
             }
         
-        # Check for similar names using fuzzy matching
-        similar_names = []
-        for doc_name in document_clean_list:
-            similarity = _calculate_name_similarity(profile_clean, doc_name)
-            if similarity > 0.7:  # 70% similarity threshold
-                similar_names.append((doc_name, similarity))
+        # Check for similar names using fuzzy matching (70% similarity threshold);
+        # process.extract scores every name in C and returns them best first
+        similar_names = [
+            (doc_name, score / 100.0)
+            for doc_name, score, _ in process.extract(
+                profile_clean, list(document_clean_names), scorer=fuzz.token_set_ratio,
+                score_cutoff=70, limit=None
+            )
+            if score > 70
+        ]
         
         if similar_names:
-            # Sort by similarity
-            similar_names.sort(key=lambda x: x[1], reverse=True)
             return {
                 'match': False,
                 'reason': 'Similar company names found',
@@ -969,7 +1381,7 @@ def compare_company_names(profile_company_name: str, document_company_names: lis
         }
         
     except Exception as e:
-        print(f"[VERIFICATION] Error comparing company names: {str(e)}", flush=True)
+        log_error(f"Error comparing company names: {str(e)}")
         return {
             'match': False,
             'reason': f'Error during comparison: {str(e)}',
@@ -979,6 +1391,29 @@ def compare_company_names(profile_company_name: str, document_company_names: lis
             'recommendation': 'Error during company name comparison - recommend user confirmation'
         }
 
+# Common legal suffixes including Moroccan company types, stripped by _normalize_company_name
+_NORMALIZE_SUFFIXES = [
+    'S.A.', 'S.A', 'SA', 'SARL', 'SARLAU', 'SAS', 'SASU', 'EURL', 'SNC', 'SCA', 'SCS',
+    'SOCIETE ANONYME', 'SOCIETE A RESPONSABILITE LIMITEE',
+    'SOCIETE EN NOM COLLECTIF', 'SOCIETE EN COMMANDITE SIMPLE',
+    'SOCIETE EN COMMANDITE PAR ACTIONS',
+    # Moroccan specific company types
+    'SOCIETE A RESPONSABILITE LIMITEE UNIPERSONNELLE', 'SOCIETE CIVILE',
+    'SOCIETE CIVILE IMMOBILIERE', 'SOCIETE CIVILE PROFESSIONNELLE',
+    'GROUPEMENT D INTERET ECONOMIQUE', 'GIE',
+    'ETABLISSEMENT PUBLIC', 'EP', 'ETABLISSEMENT PUBLIC A CARACTERE INDUSTRIEL ET COMMERCIAL',
+    'EPIC', 'ETABLISSEMENT PUBLIC A CARACTERE ADMINISTRATIF', 'EPA',
+    'COOPERATIVE', 'COOP', 'MUTUELLE', 'ASSOCIATION', 'FONDATION'
+]
+# The whole run of suffixes at the end of the string (with optional spaces) in one pass;
+# longest alternatives first so e.g. SARLAU is not cut down to SARL
+_NORMALIZE_SUFFIX_RE = re.compile(
+    r'(?:\s*(?:' + '|'.join(re.escape(suffix) for suffix in sorted(_NORMALIZE_SUFFIXES, key=len, reverse=True)) + r'))+\s*$',
+    re.IGNORECASE
+)
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+@lru_cache(maxsize=4096)
 def _normalize_company_name(company_name: str) -> str:
     """
     Normalize company name for comparison by removing common suffixes and formatting.
@@ -996,60 +1431,10 @@ def _normalize_company_name(company_name: str) -> str:
     normalized = company_name.strip().upper()
     
     # Remove common legal suffixes including Moroccan company types
-    suffixes_to_remove = [
-        'S.A.', 'SA', 'SARL', 'SARLAU', 'SAS', 'SASU', 'EURL', 'SNC', 'SCA', 'SCS',
-        'SOCIETE ANONYME', 'SOCIETE A RESPONSABILITE LIMITEE',
-        'SOCIETE EN NOM COLLECTIF', 'SOCIETE EN COMMANDITE SIMPLE',
-        'SOCIETE EN COMMANDITE PAR ACTIONS',
-        # Moroccan specific company types
-        'SARLAU', 'SARL', 'SA', 'S.A', 'S.A.', 'SOCIETE ANONYME',
-        'SOCIETE A RESPONSABILITE LIMITEE', 'SOCIETE A RESPONSABILITE LIMITEE UNIPERSONNELLE',
-        'SOCIETE EN NOM COLLECTIF', 'SOCIETE EN COMMANDITE SIMPLE',
-        'SOCIETE EN COMMANDITE PAR ACTIONS', 'SOCIETE CIVILE',
-        'SOCIETE CIVILE IMMOBILIERE', 'SOCIETE CIVILE PROFESSIONNELLE',
-        'GROUPEMENT D INTERET ECONOMIQUE', 'GIE',
-        'ETABLISSEMENT PUBLIC', 'EP', 'ETABLISSEMENT PUBLIC A CARACTERE INDUSTRIEL ET COMMERCIAL',
-        'EPIC', 'ETABLISSEMENT PUBLIC A CARACTERE ADMINISTRATIF', 'EPA',
-        'COOPERATIVE', 'COOP', 'MUTUELLE', 'ASSOCIATION', 'FONDATION'
-    ]
-    
-    for suffix in suffixes_to_remove:
-        # Remove suffix at the end of the string (with optional spaces)
-        pattern = r'\s*' + re.escape(suffix) + r'\s*$'
-        normalized = re.sub(pattern, '', normalized, flags=re.IGNORECASE)
+    normalized = _NORMALIZE_SUFFIX_RE.sub('', normalized, count=1)
     
     # Remove common punctuation and extra spaces
-    normalized = re.sub(r'[^\w\s]', ' ', normalized)
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    normalized = _PUNCTUATION_RE.sub(' ', normalized)
+    normalized = _WS_RE.sub(' ', normalized).strip()
     
     return normalized
-
-def _calculate_name_similarity(name1: str, name2: str) -> float:
-    """
-    Calculate similarity between two company names using simple character-based comparison.
-    
-    Args:
-        name1 (str): First company name
-        name2 (str): Second company name
-        
-    Returns:
-        float: Similarity score between 0.0 and 1.0
-    """
-    if not name1 or not name2:
-        return 0.0
-    
-    # Convert to sets of characters for comparison
-    chars1 = set(name1.lower())
-    chars2 = set(name2.lower())
-    
-    if not chars1 or not chars2:
-        return 0.0
-    
-    # Calculate Jaccard similarity
-    intersection = len(chars1.intersection(chars2))
-    union = len(chars1.union(chars2))
-    
-    if union == 0:
-        return 0.0
-    
-    return intersection / union
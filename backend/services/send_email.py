@@ -2,15 +2,26 @@ import logging
 import smtplib
 import ssl
 from email.message import EmailMessage
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
 import os
 
-def send_email(to_email: str, subject: str, body: str, attachment_data: bytes = None, attachment_filename: str = None) -> bool:
-    """Send an email using SMTP settings from environment variables.
+def _build_message(smtp_from: str, to_email: str, subject: str, body: str, attachment_data: bytes = None, attachment_filename: str = None) -> EmailMessage:
+    """Build the message for one recipient, with the PDF attached when provided."""
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = smtp_from
+    msg['To'] = to_email
+    msg.set_content(body)
+    if attachment_data and attachment_filename:
+        msg.add_attachment(attachment_data, maintype='application', subtype='pdf', filename=attachment_filename)
+    return msg
 
-    Returns True on success, False otherwise. Failures are logged but non-fatal.
+def send_emails(messages: list) -> list:
+    """Send several emails over a single SMTP connection (one TLS handshake and login).
+
+    Each message is a dict with the send_email keyword arguments: to_email, subject, body
+    and optionally attachment_data and attachment_filename.
+
+    Returns one bool per message, True when it was sent. Failures are logged but non-fatal.
     """
     smtp_host = os.environ.get('SMTP_HOST')
     smtp_port = os.environ.get('SMTP_PORT')
@@ -19,36 +30,19 @@ def send_email(to_email: str, subject: str, body: str, attachment_data: bytes =
     smtp_from = os.environ.get('SMTP_FROM', smtp_user or 'noreply@example.com')
     use_tls = os.environ.get('SMTP_USE_TLS', 'true').lower() in ('1', 'true', 'yes')
 
+    results = [False] * len(messages)
+    if not messages:
+        return results
+
     if not smtp_host or not smtp_port:
         print(f"❌ SMTP not configured: SMTP_HOST={smtp_host}, SMTP_PORT={smtp_port}", flush=True)
         logging.warning('SMTP not configured; skipping email send')
-        return False
+        return results
     
     # Debug: Print SMTP configuration (without password)
     print(f"🔧 SMTP Config: Host={smtp_host}, Port={smtp_port}, User={smtp_user}, TLS={use_tls}", flush=True)
 
     try:
-        # Use MIMEMultipart if we have an attachment, otherwise use simple EmailMessage
-        if attachment_data and attachment_filename:
-            msg = MIMEMultipart()
-            msg['Subject'] = subject
-            msg['From'] = smtp_from
-            msg['To'] = to_email
-            
-            # Add body text
-            msg.attach(MIMEText(body, 'plain'))
-            
-            # Add PDF attachment
-            pdf_attachment = MIMEApplication(attachment_data, _subtype='pdf')
-            pdf_attachment.add_header('Content-Disposition', 'attachment', filename=attachment_filename)
-            msg.attach(pdf_attachment)
-        else:
-            msg = EmailMessage()
-            msg['Subject'] = subject
-            msg['From'] = smtp_from
-            msg['To'] = to_email
-            msg.set_content(body)
-
         context = ssl.create_default_context()
         with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
             if use_tls:
@@ -56,15 +50,45 @@ def send_email(to_email: str, subject: str, body: str, attachment_data: bytes =
             if smtp_user and smtp_pass:
                 server.login(smtp_user, smtp_pass)
             
-            if attachment_data and attachment_filename:
-                server.send_message(msg)
-            else:
-                server.send_message(msg)
+            for i, message in enumerate(messages):
+                to_email = message.get('to_email')
+                attachment_data = message.get('attachment_data')
+                try:
+                    msg = _build_message(
+                        smtp_from,
+                        to_email,
+                        message.get('subject', ''),
+                        message.get('body', ''),
+                        attachment_data,
+                        message.get('attachment_filename')
+                    )
+                    server.send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # The connection is gone, the remaining messages cannot be sent either
+                    raise
+                except Exception as e:
+                    print(f"❌ Failed to send email to {to_email}: {str(e)}", flush=True)
+                    logging.error('Failed to send email to %s: %s', to_email, e)
+                    continue
                 
-        print(f"✅ Email sent successfully to {to_email}{' with attachment' if attachment_data else ''}", flush=True)
-        logging.info('Email sent to %s%s', to_email, ' with attachment' if attachment_data else '')
-        return True
+                results[i] = True
+                print(f"✅ Email sent successfully to {to_email}{' with attachment' if attachment_data else ''}", flush=True)
+                logging.info('Email sent to %s%s', to_email, ' with attachment' if attachment_data else '')
     except Exception as e:
-        print(f"❌ Failed to send email to {to_email}: {str(e)}", flush=True)
-        logging.error('Failed to send email to %s: %s', to_email, e)
-        return False
+        unsent = [message.get('to_email') for message, sent in zip(messages, results) if not sent]
+        print(f"❌ Failed to send email to {', '.join(map(str, unsent))}: {str(e)}", flush=True)
+        logging.error('Failed to send email to %s: %s', unsent, e)
+    return results
+
+def send_email(to_email: str, subject: str, body: str, attachment_data: bytes = None, attachment_filename: str = None) -> bool:
+    """Send an email using SMTP settings from environment variables.
+
+    Returns True on success, False otherwise. Failures are logged but non-fatal.
+    """
+    return send_emails([{
+        'to_email': to_email,
+        'subject': subject,
+        'body': body,
+        'attachment_data': attachment_data,
+        'attachment_filename': attachment_filename
+    }])[0]
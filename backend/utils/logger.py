@@ -5,158 +5,296 @@ Controls log verbosity and provides consistent logging across all services.
 
 import os
 import sys
-from datetime import datetime
+import atexit
+import time
+import json
+import threading
 from typing import Any, Optional
 
+_dumps = json.dumps
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+def _format_data(data: Any) -> str:
+    """Render a debug data payload: repr for scalars, indented JSON for containers"""
+    if type(data) in _SCALAR_TYPES:
+        return repr(data)
+    return _dumps(data, indent=2, ensure_ascii=False)
+
 class Logger:
     """Centralized logger with configurable verbosity levels"""
     
-    # Log levels
+    # Log levels. DEBUG and VERBOSE output (debug, verbose, web_exploring, news, database)
+    # is compiled out entirely under `python -O`, whatever LOG_LEVEL says
     CRITICAL = 0  # Only critical errors and important status updates
     ERROR = 1     # Errors and warnings
     INFO = 2      # Basic information
     DEBUG = 3     # Detailed debugging information
     VERBOSE = 4   # Very detailed debugging (current default behavior)
     
+    # How long a queued log line may wait before it reaches stdout, and how many
+    # lines are queued at most before they are written
+    FLUSH_INTERVAL_SECONDS = 0.05
+    BATCH_LINES = 64
+    
     def __init__(self):
         # Get log level from environment variable, default to CRITICAL for production
         self.log_level = int(os.environ.get('LOG_LEVEL', str(self.CRITICAL)))
-        self.enable_emojis = os.environ.get('LOG_EMOJIS', 'true').lower() in ('1', 'true', 'yes')
+        # Emojis by default only on a terminal; pipes, files and CI logs get plain text
+        emojis = os.environ.get('LOG_EMOJIS', 'auto').lower()
+        if emojis == 'auto':
+            try:
+                self.enable_emojis = sys.stdout.isatty()
+            except Exception:
+                self.enable_emojis = False
+        else:
+            self.enable_emojis = emojis in ('1', 'true', 'yes')
+        # Enabled levels, resolved once so each log call is a single attribute read
+        self._critical_on = self._should_log(self.CRITICAL)
+        self._error_on = self._should_log(self.ERROR)
+        self._info_on = self._should_log(self.INFO)
+        self._debug_on = self._should_log(self.DEBUG)
+        self._verbose_on = self._should_log(self.VERBOSE)
+        # Message prefixes by (level, emoji), see _format_message
+        self._prefixes = {}
+        # Last formatted (epoch second, timestamp) pairs: timestamps only change once a second
+        self._local_ts = (None, '')
+        self._utc_ts = (None, '')
+        # Lines are queued and written in batches: when BATCH_LINES are waiting, every
+        # FLUSH_INTERVAL_SECONDS, at exit, and immediately for critical, error and warning lines
+        self._buf = []
+        self._buf_lock = threading.Lock()
+        threading.Thread(target=self._flush_periodically, name='logger-flush', daemon=True).start()
+        atexit.register(self._drain)
         
+    def _emit(self, line: str, flush: bool = False):
+        """Queue one log line; it is written with the rest of its batch by _drain"""
+        with self._buf_lock:
+            self._buf.append(line + '\n')
+            full = len(self._buf) >= self.BATCH_LINES
+        if flush or full:
+            self._drain()
+    
+    def _drain(self):
+        """Write every queued line to stdout in a single write() and flush"""
+        with self._buf_lock:
+            if not self._buf:
+                return
+            lines, self._buf = self._buf, []
+            try:
+                stream = sys.stdout
+                raw = getattr(stream, 'buffer', None)
+                if raw is None:
+                    # Replaced stdout without a byte layer (captured output)
+                    stream.write(''.join(lines))
+                    stream.flush()
+                else:
+                    # Encode the whole batch once and bypass the text layer; flushing it first
+                    # keeps the order with text already printed elsewhere
+                    stream.flush()
+                    data = ''.join(lines).encode('utf-8', 'replace')
+                    try:
+                        fd = stream.fileno()
+                    except (AttributeError, OSError, ValueError):
+                        fd = None
+                    if fd is None:
+                        raw.write(data)
+                        raw.flush()
+                    else:
+                        # Straight to the file descriptor: no buffered writer, nothing left to flush
+                        view = memoryview(data)
+                        while view:
+                            view = view[os.write(fd, view):]
+            except Exception:
+                # stdout is closed or broken: send the batch to the interpreter's original
+                # stderr rather than lose it, and give up only if that fails as well
+                try:
+                    sys.__stderr__.write(''.join(lines))
+                    sys.__stderr__.flush()
+                except Exception:
+                    pass
+    
+    def _flush_periodically(self):
+        """Background flusher: drains the queued lines once per interval"""
+        while True:
+            time.sleep(self.FLUSH_INTERVAL_SECONDS)
+            self._drain()
+    
     def _should_log(self, level: int) -> bool:
         """Check if message should be logged based on current log level"""
         return level <= self.log_level
     
+    def _timestamp(self) -> str:
+        """Local 'YYYY-MM-DD HH:MM:SS' timestamp, formatted at most once per second"""
+        now = int(time.time())
+        second, timestamp = self._local_ts
+        if second != now:
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+            self._local_ts = (now, timestamp)
+        return timestamp
+    
+    def _utc_timestamp(self) -> str:
+        """UTC 'YYYY-MM-DD HH:MM:SS' timestamp, formatted at most once per second"""
+        now = int(time.time())
+        second, timestamp = self._utc_ts
+        if second != now:
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))
+            self._utc_ts = (now, timestamp)
+        return timestamp
+    
     def _format_message(self, level: str, message: str, emoji: str = "") -> str:
         """Format log message with timestamp and level"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        if self.enable_emojis and emoji:
-            return f"{timestamp} [{level}] {emoji} {message}"
-        else:
-            return f"{timestamp} [{level}] {message}"
+        prefix = self._prefixes.get((level, emoji))
+        if prefix is None:
+            # Built once per (level, emoji): "[LEVEL] emoji " or "[LEVEL] " without emojis
+            prefix = f"[{level}] {emoji} " if self.enable_emojis and emoji else f"[{level}] "
+            self._prefixes[(level, emoji)] = prefix
+        return f"{self._timestamp()} {prefix}{message}"
     
     def critical(self, message: str, emoji: str = "🚨"):
         """Log critical messages (always shown)"""
-        if self._should_log(self.CRITICAL):
-            print(self._format_message("CRITICAL", message, emoji), flush=True)
+        if self._critical_on:
+            self._emit(self._format_message("CRITICAL", message, emoji), flush=True)
     
     def error(self, message: str, emoji: str = "❌"):
         """Log error messages"""
-        if self._should_log(self.ERROR):
-            print(self._format_message("ERROR", message, emoji), flush=True)
+        if self._error_on:
+            self._emit(self._format_message("ERROR", message, emoji), flush=True)
     
     def warning(self, message: str, emoji: str = "⚠️"):
         """Log warning messages"""
-        if self._should_log(self.ERROR):
-            print(self._format_message("WARNING", message, emoji), flush=True)
+        if self._error_on:
+            self._emit(self._format_message("WARNING", message, emoji), flush=True)
     
     def info(self, message: str, emoji: str = "ℹ️"):
         """Log informational messages"""
-        if self._should_log(self.INFO):
-            print(self._format_message("INFO", message, emoji), flush=True)
+        if self._info_on:
+            self._emit(self._format_message("INFO", message, emoji))
     
     def success(self, message: str, emoji: str = "✅"):
         """Log success messages"""
-        if self._should_log(self.INFO):
-            print(self._format_message("SUCCESS", message, emoji), flush=True)
+        if self._info_on:
+            self._emit(self._format_message("SUCCESS", message, emoji))
     
     def debug(self, message: str, data: Any = None, emoji: str = "🔍"):
         """Log debug messages with optional data"""
-        if self._should_log(self.DEBUG):
-            print(self._format_message("DEBUG", message, emoji), flush=True)
+        if __debug__ and self._debug_on:
+            self._emit(self._format_message("DEBUG", message, emoji))
             if data is not None:
-                import json
-                print(f"  Data: {json.dumps(data, indent=2, ensure_ascii=False)}", flush=True)
+                self._emit(f"  Data: {_format_data(data)}")
+    
+    def debug_lazy(self, message_fn, data_fn=None, emoji: str = "🔍"):
+        """Like debug, but takes callables that build the message and data only when DEBUG is on"""
+        if __debug__ and self._debug_on:
+            self.debug(message_fn() if callable(message_fn) else message_fn,
+                       data_fn() if callable(data_fn) else data_fn, emoji)
     
     def verbose(self, message: str, data: Any = None, emoji: str = "🔍"):
         """Log very detailed debug messages (current default behavior)"""
-        if self._should_log(self.VERBOSE):
-            print(self._format_message("VERBOSE", message, emoji), flush=True)
+        if __debug__ and self._verbose_on:
+            self._emit(self._format_message("VERBOSE", message, emoji))
             if data is not None:
-                import json
-                print(f"  Data: {json.dumps(data, indent=2, ensure_ascii=False)}", flush=True)
+                self._emit(f"  Data: {_format_data(data)}")
     
     def processing(self, profile_id: str, message: str, emoji: str = "📄"):
         """Log processing messages for specific profiles"""
-        if self._should_log(self.INFO):
-            timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        if self._info_on:
+            timestamp = self._utc_timestamp()
             if self.enable_emojis and emoji:
-                print(f"[PROCESSING {profile_id}] {timestamp}: {emoji} {message}", flush=True)
+                self._emit(f"[PROCESSING {profile_id}] {timestamp}: {emoji} {message}")
             else:
-                print(f"[PROCESSING {profile_id}] {timestamp}: {message}", flush=True)
+                self._emit(f"[PROCESSING {profile_id}] {timestamp}: {message}")
     
     def web_exploring(self, message: str, data: Any = None, emoji: str = "🌐"):
         """Log web exploring messages"""
-        if self._should_log(self.DEBUG):
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            if self.enable_emojis and emoji:
-                print(f"{timestamp} [WEB_EXPLORING] {emoji} {message}", flush=True)
-            else:
-                print(f"{timestamp} [WEB_EXPLORING] {message}", flush=True)
+        if __debug__ and self._debug_on:
+            self._emit(self._format_message("WEB_EXPLORING", message, emoji))
             if data is not None:
-                import json
-                print(f"  Data: {json.dumps(data, indent=2, ensure_ascii=False)}", flush=True)
+                self._emit(f"  Data: {_format_data(data)}")
     
     def news(self, message: str, emoji: str = "📰"):
         """Log news retrieval messages"""
-        if self._should_log(self.DEBUG):
+        if __debug__ and self._debug_on:
             if self.enable_emojis and emoji:
-                print(f"{emoji} {message}", flush=True)
+                self._emit(f"{emoji} {message}")
             else:
-                print(f"NEWS: {message}", flush=True)
+                self._emit(f"NEWS: {message}")
     
     def database(self, message: str, emoji: str = "💾"):
         """Log database operations"""
-        if self._should_log(self.DEBUG):
+        if __debug__ and self._debug_on:
             if self.enable_emojis and emoji:
-                print(f"{emoji} {message}", flush=True)
+                self._emit(f"{emoji} {message}")
             else:
-                print(f"DB: {message}", flush=True)
+                self._emit(f"DB: {message}")
     
     def cleanup(self, message: str, emoji: str = "🗑️"):
         """Log cleanup operations"""
-        if self._should_log(self.INFO):
+        if self._info_on:
             if self.enable_emojis and emoji:
-                print(f"{emoji} {message}", flush=True)
+                self._emit(f"{emoji} {message}")
             else:
-                print(f"CLEANUP: {message}", flush=True)
+                self._emit(f"CLEANUP: {message}")
 
 # Global logger instance
 logger = Logger()
 
+# Let call sites skip building expensive messages: `if debug_enabled: log_debug(...)`.
+# The convenience functions below test these module globals too, one lookup per call
+critical_enabled = logger._critical_on
+error_enabled = logger._error_on
+info_enabled = logger._info_on
+debug_enabled = logger._debug_on
+verbose_enabled = logger._verbose_on
+
 # Convenience functions for backward compatibility
 def log_critical(message: str, emoji: str = "🚨"):
-    logger.critical(message, emoji)
+    if critical_enabled:
+        logger.critical(message, emoji)
 
 def log_error(message: str, emoji: str = "❌"):
-    logger.error(message, emoji)
+    if error_enabled:
+        logger.error(message, emoji)
 
 def log_warning(message: str, emoji: str = "⚠️"):
-    logger.warning(message, emoji)
+    if error_enabled:
+        logger.warning(message, emoji)
 
 def log_info(message: str, emoji: str = "ℹ️"):
-    logger.info(message, emoji)
+    if info_enabled:
+        logger.info(message, emoji)
 
 def log_success(message: str, emoji: str = "✅"):
-    logger.success(message, emoji)
+    if info_enabled:
+        logger.success(message, emoji)
 
 def log_debug(message: str, data: Any = None, emoji: str = "🔍"):
-    logger.debug(message, data, emoji)
+    if __debug__ and debug_enabled:
+        logger.debug(message, data, emoji)
+
+def log_debug_lazy(message_fn, data_fn=None, emoji: str = "🔍"):
+    if __debug__ and debug_enabled:
+        logger.debug_lazy(message_fn, data_fn, emoji)
 
 def log_verbose(message: str, data: Any = None, emoji: str = "🔍"):
-    logger.verbose(message, data, emoji)
+    if __debug__ and verbose_enabled:
+        logger.verbose(message, data, emoji)
 
 def log_processing(profile_id: str, message: str, emoji: str = "📄"):
-    logger.processing(profile_id, message, emoji)
+    if info_enabled:
+        logger.processing(profile_id, message, emoji)
 
 def log_web_exploring(message: str, data: Any = None, emoji: str = "🌐"):
-    logger.web_exploring(message, data, emoji)
+    if __debug__ and debug_enabled:
+        logger.web_exploring(message, data, emoji)
 
 def log_news(message: str, emoji: str = "📰"):
-    logger.news(message, emoji)
+    if __debug__ and debug_enabled:
+        logger.news(message, emoji)
 
 def log_database(message: str, emoji: str = "💾"):
-    logger.database(message, emoji)
+    if __debug__ and debug_enabled:
+        logger.database(message, emoji)
 
 def log_cleanup(message: str, emoji: str = "🗑️"):
-    logger.cleanup(message, emoji)
+    if info_enabled:
+        logger.cleanup(message, emoji)
@@ -1,23 +1,31 @@
 #!/usr/bin/env python3
 """
 Script to generate password hashes for the application.
-Usage: python generate_password.py <password>
+Usage: python generate_password.py <password> [<password> ...]
+       (with no arguments, one password per line is read from stdin)
 """
 
 import sys
-from werkzeug.security import generate_password_hash
 
 
+def main():
+    passwords = sys.argv[1:]
+    if not passwords and not sys.stdin.isatty():
+        passwords = [line.rstrip('\n') for line in sys.stdin if line.strip()]
+    if not passwords:
+        print(__doc__.strip())
+        sys.exit(1)
     
-hash_value = generate_password_hash("Admin123")
-print(f"Hash: {hash_value}")
-print(f"\nFor SQL insertion:")
-print(f"'{hash_value}'")
-
-
-# hash_value = generate_password_hash("Salma123.")
-# print(f"Hash: {hash_value}")
-# print(f"\nFor SQL insertion:")
-# print(f"'{hash_value}'")
+    # Imported only once there is something to hash
+    from werkzeug.security import generate_password_hash
+    
+    for password in passwords:
+        # scrypt runs in OpenSSL through hashlib.scrypt and check_password_hash verifies it
+        hash_value = generate_password_hash(password, method="scrypt")
+        print(f"Hash: {hash_value}")
+        print("\nFor SQL insertion:")
+        print(f"'{hash_value}'")
 
 
+if __name__ == "__main__":
+    main()